@@ -0,0 +1,81 @@
+"""
+Load test of /predict with and without the micro-batching dispatcher
+
+Bursts of concurrent calls go through the endpoint function in-process
+(no HTTP, no MLflow), and the throughput and latency percentiles are
+reported for each configuration.
+
+    python -m benchmarks.bench_batching --concurrency 200 --bursts 20
+"""
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from typing import Dict, Optional
+
+import src.main as main
+from src.elo import add_elo_ratings
+from src.batching import PredictionBatcher
+from src.model import create_pipeline, preprocess_data, predict_batch, train_model
+from benchmarks.synthetic import generate_matches
+
+def _fit_pipeline(size: int = 2000, seed: int = 0):
+    matches = add_elo_ratings(generate_matches(size, players=300, seed=seed))
+    X_train, _, y_train, _ = preprocess_data(matches)
+    return train_model(create_pipeline(), X_train, y_train)
+
+async def _burst(concurrency: int, rng: np.random.Generator):
+    async def call():
+        params = main.ModelInput(rank_player_1=int(rng.integers(1, 300)), rank_player_2=int(rng.integers(1, 300)))
+        start = time.perf_counter()
+        await main.make_prediction(params)
+        return time.perf_counter() - start
+
+    return await asyncio.gather(*[call() for _ in range(concurrency)])
+
+def run(concurrency: int, bursts: int, batcher: Optional[PredictionBatcher]) -> Dict[str, float]:
+    """
+    Send bursts of concurrent predictions, return the throughput and latencies
+    """
+    main.prediction_batcher = batcher
+    rng = np.random.default_rng(0)
+    latencies = []
+
+    start = time.perf_counter()
+    for _ in range(bursts):
+        latencies.extend(asyncio.run(_burst(concurrency, rng)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "predictions": len(latencies),
+        "throughput_per_second": len(latencies) / elapsed,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "batches": batcher.stats["batches"] if batcher else len(latencies),
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=200, help='Concurrent calls per burst')
+    parser.add_argument('--bursts', type=int, default=20, help='Number of bursts')
+    parser.add_argument('--window-ms', type=float, default=2, help='Batching window')
+    parser.add_argument('--max-size', type=int, default=64, help='Maximum batch size')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    pipeline = _fit_pipeline()
+    main._get_pipeline = lambda model, version: pipeline
+
+    results = {
+        "unbatched": run(args.concurrency, args.bursts, None),
+        "batched": run(args.concurrency, args.bursts, PredictionBatcher(predict_batch, args.window_ms / 1000, args.max_size)),
+    }
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the Elo ratings: full recompute over a match history, then incremental updates
+
+A synthetic history of matches between a pool of players is rated from scratch
+in one chronological pass, then the state is saved, loaded back and updated
+with the matches of the last days only, as after an ingestion.
+
+    python -m benchmarks.bench_elo --matches 1000000 --players 5000
+"""
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+from src.elo import EloRatings
+
+def _history(matches: int, players: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    names = np.array([f'Player {i}' for i in range(players)], dtype=object)
+    return pd.DataFrame({
+        'date': pd.Timestamp('1990-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 365 * 35, matches)), unit='D'),
+        'winner': names[rng.integers(0, players, matches)],
+        'loser': names[rng.integers(0, players, matches)],
+        'surface': rng.choice(np.array(['Hard', 'Clay', 'Grass', 'Carpet'], dtype=object), matches, p=[0.55, 0.3, 0.12, 0.03]),
+    })
+
+def run(matches: int, players: int, new_days: int) -> Dict[str, float]:
+    history = _history(matches, players)
+    cutoff = history['date'].max() - pd.Timedelta(days=new_days)
+    old, new = history[history['date'] <= cutoff], history[history['date'] > cutoff]
+
+    start = time.perf_counter()
+    EloRatings().update(history)
+    full_seconds = time.perf_counter() - start
+
+    elo = EloRatings()
+    elo.update(old)
+    with tempfile.TemporaryDirectory() as directory:
+        path = f'{directory}/elo.json'
+        start = time.perf_counter()
+        elo.save(path)
+        save_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        elo = EloRatings.load(path)
+        load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    elo.update(new)
+    incremental_seconds = time.perf_counter() - start
+
+    return {
+        "matches": len(history),
+        "players": players,
+        "full_seconds": full_seconds,
+        "full_matches_per_second": len(history) / full_seconds,
+        "new_matches": len(new),
+        "incremental_seconds": incremental_seconds,
+        "state_save_seconds": save_seconds,
+        "state_load_seconds": load_seconds,
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--matches', type=int, default=1_000_000, help='Matches of the history')
+    parser.add_argument('--players', type=int, default=5000, help='Players of the pool')
+    parser.add_argument('--new-days', type=int, default=7, help='Days of new matches of the incremental update')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    output = json.dumps(run(args.matches, args.players, args.new_days), indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+if __name__ == '__main__':
+    main_cli()
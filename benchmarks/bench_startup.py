@@ -0,0 +1,80 @@
+"""
+Startup benchmark: import time of the API and time to its first prediction
+
+Each run is a fresh Python process which imports `src.main`, then loads a
+locally trained model and makes a prediction, as the first /predict call
+of a new container would.
+
+    python -m benchmarks.bench_startup --runs 5 --max-import-seconds 2
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List
+
+import joblib
+
+from benchmarks.bench_batching import _fit_pipeline
+
+_SNIPPET = '''
+import sys, json, time
+start = time.perf_counter()
+import src.main as main
+imported = time.perf_counter()
+from src.model_cache import LocalModelFile
+pipeline = LocalModelFile(sys.argv[1], main.local_model.loader).get()
+main.predict(pipeline, series='Grand Slam', surface='Clay', court='Outdoor', round_stage='1st Round',
+             rank_player_1=1, rank_player_2=100, points_player_1=4000, points_player_2=500)
+predicted = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "first_prediction_seconds": predicted - start,
+    "modules": len(sys.modules),
+}))
+'''
+
+def run(runs: int) -> Dict[str, float]:
+    """
+    Measure the startup in `runs` fresh processes, return the medians
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.pkl')
+        joblib.dump(_fit_pipeline(), model_path)
+
+        results: List[Dict] = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-c', _SNIPPET, model_path],
+                check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    return {
+        "runs": runs,
+        "import_seconds": statistics.median(r["import_seconds"] for r in results),
+        "first_prediction_seconds": statistics.median(r["first_prediction_seconds"] for r in results),
+        "modules_loaded": results[-1]["modules"],
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Number of fresh processes')
+    parser.add_argument('--max-import-seconds', type=float, help='Fail if the median import time is above')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+    if args.max_import_seconds is not None and results["import_seconds"] > args.max_import_seconds:
+        sys.exit(f"Import time regression: {results['import_seconds']:.2f}s > {args.max_import_seconds}s")
+
+if __name__ == '__main__':
+    main_cli()
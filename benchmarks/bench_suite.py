@@ -0,0 +1,286 @@
+"""
+Benchmark suite of the hot paths, on synthetic matches (see `benchmarks.synthetic`)
+
+Everything runs in-process: Postgres is replaced by the generated matches and
+MLflow by a pipeline fitted here, so that the numbers only depend on the code
+and the machine. The results are written as JSON along with the commit they
+were measured on, to be compared with those of another commit:
+
+    python -m benchmarks.bench_suite --output before.json
+    git checkout my-branch
+    python -m benchmarks.bench_suite --output after.json --baseline before.json
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from unittest import mock
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+import src.main as main
+import src.model as model
+from src.elo import add_elo_ratings
+from src.sql import MATCH_COLUMNS, CATEGORY_COLUMNS
+from benchmarks.synthetic import generate_matches
+
+def _timed(func: Callable[[], Any], repeat: int = 1) -> Dict[str, float]:
+    """
+    Best and median wall time of `repeat` calls
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+
+    return {"seconds": min(seconds), "median_seconds": float(np.median(seconds))}
+
+def _latencies(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    return {
+        "calls": len(latencies),
+        "throughput_per_second": len(latencies) / elapsed,
+        "latency_p50_us": float(np.percentile(latencies, 50) * 1e6),
+        "latency_p99_us": float(np.percentile(latencies, 99) * 1e6),
+    }
+
+def _random_match(rng: np.random.Generator) -> Dict[str, Any]:
+    rank_1, rank_2 = rng.integers(1, 500, 2)
+    return dict(
+        series='ATP250', surface='Hard', court='Outdoor', round_stage='1st Round',
+        rank_player_1=int(rank_1), rank_player_2=int(rank_2),
+        points_player_1=int(12000 / rank_1 ** 0.85), points_player_2=int(12000 / rank_2 ** 0.85),
+        elo_player_1=float(rng.normal(1600, 150)), elo_player_2=float(rng.normal(1600, 150)),
+        surface_elo_player_1=float(rng.normal(1600, 150)), surface_elo_player_2=float(rng.normal(1600, 150)))
+
+# ------------------------------------------------------------------------------
+# Stubs of Postgres and MLflow
+
+def _select(matches: pd.DataFrame, from_date: str = None, to_date: str = None, columns: Optional[List[str]] = MATCH_COLUMNS):
+    """
+    Same selection as the queries of `load_matches_from_postgres`, on the generated matches
+    """
+    selected = matches
+    if from_date:
+        selected = selected[selected['date'] >= pd.Timestamp(from_date)]
+    if to_date:
+        selected = selected[selected['date'] <= pd.Timestamp(to_date)]
+    selected = selected[list(columns or matches.columns)].reset_index(drop=True)
+
+    return selected.astype({c: 'category' for c in CATEGORY_COLUMNS if c in selected.columns})
+
+@contextmanager
+def _stub_postgres(matches: pd.DataFrame):
+    def load(table_name, from_date=None, to_date=None, columns=MATCH_COLUMNS, use_cache=None):
+        return _select(matches, from_date, to_date, columns)
+
+    def iterate(table_name, from_date=None, to_date=None, columns=MATCH_COLUMNS, chunk_size=50_000) -> Iterator[pd.DataFrame]:
+        selected = _select(matches, from_date, to_date, columns)
+        for start in range(0, len(selected), chunk_size):
+            yield selected.iloc[start:start + chunk_size].reset_index(drop=True)
+
+    with mock.patch('src.model.load_matches_from_postgres', load), \
+            mock.patch('src.model.iter_matches_from_postgres', iterate), \
+            mock.patch('src.elo.load_matches_from_postgres', load), \
+            mock.patch('src.model.training_cache', None):
+        yield
+
+@contextmanager
+def _stub_mlflow(pipeline):
+    """
+    Serve the pipeline as any registered model, through the model cache
+    """
+    cache = main.model_cache
+    loader, resolver = cache.loader, cache.resolver
+    cache.loader, cache.resolver = (lambda name, version: pipeline), (lambda name: '1')
+    cache.clear()
+    try:
+        yield
+    finally:
+        cache.loader, cache.resolver = loader, resolver
+        cache.clear()
+
+# ------------------------------------------------------------------------------
+# In-process HTTP calls, straight to the ASGI application
+
+async def _asgi_get(path: str, query: Dict[str, Any]) -> int:
+    """
+    Call a GET endpoint of the API as a local client, return the status code
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': urlencode(query).encode(),
+        'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 12345), 'server': ('localhost', 80),
+    }
+    status = None
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await main.app(scope, receive, send)
+    return status
+
+def _bench_endpoint(calls: int, concurrency: int) -> Dict[str, float]:
+    rng = np.random.default_rng(0)
+    queries = []
+    for _ in range(calls):
+        match = _random_match(rng)
+        match['round'] = match.pop('round_stage')
+        queries.append({**match, 'model': 'Benchmark', 'version': '1'})
+
+    async def call(query):
+        start = time.perf_counter()
+        status = await _asgi_get('/predict', query)
+        if status != 200:
+            raise RuntimeError(f'/predict answered {status}')
+        return time.perf_counter() - start
+
+    async def run():
+        latencies = []
+        for start in range(0, calls, concurrency):
+            latencies.extend(await asyncio.gather(*[call(q) for q in queries[start:start + concurrency]]))
+        return latencies
+
+    asyncio.run(run())  # Warm-up: model cache, compiled scorer
+    start = time.perf_counter()
+    latencies = asyncio.run(run())
+    return _latencies(latencies, time.perf_counter() - start)
+
+# ------------------------------------------------------------------------------
+
+def run(matches: int, fit_matches: int, calls: int, concurrency: int, repeat: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Time each hot path, return the results by benchmark
+    """
+    results = {}
+
+    start = time.perf_counter()
+    raw = generate_matches(matches, seed=seed)
+    results["generate_matches"] = {"matches": matches, "seconds": time.perf_counter() - start}
+
+    features = _select(raw)
+    results["add_elo_ratings"] = {"matches": matches, **_timed(lambda: add_elo_ratings(features), repeat)}
+    rated = add_elo_ratings(features)
+    results["create_pairwise_data"] = {"matches": matches, **_timed(lambda: model.create_pairwise_data(rated), repeat)}
+    with mock.patch('src.model.training_cache', None):
+        results["preprocess_data"] = {"matches": matches, **_timed(lambda: model.preprocess_data(rated), repeat)}
+
+    to_date = str(raw['date'].max().date())
+    from_date = str(raw['date'].quantile(0.5).date())
+    with _stub_postgres(raw):
+        for label, chunk_size in (("whole", 0), ("chunked", 50_000)):
+            results[f"load_pairwise_data_{label}"] = {
+                "matches": int((raw['date'] >= pd.Timestamp(from_date)).sum()),
+                **_timed(lambda: model.load_pairwise_data('atp', from_date, to_date, chunk_size=chunk_size), repeat),
+            }
+
+    X_train, _, y_train, _ = model.preprocess_data(rated.tail(fit_matches))
+    start = time.perf_counter()
+    pipeline = model.train_model(model.create_pipeline(), X_train, y_train)
+    results["fit_pipeline"] = {"matches": min(fit_matches, matches), "seconds": time.perf_counter() - start}
+
+    rng = np.random.default_rng(seed)
+    match_list = [_random_match(rng) for _ in range(calls)]
+    for label, scorer in (("compiled", model.get_scorer), ("sklearn", lambda pipeline: None)):
+        with mock.patch('src.model.get_scorer', scorer):
+            model.predict(pipeline, **match_list[0])
+            latencies = []
+            start = time.perf_counter()
+            for match in match_list:
+                call_start = time.perf_counter()
+                model.predict(pipeline, **match)
+                latencies.append(time.perf_counter() - call_start)
+            results[f"predict_{label}"] = _latencies(latencies, time.perf_counter() - start)
+
+    batch = [{**m, 'round': m['round_stage']} for m in match_list]
+    timing = _timed(lambda: model.predict_batch(pipeline, batch), repeat)
+    results["predict_batch"] = {"matches": calls, **timing, "throughput_per_second": calls / timing["seconds"]}
+
+    with _stub_mlflow(pipeline), mock.patch.object(main, 'prediction_batcher', None), \
+            mock.patch.object(main, 'shadow_evaluator', None):
+        results["endpoint_predict_sequential"] = _bench_endpoint(calls, 1)
+        results["endpoint_predict_concurrent"] = {"concurrency": concurrency, **_bench_endpoint(calls, concurrency)}
+
+    return results
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _versions() -> Dict[str, str]:
+    import sklearn
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__, "sklearn": sklearn.__version__}
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Ratio of each time (or throughput) to the baseline, above 1 when slower
+    """
+    ratios = {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if "throughput_per_second" in result and before.get("throughput_per_second"):
+            ratios[name] = before["throughput_per_second"] / result["throughput_per_second"]
+        elif "seconds" in result and before.get("seconds"):
+            ratios[name] = result["seconds"] / before["seconds"]
+
+    return ratios
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--matches', type=int, default=500_000, help='Number of synthetic matches')
+    parser.add_argument('--fit-matches', type=int, default=100_000, help='Number of (most recent) matches the pipeline is fitted on')
+    parser.add_argument('--calls', type=int, default=2000, help='Number of predictions of the latency and throughput benchmarks')
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent calls of the endpoint benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each data preparation benchmark, the best one being kept')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic matches')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "platform": platform.platform(),
+            "versions": _versions(),
+            "params": {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+        },
+        "results": run(args.matches, args.fit_matches, args.calls, args.concurrency, args.repeat, args.seed),
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("params") != report["meta"]["params"]:
+            print(f"The baseline was run with other parameters: {baseline['meta'].get('params')}", file=sys.stderr)
+        report["ratios_to_baseline"] = {"baseline_commit": baseline["meta"].get("commit"), **compare(report["results"], baseline["results"])}
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+    if args.baseline:
+        slower = {name: ratio for name, ratio in report["ratios_to_baseline"].items() if isinstance(ratio, float) and ratio > 1.1}
+        if slower:
+            print(f"Slower than the baseline (>10%): {slower}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,150 @@
+"""
+Seeded generator of synthetic matches shaped like the `atp_data` table
+
+The players have a hidden level: their ranks and points derive from it, and the
+better player wins more often, so that the models have a signal to learn. All the
+columns are drawn at once with NumPy, millions of matches taking a few seconds.
+
+    python -m benchmarks.synthetic --matches 1000000 --output matches.parquet
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+from src.ingest import TABLE_COLUMNS
+
+SERIES = (['ATP250', 'ATP500', 'Masters 1000', 'Grand Slam', 'Masters Cup'], [0.55, 0.2, 0.15, 0.09, 0.01])
+SURFACES = (['Hard', 'Clay', 'Grass', 'Carpet'], [0.55, 0.3, 0.12, 0.03])
+COURTS = (['Outdoor', 'Indoor'], [0.85, 0.15])
+ROUNDS = (['1st Round', '2nd Round', '3rd Round', '4th Round', 'Quarterfinals', 'Semifinals', 'The Final', 'Round Robin'],
+          [0.45, 0.24, 0.08, 0.04, 0.1, 0.05, 0.025, 0.015])
+
+def _choice(rng: np.random.Generator, values_and_weights, size: int) -> np.ndarray:
+    values, weights = values_and_weights
+    weights = np.asarray(weights) / np.sum(weights)
+    return np.array(values, dtype=object)[rng.choice(len(values), size, p=weights)]
+
+def _set_scores(rng: np.random.Generator, best_of: np.ndarray):
+    """
+    Draw the number of sets won by each player, and the games of each set (NaN for the sets not played)
+    """
+    size = len(best_of)
+    w_sets = best_of // 2 + 1
+    l_sets = (rng.random(size) * w_sets).astype(np.int64)
+    played = w_sets + l_sets
+
+    # The winner wins the last set, the sets won by the loser are among the others
+    keys = rng.random((size, 5))
+    keys[np.arange(5)[None, :] >= (played - 1)[:, None]] = np.inf
+    loser_won = np.argsort(np.argsort(keys, axis=1), axis=1) < l_sets[:, None]
+
+    tie_break = rng.random((size, 5)) < 0.2
+    winning_games = np.where(tie_break, 7, 6)
+    losing_games = np.where(tie_break, rng.integers(5, 7, (size, 5)), rng.integers(0, 5, (size, 5)))
+    w_games = np.where(loser_won, losing_games, winning_games).astype(np.float64)
+    l_games = np.where(loser_won, winning_games, losing_games).astype(np.float64)
+
+    not_played = np.arange(5)[None, :] >= played[:, None]
+    w_games[not_played] = np.nan
+    l_games[not_played] = np.nan
+
+    return w_sets, l_sets, w_games, l_games
+
+def generate_matches(
+        matches: int,
+        players: int = 2000,
+        seed: int = 0,
+        from_date: str = '2000-01-01',
+        to_date: str = '2024-12-31',
+        missing_rate: float = 0.005) -> pd.DataFrame:
+    """
+    Generate synthetic matches with the columns of the match tables
+
+    Args:
+        matches (int): Number of matches
+        players (int): Number of players
+        seed (int): Seed of the random draws, the same seed giving the same matches
+        from_date (str): Date (YYYY-MM-DD) of the first tournament
+        to_date (str): Date (YYYY-MM-DD) of the last tournament
+        missing_rate (float): Share of the losers without rank nor points (e.g. unranked qualifiers)
+
+    Returns:
+        pd.DataFrame: The matches, in chronological order, with the columns of the tables (`TABLE_COLUMNS`)
+    """
+    rng = np.random.default_rng(seed)
+
+    # The best players have the best ranks
+    level = rng.normal(0, 1, players)
+    base_rank = np.empty(players, dtype=np.int64)
+    base_rank[np.argsort(-level)] = np.arange(1, players + 1)
+    names = np.array([f'Player{i} {chr(65 + i % 26)}.' for i in range(players)], dtype=object)
+
+    # About 30 matches per tournament, each one with its series, surface and court
+    tournaments = max(1, matches // 30)
+    start, end = pd.Timestamp(from_date), pd.Timestamp(to_date)
+    tournament_dates = start + pd.to_timedelta(np.sort(rng.integers(0, (end - start).days + 1, tournaments)), unit='D')
+    tournament_names = np.array([f'Tournament {i}' for i in range(500)], dtype=object)
+    tournament_ids = rng.integers(0, len(tournament_names), tournaments)
+    tournament_series = _choice(rng, SERIES, tournaments)
+    of_match = np.sort(rng.integers(0, tournaments, matches))
+
+    series = tournament_series[of_match]
+    best_of = np.where(series == 'Grand Slam', 5, 3)
+
+    first = rng.integers(0, players, matches)
+    second = (first + rng.integers(1, players, matches)) % players
+    first_wins = rng.random(matches) < 1 / (1 + np.exp(-1.2 * (level[first] - level[second])))
+    winner, loser = np.where(first_wins, first, second), np.where(first_wins, second, first)
+
+    # The ranks and points move around the level of the players
+    w_rank = np.maximum(1, np.round(base_rank[winner] * rng.lognormal(0, 0.25, matches)))
+    l_rank = np.maximum(1, np.round(base_rank[loser] * rng.lognormal(0, 0.25, matches)))
+    w_points = np.round(12000 / w_rank ** 0.85)
+    l_points = np.round(12000 / l_rank ** 0.85)
+    missing = rng.random(matches) < missing_rate
+    l_rank[missing] = np.nan
+    l_points[missing] = np.nan
+
+    w_sets, l_sets, w_games, l_games = _set_scores(rng, best_of)
+
+    data = {
+        'tournament': tournament_names[tournament_ids][of_match],
+        'location': np.array([f'City {i}' for i in range(len(tournament_names))], dtype=object)[tournament_ids][of_match],
+        'date': tournament_dates[of_match] + pd.to_timedelta(rng.integers(0, 7, matches), unit='D'),
+        'series': series,
+        'court': _choice(rng, COURTS, tournaments)[of_match],
+        'surface': _choice(rng, SURFACES, tournaments)[of_match],
+        'round': _choice(rng, ROUNDS, matches),
+        'best_of': best_of,
+        'winner': names[winner],
+        'loser': names[loser],
+        'w_rank': w_rank,
+        'l_rank': l_rank,
+        'w_points': w_points,
+        'l_points': l_points,
+        **{f'w{i + 1}': w_games[:, i] for i in range(5)},
+        **{f'l{i + 1}': l_games[:, i] for i in range(5)},
+        'w_sets': w_sets,
+        'l_sets': l_sets,
+        'comment': np.where(rng.random(matches) < 0.01, 'Retired', 'Completed').astype(object),
+    }
+
+    df = pd.DataFrame({column: data[column] for column in TABLE_COLUMNS})
+    return df.sort_values('date', kind='stable', ignore_index=True)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--matches', type=int, default=100_000, help='Number of matches')
+    parser.add_argument('--players', type=int, default=2000, help='Number of players')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random draws')
+    parser.add_argument('--output', required=True, help='Write the matches to this file (.csv or .parquet)')
+    args = parser.parse_args()
+
+    df = generate_matches(args.matches, args.players, args.seed)
+    if args.output.endswith('.parquet'):
+        df.to_parquet(args.output, index=False)
+    else:
+        df.to_csv(args.output, index=False)
+
+if __name__ == '__main__':
+    main_cli()
@@ -1,4 +1,9 @@
 #!/bin/bash
 
 # Run the API
-uvicorn src.main:app --host 0.0.0.0 --port 7860
\ No newline at end of file
+if [ "$SERVING_MODE" = "gunicorn" ]; then
+    # Production mode: pre-forked workers sharing the preloaded models (see gunicorn.conf.py)
+    exec gunicorn -c gunicorn.conf.py src.main:app
+else
+    exec uvicorn src.main:app --host 0.0.0.0 --port 7860
+fi
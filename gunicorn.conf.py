@@ -0,0 +1,128 @@
+# Gunicorn configuration of the production serving mode (SERVING_MODE=gunicorn in entrypoint.sh)
+#
+# The application and the models listed in PRELOAD_MODELS are loaded once in the master,
+# before the workers are forked, so that the workers share their memory copy-on-write.
+# The master watches the MLflow registry and gracefully restarts the workers (SIGHUP)
+# once a new version of a preloaded model has been loaded, and no job is in flight.
+# The training jobs belong to a job server started by the master, shared by the workers:
+# any worker answers GET /jobs/{id}, and at most TRAINING_MAX_WORKERS jobs run at once.
+import gc
+import os
+import time
+import signal
+import tempfile
+import threading
+
+bind = f"0.0.0.0:{os.getenv('PORT', 7860)}"
+workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+# Models to load before forking, as "name:version" (version defaults to latest), comma-separated
+PRELOAD_MODELS = [spec.strip() for spec in os.getenv("PRELOAD_MODELS", "").split(",") if spec.strip()]
+# Seconds between two checks of the registry by the master, 0 to disable.
+# The workers keep polling the registry for the models they load themselves.
+POLL_INTERVAL = float(os.getenv("MODEL_CACHE_POLL_INTERVAL", 300))
+
+# Socket of the job server, set before the application is loaded so that the API submits the jobs to it
+os.environ.setdefault("JOB_SERVER_ADDRESS", os.path.join(tempfile.gettempdir(), f"tennis-api-jobs-{os.getpid()}.sock"))
+
+def _memory() -> dict:
+    """
+    Get the memory of the current process in MB: resident, and shared with other processes (copy-on-write)
+    """
+    memory = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Dirty"):
+                    memory[key.lower()] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        import resource
+        memory["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return memory
+
+def _preload_models(server):
+    """
+    Load the configured models (and compile their scorers) in the master
+    """
+    from src.model import model_cache
+    from src.scorer import get_scorer
+
+    for spec in PRELOAD_MODELS:
+        name, _, version = spec.partition(":")
+        start = time.perf_counter()
+        try:
+            get_scorer(model_cache.get(name, version or "latest"))
+        except Exception as e:
+            server.log.error(f"Could not preload model {spec}: {e}")
+            continue
+        server.log.info(f"Model {spec} preloaded in {time.perf_counter() - start:.2f}s")
+
+def _start_job_server(server):
+    """
+    Start the job server, before the workers connect to it
+    """
+    from src.jobs import start_job_server
+    from src.main import TRAINING_MAX_WORKERS
+
+    server.job_server = start_job_server(os.environ["JOB_SERVER_ADDRESS"], TRAINING_MAX_WORKERS)
+    server.log.info(f"Job server listening on {os.environ['JOB_SERVER_ADDRESS']}")
+
+def _watch_registry(server):
+    """
+    Check the registry periodically, restarting the workers once a new version has been swapped in.
+    The restart waits for the jobs in flight, whose follow-ups (e.g. after an ingestion) run in the workers.
+    """
+    from src.main import job_manager
+    from src.model import model_cache
+
+    def poll():
+        restart = False
+        while True:
+            time.sleep(POLL_INTERVAL)
+            swaps = model_cache.stats()["swaps"]
+            model_cache.refresh_latest()
+            restart = restart or model_cache.stats()["swaps"] > swaps
+            if not restart:
+                continue
+
+            active = job_manager.active
+            if active:
+                server.log.info(f"New model version promoted, restarting the workers once {active} job(s) are done")
+                continue
+
+            server.log.info("New model version promoted, restarting the workers")
+            restart = False
+            # Freeze the new objects too before the new workers are forked
+            gc.freeze()
+            os.kill(os.getpid(), signal.SIGHUP)
+
+    threading.Thread(target=poll, name="registry-watcher", daemon=True).start()
+
+def on_starting(server):
+    start = time.perf_counter()
+    _start_job_server(server)
+    _preload_models(server)
+
+    # Keep the preloaded objects out of the garbage collector, which would otherwise
+    # write to their pages in the workers and defeat copy-on-write
+    gc.freeze()
+
+    server.log.info(f"Master ready in {time.perf_counter() - start:.2f}s, memory (MB): {_memory()}")
+
+    if PRELOAD_MODELS and POLL_INTERVAL > 0:
+        _watch_registry(server)
+
+def on_exit(server):
+    server.job_server.shutdown()
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+def post_worker_init(worker):
+    startup = time.perf_counter() - getattr(worker, "forked_at", time.perf_counter())
+    worker.log.info(f"Worker {worker.pid} started in {startup:.3f}s, memory (MB): {_memory()}")
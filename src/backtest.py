@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Literal
+
+from src.enums import Feature
+from src.sql import load_matches_from_postgres
+from src.elo import add_elo_ratings, ratings_before
+from src.model import create_pairwise_data, create_pipeline, train_model, evaluate_model
+
+# Metrics of a window summarized over all the windows
+WINDOW_METRICS = ['accuracy', 'roc_auc', 'log_loss', 'brier_score', 'expected_calibration_error']
+
+def make_windows(
+        from_date: str,
+        to_date: str,
+        train_months: int = 24,
+        test_months: int = 3,
+        step_months: int = None,
+        mode: Literal['rolling', 'expanding'] = 'rolling') -> List[Dict[str, str]]:
+    """
+    Split a period into walk-forward windows: each one trains on past matches and tests on the following period
+
+    Args:
+        from_date (str): First date (YYYY-MM-DD) of the period
+        to_date (str): Last date (YYYY-MM-DD) of the period
+        train_months (int): Months of training data, of the first window in the expanding mode
+        test_months (int): Months of test data
+        step_months (int): Months between two windows, `test_months` if None
+        mode (str): 'rolling' trains on the last `train_months` only, 'expanding' on all the past from `from_date`
+
+    Returns:
+        List[Dict[str, str]]: The train_start, train_end, test_start and test_end dates (included) of each window
+    """
+    if mode not in ('rolling', 'expanding'):
+        raise ValueError(f"Unknown mode {mode}, expected 'rolling' or 'expanding'")
+
+    start, end = pd.Timestamp(from_date), pd.Timestamp(to_date)
+    step = pd.DateOffset(months=step_months or test_months)
+    day = pd.Timedelta(days=1)
+
+    windows = []
+    test_start = start + pd.DateOffset(months=train_months)
+    while test_start <= end:
+        train_start = start if mode == 'expanding' else test_start - pd.DateOffset(months=train_months)
+        test_end = min(test_start + pd.DateOffset(months=test_months) - day, end)
+        windows.append({
+            "train_start": train_start.strftime('%Y-%m-%d'),
+            "train_end": (test_start - day).strftime('%Y-%m-%d'),
+            "test_start": test_start.strftime('%Y-%m-%d'),
+            "test_end": test_end.strftime('%Y-%m-%d'),
+        })
+        test_start += step
+
+    return windows
+
+def _evaluate_window(window: Dict[str, str], train: pd.DataFrame, test: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Train a pipeline on the matches of a window and evaluate it on the following ones
+    """
+    result = {**window, "train_matches": len(train), "test_matches": len(test)}
+    if train.empty or test.empty:
+        return {**result, "error": "No match to train or test on"}
+
+    features = [f.name for f in Feature.get_all_features()]
+    df_train, df_test = create_pairwise_data(train), create_pairwise_data(test)
+
+    start = time.perf_counter()
+    pipeline = train_model(create_pipeline(), df_train[features], df_train['target'])
+    metrics = evaluate_model(pipeline, df_test[features], df_test['target'])
+    metrics["confusion_matrix"] = metrics["confusion_matrix"].tolist()
+
+    return {**result, **metrics, "fit_seconds": time.perf_counter() - start}
+
+def backtest(matches: pd.DataFrame, windows: List[Dict[str, str]], n_jobs: int = -1) -> List[Dict[str, Any]]:
+    """
+    Evaluate the windows in parallel processes, each one receiving only its slices of the matches
+
+    Args:
+        matches (pd.DataFrame): The matches of the whole period, with their date and Elo ratings (see `add_elo_ratings`)
+        windows (List[Dict[str, str]]): The windows (see `make_windows`)
+        n_jobs (int): Number of windows evaluated at once, -1 for all the cores
+
+    Returns:
+        List[Dict[str, Any]]: The window, the number of matches and the metrics (see `evaluate_model`) of each window
+    """
+    from joblib import Parallel, delayed
+
+    dates = pd.to_datetime(matches['date']).to_numpy()
+
+    def between(first: str, last: str) -> pd.DataFrame:
+        return matches[(dates >= np.datetime64(first)) & (dates <= np.datetime64(last))]
+
+    return Parallel(n_jobs=n_jobs)(
+        delayed(_evaluate_window)(
+            window,
+            between(window["train_start"], window["train_end"]),
+            between(window["test_start"], window["test_end"]))
+        for window in windows)
+
+def _summarize(results: List[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    Mean and standard deviation of the metrics over the evaluated windows
+    """
+    evaluated = [result for result in results if "error" not in result]
+    summary = {"windows": len(results), "evaluated_windows": len(evaluated)}
+    for metric in WINDOW_METRICS:
+        values = np.array([result[metric] for result in evaluated], dtype=np.float64)
+        summary[f"mean_{metric}"] = float(values.mean()) if len(values) else None
+        summary[f"std_{metric}"] = float(values.std()) if len(values) else None
+
+    return summary
+
+def run_backtest(
+        circuit: Literal['atp', 'wta'],
+        from_date: str,
+        to_date: str,
+        train_months: int = 24,
+        test_months: int = 3,
+        step_months: int = None,
+        mode: Literal['rolling', 'expanding'] = 'rolling',
+        n_jobs: int = -1,
+        experiment_name: str = 'Tennis Backtest') -> Dict[str, Any]:
+    """
+    Walk-forward backtest of the pipeline over a period: the matches are loaded once,
+    then each window is trained and evaluated in parallel (see `make_windows` and `backtest`)
+
+    The results are logged to MLflow if MLFLOW_SERVER_URI is set: the parameters, the summary,
+    the metrics of each window (one step per window) and the whole results as JSON.
+
+    Returns:
+        Dict[str, Any]: The parameters, the summary and the results of each window
+    """
+    windows = make_windows(from_date, to_date, train_months, test_months, step_months, mode)
+    if not windows:
+        raise ValueError(f"The period from {from_date} to {to_date} is shorter than the {train_months} months of training")
+
+    start = time.perf_counter()
+    matches = load_matches_from_postgres(f"{circuit}_data", windows[0]["train_start"], to_date)
+    # Ratings before each match, the matches of the past warming them up
+    matches = add_elo_ratings(matches, ratings_before(circuit, windows[0]["train_start"]))
+    load_seconds = time.perf_counter() - start
+
+    results = backtest(matches, windows, n_jobs=n_jobs)
+
+    output = {
+        "params": {
+            "circuit": circuit,
+            "from_date": from_date,
+            "to_date": to_date,
+            "train_months": train_months,
+            "test_months": test_months,
+            "step_months": step_months or test_months,
+            "mode": mode,
+        },
+        "summary": {**_summarize(results), "load_seconds": load_seconds, "total_seconds": time.perf_counter() - start},
+        "windows": results,
+    }
+    logging.info(f"Backtest of {len(windows)} windows done: {output['summary']}")
+
+    if os.getenv("MLFLOW_SERVER_URI"):
+        _log_backtest(output, experiment_name)
+
+    return output
+
+def _log_backtest(output: Dict[str, Any], experiment_name: str):
+    """
+    Log the results of a backtest to MLflow
+    """
+    import mlflow
+
+    mlflow.set_tracking_uri(os.environ["MLFLOW_SERVER_URI"])
+    mlflow.set_experiment(experiment_name)
+
+    with mlflow.start_run(run_name=f"backtest-{output['params']['mode']}"):
+        mlflow.log_params(output["params"])
+        mlflow.log_metrics({key: value for key, value in output["summary"].items() if value is not None})
+        for step, result in enumerate(output["windows"]):
+            if "error" not in result:
+                mlflow.log_metrics({f"window_{metric}": result[metric] for metric in WINDOW_METRICS}, step=step)
+        mlflow.log_dict(output, "backtest.json")
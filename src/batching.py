@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+class PredictionBatcher:
+    """
+    Coalesce concurrent single predictions into vectorized batches
+
+    Predictions are queued per key (typically the model and its version) and
+    scored together when the time window has elapsed since the first queued one,
+    or as soon as the batch reaches its maximum size.
+    """
+    def __init__(
+            self,
+            score: Callable[[Any, List[Dict[str, Any]]], List[Dict[str, Any]]],
+            window: float = 0.002,
+            max_size: int = 64,
+            executor: Optional[Executor] = None):
+        """
+        Args:
+            score (Callable): Score a batch of matches with a pipeline (see `predict_batch`)
+            window (float): Seconds to wait for other predictions before flushing a batch
+            max_size (int): Number of predictions flushing a batch immediately
+            executor (Executor): Where to score the batches, in the event loop if None
+        """
+        self.score = score
+        self.window = window
+        self.max_size = max_size
+        self.executor = executor
+
+        self._queues: Dict[Hashable, Tuple[Any, List[Tuple[Dict[str, Any], asyncio.Future]]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self.stats = {"batches": 0, "predictions": 0}
+
+    async def submit(self, key: Hashable, pipeline: Any, match: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a prediction and wait for its result
+
+        Args:
+            key (Hashable): The batch to join, predictions of a batch are scored with the same pipeline
+            pipeline (Any): The pipeline, used if this prediction opens a new batch
+            match (Dict[str, Any]): The keyword arguments of `predict`
+
+        Returns:
+            Dict[str, Any]: The prediction
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        if key not in self._queues:
+            self._queues[key] = (pipeline, [])
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+
+        batch = self._queues[key][1]
+        batch.append((match, future))
+        if len(batch) >= self.max_size:
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key: Hashable):
+        """
+        Score the queued predictions of a key and resolve their futures
+        """
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        pipeline, batch = self._queues.pop(key, (None, []))
+        if not batch:
+            return
+
+        self.stats["batches"] += 1
+        self.stats["predictions"] += len(batch)
+
+        if self.executor is None:
+            try:
+                results = self.score(pipeline, [match for match, _ in batch])
+            except Exception as e:
+                self._resolve(batch, error=e)
+            else:
+                self._resolve(batch, results=results)
+            return
+
+        scoring = asyncio.get_running_loop().run_in_executor(
+            self.executor, self.score, pipeline, [match for match, _ in batch])
+        scoring.add_done_callback(lambda f: self._scored(batch, f))
+
+    def _scored(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]], scoring: asyncio.Future):
+        """
+        Resolve the futures of a batch scored in the executor
+        """
+        try:
+            results = scoring.result()
+        except BaseException as e:
+            self._resolve(batch, error=e)
+        else:
+            self._resolve(batch, results=results)
+
+    @staticmethod
+    def _resolve(
+            batch: List[Tuple[Dict[str, Any], asyncio.Future]],
+            results: Optional[List[Dict[str, Any]]] = None,
+            error: Optional[BaseException] = None):
+        """
+        Resolve the futures of a batch with their results, or with the error
+        """
+        if error is not None:
+            logging.error(f'Batch of {len(batch)} predictions failed: {error}')
+
+        for i, (_, future) in enumerate(batch):
+            # The caller may have been cancelled in the meantime
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
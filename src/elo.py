@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Literal, Optional, Tuple
+
+from src.sql import load_matches_from_postgres
+
+# Directory of the persisted ratings of each circuit, kept in memory only if empty
+ELO_STATE_DIR = os.getenv("ELO_STATE_DIR")
+
+# Columns needed to rate the matches
+ELO_COLUMNS = ['date', 'winner', 'loser', 'surface']
+# Columns added to the matches by `add_elo_ratings`, the ratings of the players before the match
+RATING_COLUMNS = ['w_elo', 'l_elo', 'w_surface_elo', 'l_surface_elo']
+
+INITIAL_RATING = 1500.0
+
+class EloRatings:
+    """
+    Overall and per-surface Elo ratings of the players, updated match by match in chronological order
+
+    The K-factor of a player decreases with the number of matches they played,
+    K = k / (matches + offset) ** shape, so that the ratings of new players move fast
+    and those of established players are stable. The surface ratings are separate
+    Elo ratings, counting the matches played on the surface only.
+
+    The players are numbered, their ratings and numbers of matches being held in lists,
+    so that rating a match is a few list accesses. The state is saved as JSON
+    (see `save` and `load`), to rate the new matches only.
+    """
+    def __init__(self, k: float = 250.0, offset: float = 5.0, shape: float = 0.4):
+        self.k = k
+        self.offset = offset
+        self.shape = shape
+        self.players: Dict[str, int] = {}
+        self.ratings: List[float] = []
+        self.matches: List[int] = []
+        self.surfaces: Dict[str, int] = {}
+        self.surface_ratings: List[List[float]] = []
+        self.surface_matches: List[List[int]] = []
+        self.last_date: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _player_ids(self, names: np.ndarray) -> np.ndarray:
+        """
+        Number the players, adding the new ones at the initial rating, -1 for NULL
+        """
+        codes, uniques = pd.factorize(names, use_na_sentinel=True)
+        ids = np.empty(len(uniques) + 1, dtype=np.int64)
+        ids[-1] = -1
+        for i, name in enumerate(uniques):
+            player = self.players.get(name)
+            if player is None:
+                player = self.players[name] = len(self.ratings)
+                self.ratings.append(INITIAL_RATING)
+                self.matches.append(0)
+                for ratings, matches in zip(self.surface_ratings, self.surface_matches):
+                    ratings.append(INITIAL_RATING)
+                    matches.append(0)
+            ids[i] = player
+
+        return ids[codes]
+
+    def _surface_ids(self, surfaces: np.ndarray) -> np.ndarray:
+        """
+        Number the surfaces, -1 for NULL
+        """
+        codes, uniques = pd.factorize(surfaces, use_na_sentinel=True)
+        ids = np.empty(len(uniques) + 1, dtype=np.int64)
+        ids[-1] = -1
+        for i, surface in enumerate(uniques):
+            if surface not in self.surfaces:
+                self.surfaces[surface] = len(self.surface_ratings)
+                self.surface_ratings.append([INITIAL_RATING] * len(self.ratings))
+                self.surface_matches.append([0] * len(self.ratings))
+            ids[i] = self.surfaces[surface]
+
+        return ids[codes]
+
+    def update(self, matches: pd.DataFrame) -> np.ndarray:
+        """
+        Rate matches, in chronological order (the order of the matches of a same date being kept)
+
+        Args:
+            matches (pd.DataFrame): The matches (ELO_COLUMNS), none of them older than `last_date`
+
+        Returns:
+            np.ndarray: The ratings of the players before each match (RATING_COLUMNS), in the order of the matches,
+                NaN for the matches without players, and for the surface ratings of the matches without surface
+        """
+        if matches.empty:
+            return np.full((0, len(RATING_COLUMNS)), np.nan)
+
+        dates = pd.to_datetime(matches['date']).to_numpy(dtype='datetime64[D]')
+        first_date = dates.min()
+        if self.last_date is not None and first_date < np.datetime64(self.last_date):
+            raise ValueError(f"Matches of {first_date} are older than the last rated match ({self.last_date}), "
+                             "the ratings must be computed again from the start")
+
+        with self._lock:
+            order = np.argsort(dates, kind='stable').tolist()
+            winners = self._player_ids(matches['winner'].to_numpy(dtype=object)).tolist()
+            losers = self._player_ids(matches['loser'].to_numpy(dtype=object)).tolist()
+            surfaces = self._surface_ids(matches['surface'].to_numpy(dtype=object)).tolist()
+
+            # K-factor by number of matches played, a player playing at most all the matches
+            most = max(self.matches, default=0) + len(matches) + 1
+            k = (self.k / (np.arange(most) + self.offset) ** self.shape).tolist()
+            ratings, counts = self.ratings, self.matches
+            w_elo, l_elo, w_surface_elo, l_surface_elo = [[np.nan] * len(matches) for _ in RATING_COLUMNS]
+
+            for i in order:
+                w, l = winners[i], losers[i]
+                if w < 0 or l < 0:
+                    continue
+
+                rw, rl = ratings[w], ratings[l]
+                w_elo[i], l_elo[i] = rw, rl
+                delta = 1 - 1 / (1 + 10 ** ((rl - rw) / 400))
+                ratings[w] = rw + k[counts[w]] * delta
+                ratings[l] = rl - k[counts[l]] * delta
+                counts[w] += 1
+                counts[l] += 1
+
+                s = surfaces[i]
+                if s >= 0:
+                    surface_ratings, surface_counts = self.surface_ratings[s], self.surface_matches[s]
+                    rw, rl = surface_ratings[w], surface_ratings[l]
+                    w_surface_elo[i], l_surface_elo[i] = rw, rl
+                    delta = 1 - 1 / (1 + 10 ** ((rl - rw) / 400))
+                    surface_ratings[w] = rw + k[surface_counts[w]] * delta
+                    surface_ratings[l] = rl - k[surface_counts[l]] * delta
+                    surface_counts[w] += 1
+                    surface_counts[l] += 1
+
+            last_date = str(dates.max())
+            if self.last_date is None or last_date > self.last_date:
+                self.last_date = last_date
+
+        return np.column_stack([w_elo, l_elo, w_surface_elo, l_surface_elo])
+
+    def get(self, name: str, surface: Optional[str] = None) -> Optional[Tuple[float, Optional[float]]]:
+        """
+        Get the current ratings of a player
+
+        Args:
+            name (str): The player's name, as in the match tables
+            surface (str): The surface of the surface rating
+
+        Returns:
+            Tuple[float, Optional[float]]: The overall rating and the surface rating (None without surface),
+                None if the player has not been rated
+        """
+        player = self.players.get(name)
+        if player is None:
+            return None
+
+        s = self.surfaces.get(surface)
+        return self.ratings[player], None if s is None else self.surface_ratings[s][player]
+
+    def _state(self) -> Dict:
+        return {
+            "params": {"k": self.k, "offset": self.offset, "shape": self.shape},
+            "last_date": self.last_date,
+            "players": list(self.players),
+            "ratings": self.ratings,
+            "matches": self.matches,
+            "surfaces": {
+                surface: {"ratings": self.surface_ratings[s], "matches": self.surface_matches[s]}
+                for surface, s in self.surfaces.items()
+            },
+        }
+
+    @classmethod
+    def _from_state(cls, state: Dict) -> 'EloRatings':
+        elo = cls(**state["params"])
+        elo.last_date = state["last_date"]
+        elo.players = {name: i for i, name in enumerate(state["players"])}
+        elo.ratings = list(state["ratings"])
+        elo.matches = list(state["matches"])
+        for s, (surface, values) in enumerate(state["surfaces"].items()):
+            elo.surfaces[surface] = s
+            elo.surface_ratings.append(list(values["ratings"]))
+            elo.surface_matches.append(list(values["matches"]))
+
+        return elo
+
+    def copy(self) -> 'EloRatings':
+        """
+        Copy the ratings, to update them without changing these
+        """
+        with self._lock:
+            return self._from_state(self._state())
+
+    def save(self, path: str):
+        """
+        Save the state in a JSON file, through a temporary file renamed atomically
+        """
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+                json.dump(self._state(), f)
+            os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'EloRatings':
+        """
+        Load a state saved by `save`
+        """
+        with open(path) as f:
+            return cls._from_state(json.load(f))
+
+def add_elo_ratings(matches: pd.DataFrame, elo: Optional[EloRatings] = None) -> pd.DataFrame:
+    """
+    Add the ratings of the players before each match (RATING_COLUMNS) to matches, as needed by `create_pairwise_data`
+
+    Args:
+        matches (pd.DataFrame): The matches, with the ELO_COLUMNS
+        elo (EloRatings): The ratings before the matches (see `ratings_before`), updated with the matches;
+            all the players start at the initial rating if None
+
+    Returns:
+        pd.DataFrame: A copy of the matches with the ratings
+    """
+    ratings = (elo or EloRatings()).update(matches)
+    return matches.assign(**{column: ratings[:, i] for i, column in enumerate(RATING_COLUMNS)})
+
+_ratings: Dict[str, EloRatings] = {}
+_ratings_lock = threading.Lock()
+
+def _state_path(circuit: str) -> str:
+    return os.path.join(ELO_STATE_DIR, f"{circuit}_elo.json")
+
+def _snapshot_path(circuit: str, last_date: str) -> str:
+    return os.path.join(ELO_STATE_DIR, f"{circuit}_elo_{last_date}.json")
+
+def _snapshot_dates(circuit: str) -> List[str]:
+    """
+    Last dates rated of the yearly snapshots of a circuit saved in ELO_STATE_DIR, sorted
+    """
+    if not ELO_STATE_DIR or not os.path.isdir(ELO_STATE_DIR):
+        return []
+
+    prefix, suffix = f"{circuit}_elo_", ".json"
+    return sorted(
+        name[len(prefix):-len(suffix)] for name in os.listdir(ELO_STATE_DIR)
+        if name.startswith(prefix) and name.endswith(suffix))
+
+def _rate(circuit: str, elo: EloRatings, matches: pd.DataFrame):
+    """
+    Rate matches year by year, saving a snapshot of the ratings at the end of each year
+    followed by another one in ELO_STATE_DIR, for `ratings_before` to start from
+    """
+    years = pd.to_datetime(matches['date']).dt.year
+    groups = [group for _, group in matches.groupby(years, sort=True)]
+    for i, group in enumerate(groups):
+        elo.update(group)
+        if ELO_STATE_DIR and i < len(groups) - 1:
+            elo.save(_snapshot_path(circuit, elo.last_date))
+
+def _latest_state_before(circuit: str, date: str) -> EloRatings:
+    """
+    Latest saved ratings (current state or yearly snapshot) with no match rated on or after a date,
+    empty ratings if there is none
+    """
+    candidates = [d for d in _snapshot_dates(circuit) if d < date]
+    current = get_elo_ratings(circuit)
+    if current.last_date is not None and current.last_date < date and (not candidates or current.last_date >= candidates[-1]):
+        return current.copy()
+
+    for last_date in reversed(candidates):
+        try:
+            return EloRatings.load(_snapshot_path(circuit, last_date))
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not load the Elo snapshot of {circuit} at {last_date}: {e}")
+
+    return EloRatings()
+
+def ratings_before(circuit: Literal['atp', 'wta'], date: Optional[str]) -> EloRatings:
+    """
+    Rate all the matches of a circuit played before a date
+
+    The rating starts from the latest ratings saved in ELO_STATE_DIR before the date
+    (see `update_elo_ratings`), only the matches after them being loaded and rated;
+    from the first match if none is saved.
+
+    Args:
+        circuit (str): The circuit
+        date (str): The date (YYYY-MM-DD), excluded; no match is rated if empty
+    """
+    if not date:
+        return EloRatings()
+
+    date = pd.Timestamp(date).strftime('%Y-%m-%d')
+    elo = _latest_state_before(circuit, date)
+    since = None if elo.last_date is None else (pd.Timestamp(elo.last_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    day_before = (pd.Timestamp(date) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    if since is None or since <= day_before:
+        elo.update(load_matches_from_postgres(f"{circuit}_data", from_date=since, to_date=day_before, columns=ELO_COLUMNS))
+
+    return elo
+
+def get_elo_ratings(circuit: Literal['atp', 'wta']) -> EloRatings:
+    """
+    Get the current ratings of a circuit, loaded from ELO_STATE_DIR if saved there, empty until updated
+    """
+    with _ratings_lock:
+        if circuit not in _ratings:
+            elo = None
+            if ELO_STATE_DIR:
+                try:
+                    elo = EloRatings.load(_state_path(circuit))
+                except FileNotFoundError:
+                    pass
+            _ratings[circuit] = elo or EloRatings()
+        return _ratings[circuit]
+
+def reload_elo_ratings(circuit: Literal['atp', 'wta']) -> EloRatings:
+    """
+    Load again the ratings of a circuit saved in ELO_STATE_DIR, e.g. once updated by another process
+    """
+    with _ratings_lock:
+        _ratings.pop(circuit, None)
+    return get_elo_ratings(circuit)
+
+def update_elo_ratings(circuit: Literal['atp', 'wta'], full: bool = False) -> Dict:
+    """
+    Rate the matches of a circuit played after the last rated one, then save the ratings in ELO_STATE_DIR,
+    with a snapshot at the end of each year (see `ratings_before`)
+
+    The matches of the last rated date added afterwards are not rated until the ratings are computed again.
+
+    Args:
+        circuit (str): The circuit
+        full (bool): Compute the ratings again from the first match, needed when older matches have been added
+
+    Returns:
+        Dict: The number of matches rated, the number of players, the last date rated and the time spent
+    """
+    start = time.perf_counter()
+    elo = get_elo_ratings(circuit)
+    if full or elo.last_date is None:
+        elo, since = EloRatings(), None
+    else:
+        since = (pd.Timestamp(elo.last_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+    matches = load_matches_from_postgres(f"{circuit}_data", from_date=since, columns=ELO_COLUMNS)
+    if since is None:
+        # The snapshots of a previous pass may miss matches added since
+        for last_date in _snapshot_dates(circuit):
+            os.remove(_snapshot_path(circuit, last_date))
+    if not matches.empty:
+        _rate(circuit, elo, matches)
+    with _ratings_lock:
+        _ratings[circuit] = elo
+
+    if ELO_STATE_DIR:
+        elo.save(_state_path(circuit))
+
+    report = {
+        "matches": len(matches),
+        "players": len(elo.players),
+        "last_date": elo.last_date,
+        "seconds": time.perf_counter() - start,
+    }
+    logging.info(f"Elo ratings of {circuit} updated from {since}: {report}")
+
+    return report
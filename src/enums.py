@@ -1,23 +1,31 @@
 
 from enum import Enum
-from typing import List, Literal
+from typing import List, Literal, Tuple
 
 class Feature(Enum):
+    """
+    Features of the model, with the match columns they come from: the column of a category,
+    the columns of the winner and of the loser of a difference
+    """
     _name: str
     _type: Literal['category', 'number']
+    _columns: Tuple[str, ...]
 
-    SERIES = ('Series', 'category')
-    SURFACE = ('Surface', 'category')
-    COURT = ('Court', 'category')
-    ROUND = ('Round', 'category')
-    DIFF_RANKING = ('diffRanking', 'number')
-    DIFF_POINTS = ('diffPoints', 'number')
+    SERIES = ('Series', 'category', ('series',))
+    SURFACE = ('Surface', 'category', ('surface',))
+    COURT = ('Court', 'category', ('court',))
+    ROUND = ('Round', 'category', ('round',))
+    DIFF_RANKING = ('diffRanking', 'number', ('w_rank', 'l_rank'))
+    DIFF_POINTS = ('diffPoints', 'number', ('w_points', 'l_points'))
+    DIFF_ELO = ('diffElo', 'number', ('w_elo', 'l_elo'))
+    DIFF_SURFACE_ELO = ('diffSurfaceElo', 'number', ('w_surface_elo', 'l_surface_elo'))
 
-    def __new__(cls, name: str, type: Literal['category', 'number']):
+    def __new__(cls, name: str, type: Literal['category', 'number'], columns: Tuple[str, ...]):
         obj = object.__new__(cls)
         obj._value_ = name
         obj._name = name
         obj._type = type
+        obj._columns = columns
 
         return obj
 
@@ -28,6 +36,10 @@ class Feature(Enum):
     @property
     def type(self):
         return self._type
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        return self._columns
     
     @classmethod
     def get_features_by_type(cls, type: Literal['category', 'number']) -> List['Feature']:
@@ -0,0 +1,18 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Bounded pool of threads running the blocking work (database, MLflow, scikit-learn)
+# of the request path, so that it does not stall the event loop
+API_BLOCKING_THREADS = int(os.getenv("API_BLOCKING_THREADS", 16))
+
+blocking_executor = ThreadPoolExecutor(max_workers=API_BLOCKING_THREADS, thread_name_prefix='blocking')
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function in the thread pool and wait for its result without blocking the event loop
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,299 @@
+"""
+Ingest the yearly spreadsheets of tennis-data.co.uk into the match tables
+
+    python -m src.ingest atp 2023 2024              # download the yearly files
+    python -m src.ingest wta data/2024.xlsx         # or read local files
+
+The matches are copied (COPY) into a staging table, then inserted into `atp_data`
+or `wta_data`, skipping the matches already present (same date, tournament,
+round, winner and loser) thanks to a unique index on these columns.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import urllib.error
+import urllib.request
+import psycopg2.errors
+import pandas as pd
+from typing import Dict, Iterable, List, Literal
+
+from src.sql import _get_connection, db_query_seconds, MATCH_KEY
+
+TENNIS_DATA_URL = "http://www.tennis-data.co.uk"
+
+# Columns of the spreadsheets with a different name in the tables, the others being in snake case
+COLUMN_NAMES = {
+    'Best of': 'best_of',
+    'Tier': 'series', # WTA
+    'WRank': 'w_rank',
+    'LRank': 'l_rank',
+    'WPts': 'w_points',
+    'LPts': 'l_points',
+    'Wsets': 'w_sets',
+    'Lsets': 'l_sets',
+}
+
+# Columns of a table created by the ingestion, and their types
+TABLE_COLUMNS = {
+    'tournament': 'text',
+    'location': 'text',
+    'date': 'date',
+    'series': 'text',
+    'court': 'text',
+    'surface': 'text',
+    'round': 'text',
+    'best_of': 'integer',
+    'winner': 'text',
+    'loser': 'text',
+    'w_rank': 'integer',
+    'l_rank': 'integer',
+    'w_points': 'integer',
+    'l_points': 'integer',
+    **{f'{side}{set_number}': 'integer' for set_number in range(1, 6) for side in 'wl'},
+    'w_sets': 'integer',
+    'l_sets': 'integer',
+    'comment': 'text',
+}
+
+INTEGER_TYPES = ('smallint', 'integer', 'bigint')
+
+def _column_name(name: str) -> str:
+    name = str(name).strip()
+    return COLUMN_NAMES.get(name) or re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+def normalize_matches(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalize the matches of a spreadsheet to the columns of the tables
+    (see `load_matches_from_postgres` and `create_pairwise_data`)
+
+    - the columns are renamed (WRank to w_rank, WPts to w_points, Tier to series...)
+    - the ranks and points are numbers, NULL when missing (e.g. 'NR')
+    - the text is stripped, NULL when empty
+    - the matches without date, tournament, round, winner or loser are dropped, as are the duplicates
+
+    Args:
+        df (pd.DataFrame): The matches as read from a spreadsheet
+
+    Returns:
+        pd.DataFrame: The normalized matches
+    """
+    df = df.rename(columns=_column_name)
+    df = df.loc[:, ~df.columns.duplicated()]
+
+    for column in df.columns:
+        values = df[column]
+        known_type = TABLE_COLUMNS.get(column)
+        if column == 'date':
+            df[column] = pd.to_datetime(values, errors='coerce').dt.date
+        elif known_type == 'text' or (known_type is None and values.dtype == object
+                                      and pd.to_numeric(values, errors='coerce').isna().all()):
+            values = values.astype('string').str.strip()
+            values = values.mask(values == '')
+            df[column] = values.astype(object).where(values.notna(), None)
+        else:
+            df[column] = pd.to_numeric(values, errors='coerce')
+
+    missing = [column for column in MATCH_KEY if column not in df.columns]
+    if missing:
+        raise ValueError(f"Columns {missing} not found")
+
+    return df.dropna(subset=MATCH_KEY).drop_duplicates(subset=MATCH_KEY).reset_index(drop=True)
+
+def read_matches(path: str) -> pd.DataFrame:
+    """
+    Read and normalize the matches of a spreadsheet (.xls or .xlsx)
+    """
+    return normalize_matches(pd.read_excel(path, sheet_name=0))
+
+def tennis_data_url(circuit: Literal['atp', 'wta'], year: int, extension: str = None) -> str:
+    """
+    Get the URL of the spreadsheet of a year, .xlsx from 2013 and .xls before by default
+    """
+    extension = extension or ('xlsx' if year >= 2013 else 'xls')
+    folder = str(year) if circuit == 'atp' else f'{year}w'
+    return f"{TENNIS_DATA_URL}/{folder}/{year}.{extension}"
+
+def download_year(circuit: Literal['atp', 'wta'], year: int, directory: str) -> str:
+    """
+    Download the spreadsheet of a year from tennis-data.co.uk
+
+    Returns:
+        str: The path of the downloaded file
+    """
+    preferred = 'xlsx' if year >= 2013 else 'xls'
+    for extension in (preferred, 'xls' if preferred == 'xlsx' else 'xlsx'):
+        url = tennis_data_url(circuit, year, extension)
+        path = os.path.join(directory, f'{circuit}_{year}.{extension}')
+        try:
+            urllib.request.urlretrieve(url, path)
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                raise
+            continue
+        logging.info(f'Downloaded {url}')
+        return path
+
+    raise FileNotFoundError(f"No spreadsheet of {year} found for {circuit}")
+
+def _table_columns(cursor, table_name: str) -> Dict[str, str]:
+    """
+    Get the columns of a table and their types, empty if the table does not exist
+    """
+    cursor.execute(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s ORDER BY ordinal_position",
+        [table_name])
+    return {name: data_type for name, data_type in cursor.fetchall()}
+
+def _create_match_key_index(cursor, table_name: str) -> bool:
+    """
+    Create the unique index of the matches of a table (see MATCH_KEY) if missing, used to skip the matches already present
+
+    Returns:
+        bool: Whether the index exists, False if the table holds duplicate matches (created before the index)
+    """
+    cursor.execute("SAVEPOINT match_key_index")
+    try:
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_match_key ON {table_name} ({', '.join(MATCH_KEY)})")
+    except psycopg2.errors.UniqueViolation as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT match_key_index")
+        logging.warning(f"Could not index the matches of {table_name}, which holds duplicates: {e}")
+        return False
+
+    cursor.execute("RELEASE SAVEPOINT match_key_index")
+    return True
+
+def _to_csv(df: pd.DataFrame, types: Dict[str, str]) -> io.StringIO:
+    """
+    Format matches for COPY ... WITH (FORMAT csv), NULL being written as an empty field
+    """
+    df = df.copy()
+    for column in df.columns:
+        if types[column] in INTEGER_TYPES:
+            # Otherwise written as floats (5.0) because of the NULL
+            df[column] = df[column].round().astype('Int64')
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    return buffer
+
+def ingest_matches(circuit: Literal['atp', 'wta'], matches: pd.DataFrame) -> Dict:
+    """
+    Insert the matches not already present into the table of the circuit, through a staging table
+
+    The table is created if it does not exist, with a unique index on the matches (see MATCH_KEY).
+    Only the columns of the table are ingested.
+
+    Args:
+        circuit (str): The circuit
+        matches (pd.DataFrame): Normalized matches (see `normalize_matches`)
+
+    Returns:
+        Dict: The number of matches read, inserted and skipped, and the throughput
+    """
+    table_name = f"{circuit}_data"
+    staging = f"{table_name}_staging"
+    start = time.perf_counter()
+
+    with _get_connection() as conn:
+        with conn.cursor() as cursor:
+            types = _table_columns(cursor, table_name)
+            if not types:
+                logging.info(f'Creating table {table_name}')
+                cursor.execute(f"CREATE TABLE {table_name} ({', '.join(f'{c} {t}' for c, t in TABLE_COLUMNS.items())})")
+                types = dict(TABLE_COLUMNS)
+            indexed = _create_match_key_index(cursor, table_name)
+
+            columns = [column for column in matches.columns if column in types]
+            selected = ", ".join(columns)
+
+            cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP")
+            with db_query_seconds.time(query='ingest_copy'):
+                cursor.copy_expert(f"COPY {staging} ({selected}) FROM STDIN WITH (FORMAT csv)", _to_csv(matches[columns], types))
+
+            with db_query_seconds.time(query='ingest_insert'):
+                if indexed:
+                    cursor.execute(f"""
+                        INSERT INTO {table_name} ({selected})
+                        SELECT {selected} FROM {staging} s
+                        ON CONFLICT ({', '.join(MATCH_KEY)}) DO NOTHING
+                    """)
+                else:
+                    # Without the index, each match is looked up in the table
+                    cursor.execute(f"""
+                        INSERT INTO {table_name} ({selected})
+                        SELECT {selected} FROM {staging} s
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM {table_name} t
+                            WHERE {' AND '.join(f't.{column} = s.{column}' for column in MATCH_KEY)}
+                        )
+                    """)
+                inserted = cursor.rowcount
+
+    elapsed = time.perf_counter() - start
+    dates = pd.to_datetime(pd.Series(matches['date']))
+    report = {
+        "table": table_name,
+        "rows": len(matches),
+        "inserted": inserted,
+        "skipped": len(matches) - inserted,
+        "from_date": dates.min().strftime('%Y-%m-%d') if len(matches) else None,
+        "to_date": dates.max().strftime('%Y-%m-%d') if len(matches) else None,
+        "seconds": elapsed,
+        "rows_per_second": len(matches) / elapsed if elapsed else None,
+    }
+    throughput = f", {report['rows_per_second']:.0f} rows/s" if report['rows_per_second'] is not None else ""
+    logging.info(f"{inserted} matches inserted into {table_name}, {report['skipped']} skipped{throughput}")
+
+    return report
+
+def ingest_files(circuit: Literal['atp', 'wta'], paths: Iterable[str]) -> Dict:
+    """
+    Ingest spreadsheets into the table of the circuit
+
+    Returns:
+        Dict: See `ingest_matches`, with the time spent reading the files
+    """
+    start = time.perf_counter()
+    frames = [read_matches(path) for path in paths]
+    if frames:
+        matches = pd.concat(frames, ignore_index=True).drop_duplicates(subset=MATCH_KEY, ignore_index=True)
+    else:
+        matches = pd.DataFrame(columns=MATCH_KEY)
+    read_seconds = time.perf_counter() - start
+
+    return {**ingest_matches(circuit, matches), "files": len(frames), "read_seconds": read_seconds}
+
+def ingest_years(circuit: Literal['atp', 'wta'], years: List[int]) -> Dict:
+    """
+    Download the spreadsheets of some years from tennis-data.co.uk and ingest them
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [download_year(circuit, int(year), directory) for year in years]
+        return ingest_files(circuit, paths)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('circuit', choices=['atp', 'wta'])
+    parser.add_argument('sources', nargs='+', help='Years to download, or paths of .xls/.xlsx files')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    years = [source for source in args.sources if source.isdigit()]
+    paths = [source for source in args.sources if not source.isdigit()]
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths += [download_year(args.circuit, int(year), directory) for year in years]
+        report = ingest_files(args.circuit, paths)
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,412 @@
+import os
+import copy
+import uuid
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import BaseManager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.metrics import job_duration_seconds
+
+@dataclass
+class Job:
+    """
+    A job run in the process pool
+    """
+    id: str
+    name: str
+    params: Dict[str, Any]
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    status: str = 'pending'
+    error: Optional[str] = None
+    result: Any = None
+    future: Optional[Future] = field(default=None, repr=False)
+    # Set once the outcome of the job has been recorded
+    finished: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the status of the job
+        """
+        status = self.status
+
+        duration = None
+        if self.started_at and self.finished_at:
+            duration = (self.finished_at - self.started_at).total_seconds()
+
+        return {
+            "id": self.id,
+            "name": self.name,
+            "params": self.params,
+            "status": status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_seconds": duration,
+            "error": self.error,
+            "result": self.result,
+        }
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Jobs are sent to the API workers without their future (see JobClient)
+        state = {name: value for name, value in self.__dict__.items() if name not in ('future', 'finished')}
+        state['finished'] = self.finished.is_set()
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        finished = state.pop('finished')
+        self.__dict__.update(state, future=None, finished=threading.Event())
+        if finished:
+            self.finished.set()
+
+# Queue of the worker processes to the API, on which they report the jobs they start
+_started_jobs = None
+
+def _init_worker(started_jobs):
+    global _started_jobs
+    _started_jobs = started_jobs
+
+def _run(job_id: str, func: Callable, params: Dict[str, Any]) -> Tuple[datetime, datetime, Any]:
+    """
+    Run a job in a worker process, timing it.
+    Only JSON-like results are sent back, not the trained models.
+    """
+    started_at = datetime.now(timezone.utc)
+    if _started_jobs is not None:
+        # A job submitted waits in the queue of the pool until a worker takes it
+        _started_jobs.put((job_id, started_at))
+    result = func(**params)
+    if not isinstance(result, (dict, list, str, int, float, bool, type(None))):
+        result = None
+
+    return started_at, datetime.now(timezone.utc), result
+
+class JobManager:
+    """
+    Run CPU-heavy jobs (training, experiments) in a separate pool of processes,
+    so that they do not compete with the API worker
+
+    - at most `max_workers` jobs run at once, the others wait in the queue ('pending')
+    - a job is 'running' once a worker process has reported its start
+    - the jobs still queued when the manager is shut down without waiting are 'cancelled'
+    - a worker process dying breaks the pool: its jobs fail, and a new pool is started for the next ones
+    - a job identical to a pending or running one (same function and parameters) is not submitted again
+    """
+    def __init__(self, max_workers: int = 1, mp_context: str = 'spawn', history: int = 1000):
+        """
+        Args:
+            max_workers (int): Maximum number of jobs running at once
+            mp_context (str): How to start the worker processes. 'spawn' does not inherit the threads
+                and connections of the API.
+            history (int): Number of finished jobs kept
+        """
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+        self.history = history
+
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._started_jobs = None
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[Tuple, str] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            context = multiprocessing.get_context(self.mp_context)
+            self._started_jobs = context.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._started_jobs,))
+            threading.Thread(target=self._record_starts, args=(self._started_jobs,), name='job-starts', daemon=True).start()
+        return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        """
+        Forget a broken pool, a new one being started on the next submission. Must be called with the lock held.
+        The broken pool has already terminated its processes.
+        """
+        if self._executor is executor:
+            self._executor = None
+            self._started_jobs.put(None)
+            self._started_jobs = None
+
+    def _record_starts(self, started_jobs):
+        """
+        Mark the jobs as running as the worker processes report their start, until None is received
+        """
+        while True:
+            started = started_jobs.get()
+            if started is None:
+                break
+
+            job_id, started_at = started
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job.status == 'pending':
+                    job.started_at, job.status = started_at, 'running'
+
+    def submit(self, func: Callable, **params) -> Tuple[Job, bool]:
+        """
+        Submit a job
+
+        Args:
+            func (Callable): The function to run, must be importable from the worker processes
+            params: Its keyword arguments
+
+        Returns:
+            Tuple[Job, bool]: The job, and whether it was created (False if an identical job was already active)
+        """
+        key = (func.__module__, func.__qualname__, tuple(sorted(params.items())))
+
+        with self._lock:
+            active_id = self._active.get(key)
+            if active_id is not None:
+                return self._jobs[active_id], False
+
+            job = Job(
+                id=uuid.uuid4().hex,
+                name=func.__name__,
+                params=params,
+                submitted_at=datetime.now(timezone.utc))
+
+            executor = self._get_executor()
+            try:
+                job.future = executor.submit(_run, job.id, func, params)
+            except BrokenProcessPool:
+                # Broken since the last job, before its outcome was recorded
+                self._reset_executor(executor)
+                executor = self._get_executor()
+                job.future = executor.submit(_run, job.id, func, params)
+
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            self._prune()
+
+        logging.info(f'Job {job.id} submitted: {job.name}({params})')
+        job.future.add_done_callback(lambda future: self._done(key, job, future, executor))
+
+        return job, True
+
+    def add_done_callback(self, job: Job, callback: Callable[[Job], Any]):
+        """
+        Call `callback(job)` once the outcome of the job has been recorded, in the thread recording it
+        """
+        job.future.add_done_callback(lambda _: callback(job))
+
+    def _done(self, key: Tuple, job: Job, future: Future, executor: ProcessPoolExecutor):
+        """
+        Record the outcome of a job
+        """
+        with self._lock:
+            self._active.pop(key, None)
+            try:
+                job.started_at, job.finished_at, job.result = future.result()
+                job.status = 'succeeded'
+            except CancelledError:
+                job.finished_at = datetime.now(timezone.utc)
+                job.status = 'cancelled'
+            except Exception as e:
+                job.finished_at = datetime.now(timezone.utc)
+                job.status = 'failed'
+                job.error = f'{type(e).__name__}: {e}'
+                if isinstance(e, BrokenProcessPool):
+                    self._reset_executor(executor)
+
+        # Failed and cancelled jobs are timed from their submission, their start being unknown
+        job_duration_seconds.observe(
+            (job.finished_at - (job.started_at or job.submitted_at)).total_seconds(),
+            name=job.name, status=job.status)
+        logging.info(f'Job {job.id} {job.status}')
+        job.finished.set()
+
+    def _prune(self):
+        """
+        Forget the oldest finished jobs beyond the history size. Must be called with the lock held.
+        """
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished.is_set()]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Get a job by its ID
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @property
+    def active(self) -> int:
+        """
+        Number of jobs pending or running
+        """
+        with self._lock:
+            return len(self._active)
+
+    def _copy(self, job: Optional[Job]) -> Optional[Job]:
+        """
+        Copy a job as it is now, without its future
+        """
+        with self._lock:
+            return copy.copy(job)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Job:
+        """
+        Wait for a job to finish
+
+        Raises:
+            KeyError: If the job is unknown, or forgotten (see `history`)
+            TimeoutError: If the job has not finished within `timeout` seconds
+        """
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(f'Job {job_id} not found')
+        if not job.finished.wait(timeout):
+            raise TimeoutError(f'Job {job_id} is still {job.status}')
+
+        return job
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the worker processes
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            started_jobs, self._started_jobs = self._started_jobs, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+            started_jobs.put(None)
+
+class _JobService:
+    """
+    The job manager of the job server, as called by the JobClient: the jobs are sent as copies
+    """
+    def __init__(self, max_workers: int):
+        self.manager = JobManager(max_workers=max_workers)
+
+    def submit(self, func: Callable, params: Dict[str, Any]) -> Tuple[Job, bool]:
+        job, created = self.manager.submit(func, **params)
+        return self.manager._copy(job), created
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.manager._copy(self.manager.get(job_id))
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Job:
+        return self.manager._copy(self.manager.wait(job_id, timeout))
+
+    def active(self) -> int:
+        return self.manager.active
+
+# Job manager of the job server process
+_job_service: Optional[_JobService] = None
+
+def _init_job_server(max_workers: int):
+    global _job_service
+    logging.basicConfig(level=logging.INFO)
+    _job_service = _JobService(max_workers)
+
+def _get_job_service() -> _JobService:
+    return _job_service
+
+class _JobServer(BaseManager):
+    pass
+
+_JobServer.register('jobs', callable=_get_job_service)
+
+def start_job_server(address: str, max_workers: int = 1) -> BaseManager:
+    """
+    Start a process owning the jobs, for the processes connecting to it with a JobClient (the workers of gunicorn)
+
+    Args:
+        address (str): Path of the Unix socket of the server
+        max_workers (int): Maximum number of jobs running at once, whatever the number of clients
+
+    Returns:
+        BaseManager: The manager of the server, stopped by its `shutdown` method
+    """
+    if os.path.exists(address):
+        os.unlink(address)
+    server = _JobServer(address=address, ctx=multiprocessing.get_context('spawn'))
+    server.start(_init_job_server, (max_workers,))
+    return server
+
+class JobClient:
+    """
+    Submit jobs to the job server (see `start_job_server`), with the interface of a JobManager
+
+    The processes of the clients share the jobs, their deduplication and the pool of processes of the server,
+    which keeps running the jobs when they restart. The jobs returned are copies, as of the call.
+    """
+    def __init__(self, address: str):
+        """
+        Args:
+            address (str): Path of the Unix socket of the server
+        """
+        self.address = address
+
+        self._lock = threading.Lock()
+        self._service = None
+        self._pid = None
+
+    def _get_service(self):
+        # Connected on first use in each process, the proxies not being shared by forked processes
+        with self._lock:
+            if self._service is None or self._pid != os.getpid():
+                server = _JobServer(address=self.address)
+                server.connect()
+                self._service, self._pid = server.jobs(), os.getpid()
+            return self._service
+
+    def submit(self, func: Callable, **params) -> Tuple[Job, bool]:
+        """
+        Submit a job, see `JobManager.submit`
+        """
+        return self._get_service().submit(func, params)
+
+    def add_done_callback(self, job: Job, callback: Callable[[Job], Any]):
+        """
+        Call `callback(job)` with the finished job, in a thread waiting for it
+        """
+        def wait():
+            try:
+                finished = self.wait(job.id)
+            except Exception as e:
+                logging.error(f'Could not wait for job {job.name} {job.id}: {e!r}')
+                return
+            callback(finished)
+
+        threading.Thread(target=wait, name=f'job-{job.id}', daemon=True).start()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Get a job by its ID
+        """
+        return self._get_service().get(job_id)
+
+    @property
+    def active(self) -> int:
+        """
+        Number of jobs pending or running
+        """
+        return self._get_service().active()
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Job:
+        """
+        Wait for a job to finish, see `JobManager.wait`
+        """
+        return self._get_service().wait(job_id, timeout)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Disconnect from the server, which keeps running the jobs
+        """
+        with self._lock:
+            self._service = None
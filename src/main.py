@@ -1,8 +1,11 @@
 import os
-import joblib
+import time
 import logging
 import secrets
-from typing import Literal, Optional, Annotated
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Callable, Literal, Optional, Annotated, Any, Dict, List, Tuple
 from datetime import datetime
 from fastapi import (
     FastAPI,
@@ -10,26 +13,50 @@ from fastapi import (
     HTTPException,
     Query,
     Security,
-    Depends
+    Depends,
+    Body
 )
-from fastapi.background import BackgroundTasks
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse, Response
 from fastapi.security.api_key import APIKeyHeader
-from pydantic import BaseModel, Field
-from starlette.status import HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND
+from pydantic import BaseModel, Field, ValidationError
+from starlette.status import HTTP_304_NOT_MODIFIED, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY
 from dotenv import load_dotenv
-from mlflow.exceptions import RestException
 
 from src.model import (
     run_experiment,
     train_model_from_scratch,
+    update_model,
     predict,
+    predict_batch,
+    score_models,
     list_registered_models,
-    load_model
+    load_model,
+    ModelNotFoundError,
+    model_cache,
+    local_model,
+    training_cache,
+    PREDICT_LOG
 )
+from src.jobs import JobClient, JobManager
+from src.ingest import ingest_years
+from src.backtest import run_backtest
+from src.simulation import simulate_tournament
+from src.player_index import get_player_index
+from src.elo import get_elo_ratings, update_elo_ratings, reload_elo_ratings, ELO_STATE_DIR
+from src.batching import PredictionBatcher
+from src.shadow import ShadowEvaluator, parse_models
+from src.executor import blocking_executor, run_blocking
+from src.scorer import get_scorer
+from src.metrics import registry, predict_stage_seconds, predict_requests, db_query_seconds
 from src.sql import (
     _get_connection,
-    list_tournaments as _list_tournaments,
+    get_tournament_index,
+    invalidate_tournaments_cache,
+    TOURNAMENTS_CACHE_TTL,
+    pool_stats,
+    invalidate_match_cache,
+    refresh_match_cache,
+    MATCH_CACHE_DIR,
 )
 
 # ------------------------------------------------------------------------------
@@ -37,6 +64,30 @@ from src.sql import (
 load_dotenv()
 FASTAPI_API_KEY = os.getenv("FASTAPI_API_KEY")
 safe_clients = ['127.0.0.1']
+# Circuits whose player index and Elo ratings are built at startup (predictions by name)
+WARM_UP_CIRCUITS = [c.strip() for c in os.getenv("WARM_UP_CIRCUITS", "atp,wta").split(",") if c.strip()]
+
+# Training and experiments run in a separate pool of processes. Under gunicorn, the pool belongs to
+# a job server started by the master (JOB_SERVER_ADDRESS, see gunicorn.conf.py), shared by all the workers
+TRAINING_MAX_WORKERS = int(os.getenv("TRAINING_MAX_WORKERS", 1))
+job_manager = JobClient(os.environ["JOB_SERVER_ADDRESS"]) if os.getenv("JOB_SERVER_ADDRESS") \
+    else JobManager(max_workers=TRAINING_MAX_WORKERS)
+
+# Opt-in coalescing of the concurrent /predict calls into vectorized batches
+prediction_batcher = PredictionBatcher(
+    score=predict_batch,
+    window=float(os.getenv("PREDICT_BATCH_WINDOW_MS", 2)) / 1000,
+    max_size=int(os.getenv("PREDICT_BATCH_MAX_SIZE", 64)),
+    executor=blocking_executor
+) if os.getenv("PREDICT_BATCHING", "false").lower() in ("1", "true", "yes") else None
+
+# Opt-in scoring of the /predict matches by shadow models (e.g. SHADOW_MODELS=SGDIncremental:latest),
+# to compare candidate models with the one answering on live traffic
+shadow_evaluator = ShadowEvaluator(
+    parse_models(os.getenv("SHADOW_MODELS", "")),
+    load=lambda name, version: load_model(name, version),
+    max_pending=int(os.getenv("SHADOW_MAX_PENDING", 1000))
+) if parse_models(os.getenv("SHADOW_MODELS", "")) else None
 
 api_key_header = APIKeyHeader(name='Authorization', auto_error=False)
 
@@ -56,8 +107,34 @@ async def validate_api_key(request: Request, key: str = Security(api_key_header)
         )
     return None
 
+def _warm_up(circuit: str):
+    """
+    Build the player index of a circuit, and load or compute its Elo ratings
+    """
+    get_player_index(circuit).refresh_if_stale()
+    if get_elo_ratings(circuit).last_date is None:
+        _schedule_elo_update(circuit, full=False)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    '''
+    Start and stop the background services of the API
+    '''
+    # Watch the registry for new versions of the cached models
+    model_cache.start_polling(float(os.getenv("MODEL_CACHE_POLL_INTERVAL", 300)))
+    # Build the player indexes and the Elo ratings in the background, rather than on the first request
+    for circuit in WARM_UP_CIRCUITS:
+        blocking_executor.submit(_warm_up, circuit).add_done_callback(_log_failure(f"Warm-up of {circuit}"))
+    yield
+    model_cache.stop_polling()
+    # The jobs of the job server (gunicorn) keep running, the worker only disconnects
+    job_manager.shutdown(wait=False)
+    if shadow_evaluator is not None:
+        shadow_evaluator.shutdown(wait=False)
+
 app = FastAPI(dependencies=[Depends(validate_api_key)] if FASTAPI_API_KEY else None,
-              title="Tennis Insights API")
+              title="Tennis Insights API",
+              lifespan=lifespan)
 
 
 # ------------------------------------------------------------------------------
@@ -68,9 +145,20 @@ def redirect_to_docs():
     '''
     return RedirectResponse(url='/docs')
 
+class JobOutput(BaseModel):
+    id: str = Field(description="The ID of the job.")
+    name: str = Field(description="The function run by the job.", example="run_experiment")
+    params: dict = Field(description="The parameters of the job.")
+    status: Literal['pending', 'running', 'succeeded', 'failed', 'cancelled'] = Field(description="The status of the job.")
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[Any] = None
+
 @app.get("/train_model", tags=["model"], deprecated=True)
 async def train_model(
-    background_tasks: BackgroundTasks,
     circuit: Literal["atp", "wta"] = 'atp',
     from_date: str = "2024-01-01",
     to_date: str = "2024-12-31"):
@@ -84,20 +172,22 @@ async def train_model(
     except ValueError:
         return {"message": "Invalid date format. Please use the format 'YYYY-MM-DD'"}
     
-    background_tasks.add_task(
-        func=train_model_from_scratch,
+    job, created = job_manager.submit(
+        train_model_from_scratch,
         circuit=circuit,
         from_date=from_date,
         to_date=to_date)
     
-    return {"message": "Model training in progress"}
+    return {"message": "Model training in progress" if created else "Model training already in progress",
+            "job_id": job.id}
 
 @app.get("/run_experiment", tags=["model"], description="Schedule a run of the ML experiment")
 async def run_xp(
-    background_tasks: BackgroundTasks,
     circuit: Literal["atp", "wta"] = 'atp',
     from_date: str = "2024-01-01",
-    to_date: str = "2024-12-31"):
+    to_date: str = "2024-12-31",
+    search: bool = Query(False, description="Search the best classifier and hyperparameters with cross-validation on all the cores"),
+    cv: int = Query(5, ge=2, le=20, description="Number of cross-validation folds of the search")):
     """
     Train the model
     """
@@ -108,19 +198,98 @@ async def run_xp(
     except ValueError:
         return {"message": "Invalid date format. Please use the format 'YYYY-MM-DD'"}
     
-    background_tasks.add_task(
-        func=run_experiment,
+    job, created = job_manager.submit(
+        run_experiment,
         circuit=circuit,
         from_date=from_date,
-        to_date=to_date)
+        to_date=to_date,
+        **({"search": True, "cv": cv} if search else {}))
     
-    return {"message": "Experiment scheduled"}
+    return {"message": "Experiment scheduled" if created else "Experiment already scheduled",
+            "job_id": job.id}
+
+@app.get("/update_model", tags=["model"], description="Schedule an incremental update of a model with the latest matches")
+async def update_incremental_model(
+    circuit: Literal["atp", "wta"] = 'atp',
+    model: str = 'SGDIncremental',
+    from_date: Optional[str] = Query(None, description="First date of the training data, only used for the first version"),
+    to_date: Optional[str] = Query(None, description="Last date of the new matches, yesterday if empty"),
+    parity_check: bool = Query(False, description="Compare the update with a full retrain on the same data")):
+    """
+    Update the model with the matches played since its training cutoff
+    """
+    # Check dates format
+    try:
+        for value in (from_date, to_date):
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return {"message": "Invalid date format. Please use the format 'YYYY-MM-DD'"}
+
+    job, created = job_manager.submit(
+        update_model,
+        circuit=circuit,
+        registered_model_name=model,
+        from_date=from_date,
+        to_date=to_date,
+        parity_check=parity_check)
+
+    return {"message": "Model update scheduled" if created else "Model update already scheduled",
+            "job_id": job.id}
+
+@app.get("/backtest", tags=["model"], description="Schedule a walk-forward backtest of the model")
+async def backtest(
+    circuit: Literal["atp", "wta"] = 'atp',
+    from_date: str = "2015-01-01",
+    to_date: str = "2024-12-31",
+    train_months: int = Query(24, gt=0, description="Months of training data of each window (of the first one if expanding)"),
+    test_months: int = Query(3, gt=0, description="Months evaluated after each training period"),
+    step_months: Optional[int] = Query(None, gt=0, description="Months between two windows, test_months by default"),
+    mode: Literal["rolling", "expanding"] = "rolling"):
+    """
+    Train on past matches and evaluate on the following period, window after window.
+    The metrics of each window are in the result of the job.
+    """
+    # Check dates format
+    try:
+        datetime.strptime(from_date, "%Y-%m-%d")
+        datetime.strptime(to_date, "%Y-%m-%d")
+    except ValueError:
+        return {"message": "Invalid date format. Please use the format 'YYYY-MM-DD'"}
+
+    job, created = job_manager.submit(
+        run_backtest,
+        circuit=circuit,
+        from_date=from_date,
+        to_date=to_date,
+        train_months=train_months,
+        test_months=test_months,
+        step_months=step_months,
+        mode=mode)
+
+    return {"message": "Backtest scheduled" if created else "Backtest already scheduled",
+            "job_id": job.id}
+
+@app.get("/jobs/{job_id}", tags=["model"], description="Get the status of a training job", response_model=JobOutput)
+async def get_job(job_id: str):
+    """
+    Get the status and timing of a job
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+
+    return job.to_dict()
 
 class ModelInput(BaseModel):
     rank_player_1: int = Field(gt=0, default=1, description="The rank of the 1st player")
     rank_player_2: int = Field(gt=0, default=100, description="The rank of the 2nd player")
     points_player_1: int = Field(gt=0, default=4000, description="The number of points of the 1st player")
     points_player_2: int = Field(gt=0, default=500, description="The number of points of the 2nd player")
+    elo_player_1: Optional[float] = Field(gt=0, default=None, description="The Elo rating of the 1st player, imputed if empty")
+    elo_player_2: Optional[float] = Field(gt=0, default=None, description="The Elo rating of the 2nd player, imputed if empty")
+    surface_elo_player_1: Optional[float] = Field(gt=0, default=None, description="The Elo rating of the 1st player on the surface, imputed if empty")
+    surface_elo_player_2: Optional[float] = Field(gt=0, default=None, description="The Elo rating of the 2nd player on the surface, imputed if empty")
     court: Literal['Outdoor', 'Indoor'] = 'Outdoor'
     surface: Literal['Grass', 'Carpet', 'Clay', 'Hard'] = 'Clay'
     round: Literal['1st Round', '2nd Round', '3nd Round', '4th Round', 'Quarterfinals', 'Semifinals', 'The Final', 'Round Robin'] = '1st Round'
@@ -132,6 +301,73 @@ class ModelOutput(BaseModel):
     result: int = Field(description="The prediction result. 1 if player 1 is expected to win, 0 otherwise.", example=1)
     prob: list[float] = Field(description="Probability of [defeat, victory] of player 1.", example=[0.15, 0.85])
 
+class BatchItemOutput(BaseModel):
+    result: Optional[int] = Field(default=None, description="The prediction result. 1 if player 1 is expected to win, 0 otherwise.", example=1)
+    prob: Optional[list[float]] = Field(default=None, description="Probability of [defeat, victory] of player 1.", example=[0.15, 0.85])
+    error: Optional[str] = Field(default=None, description="Why the match could not be scored, if so.", example=None)
+
+def _get_pipeline(model: Optional[str], version: Optional[str]):
+    """
+    Get the pipeline to predict with
+
+    Args:
+        model (str): Name of the registered model, the locally trained model if empty
+        version (str): Version of the registered model
+
+    Returns:
+        Pipeline: The pipeline, None if no local model has been trained yet
+
+    Raises:
+        ModelNotFoundError: If the model is not registered in MLflow
+    """
+    if not model:
+        # Locally trained model, kept in memory until the file changes
+        return local_model.get()
+
+    # Get the model info
+    return load_model(model, version)
+
+async def _get_pipeline_async(model: Optional[str], version: Optional[str]):
+    """
+    Same as `_get_pipeline`, without blocking the event loop: only models
+    already in memory are served inline, the others are loaded in the thread pool
+    """
+    if model:
+        pipeline = model_cache.get_if_cached(model, version)
+        if pipeline is not None:
+            return pipeline
+
+    return await run_blocking(_get_pipeline, model, version)
+
+async def _predict_async(pipeline, **kwargs) -> Dict[str, Any]:
+    """
+    Same as `predict`, without blocking the event loop: compiled pipelines
+    are scored inline (microseconds), the others in the thread pool
+    """
+    if get_scorer(pipeline) is not None:
+        return predict(pipeline=pipeline, **kwargs)
+
+    return await run_blocking(predict, pipeline=pipeline, **kwargs)
+
+def _to_predict_kwargs(params: ModelInput) -> Dict[str, Any]:
+    """
+    Map the input of the API to the arguments of the `predict` functions
+    """
+    return dict(
+        rank_player_1=params.rank_player_1,
+        rank_player_2=params.rank_player_2,
+        points_player_1=params.points_player_1,
+        points_player_2=params.points_player_2,
+        elo_player_1=params.elo_player_1,
+        elo_player_2=params.elo_player_2,
+        surface_elo_player_1=params.surface_elo_player_1,
+        surface_elo_player_2=params.surface_elo_player_2,
+        court=params.court,
+        surface=params.surface,
+        round_stage=params.round,
+        series=params.series
+    )
+
 @app.get("/predict",
          tags=["model"],
          description="Predict the outcome of a tennis match",
@@ -140,50 +376,291 @@ async def make_prediction(params: Annotated[ModelInput, Query()]):
     """
     Predict the matches
     """
-    if not params.model:
-        # check the presence of 'model.pkl' file in data/
-        if not os.path.exists("/data/model.pkl"):
-            return {"message": "Model not trained. Please train the model first."}
-    
-        # Load the model
-        pipeline = joblib.load("/data/model.pkl")
+    return await _predict_match(params.model, params.version, _to_predict_kwargs(params))
+
+async def _predict_match(model: Optional[str], version: Optional[str], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Resolve the model, then predict a match (see `_to_predict_kwargs`), batched with others if enabled
+    """
+    start = time.perf_counter()
+    try:
+        pipeline = await _get_pipeline_async(model, version)
+    except ModelNotFoundError as e:
+        logging.error(e)
+
+        # Return HTTP error 404
+        raise HTTPException(
+            status_code=HTTP_404_NOT_FOUND,
+            detail=f"Model {model} not found"
+        )
+
+    predict_stage_seconds.observe(time.perf_counter() - start, stage='resolve')
+
+    if pipeline is None:
+        return {"message": "Model not trained. Please train the model first."}
+
+    predict_requests.inc(model=model or 'local', version=version or 'latest')
+
+    # Make the prediction
+    if prediction_batcher is not None:
+        prediction = await prediction_batcher.submit((model, version), pipeline, kwargs)
     else:
-        # Get the model info
+        prediction = await _predict_async(pipeline, **kwargs)
+
+    if PREDICT_LOG:
+        logging.info(prediction)
+
+    if shadow_evaluator is not None:
+        shadow_evaluator.submit(kwargs, prediction)
+
+    return prediction
+
+class ComparedModelOutput(BatchItemOutput):
+    model: str
+    version: str
+    seconds: Optional[float] = Field(default=None, description="Time spent scoring the match, the encoding shared with other models included.")
+
+@app.get("/predict/compare",
+         tags=["model"],
+         description="Predict the outcome of a tennis match with several models, side by side",
+         response_model=list[ComparedModelOutput])
+async def compare_predictions(
+    params: Annotated[ModelInput, Query()],
+    models: Annotated[List[str], Query(description="The models to compare, as name:version (latest if no version)")]):
+    """
+    Score the match with each model, the features being built once and encoded once per distinct preprocessor
+    """
+    specs = list(dict.fromkeys(parse_models(",".join(models))))
+    if not specs:
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail="No model to compare")
+
+    pipelines, errors = {}, {}
+    for name, version in specs:
         try:
-            pipeline = load_model(params.model, params.version)
-        except RestException as e:
+            pipeline = await _get_pipeline_async(name, version)
+        except ModelNotFoundError as e:
             logging.error(e)
+            errors[(name, version)] = f"Model {name} not found"
+        else:
+            pipelines[(name, version)] = pipeline
+            predict_requests.inc(model=name, version=version)
 
-            # Return HTTP error 404
-            return HTTPException(
-                status=HTTP_404_NOT_FOUND,
-                detail=f"Model {params.model} not found"
-            )
+    results = await run_blocking(score_models, pipelines, [_to_predict_kwargs(params)]) if pipelines else {}
 
-    # Make the prediction
-    prediction = predict(
-        pipeline=pipeline,
-        rank_player_1=params.rank_player_1,
-        rank_player_2=params.rank_player_2,
-        points_player_1=params.points_player_1,
-        points_player_2=params.points_player_2,
+    return [
+        {"model": name, "version": version, "error": errors[(name, version)]}
+        if (name, version) in errors else
+        {"model": name, "version": version, **results[(name, version)]["predictions"][0], "seconds": results[(name, version)]["seconds"]}
+        for name, version in specs
+    ]
+
+class NamedMatchInput(BaseModel):
+    player_1: str = Field(description="The name of the 1st player, as in the match tables", examples=["Sinner J."])
+    player_2: str = Field(description="The name of the 2nd player, as in the match tables", examples=["Alcaraz C."])
+    date: Optional[str] = Field(default=None, pattern=r'^\d{4}-\d{2}-\d{2}$', description="The date of the match (YYYY-MM-DD), today if empty. The rank and points are those of the last match of each player before it.")
+    circuit: Literal['atp', 'wta'] = 'atp'
+    court: Literal['Outdoor', 'Indoor'] = 'Outdoor'
+    surface: Literal['Grass', 'Carpet', 'Clay', 'Hard'] = 'Clay'
+    round: Literal['1st Round', '2nd Round', '3nd Round', '4th Round', 'Quarterfinals', 'Semifinals', 'The Final', 'Round Robin'] = '1st Round'
+    series: Literal['Grand Slam', 'Masters 1000', 'Masters', 'Masters Cup', 'ATP500', 'ATP250', 'International Gold', 'International'] = 'Grand Slam'
+    model: Optional[str] = 'LogisticRegression'
+    version: Optional[str] = 'latest'
+
+class PlayerInfo(BaseModel):
+    name: str
+    rank: Optional[int] = None
+    points: Optional[int] = None
+    as_of: str = Field(description="The date of the match the rank and points come from.")
+    elo: Optional[float] = Field(default=None, description="The current Elo rating, for the matches to come only.")
+    surface_elo: Optional[float] = Field(default=None, description="The current Elo rating on the surface, for the matches to come only.")
+
+class NamedModelOutput(ModelOutput):
+    player_1: PlayerInfo
+    player_2: PlayerInfo
+
+@app.get("/predict_by_name",
+         tags=["model"],
+         description="Predict the outcome of a tennis match from the names of the players, with their rank and points as of the match date "
+                     "and, for the matches to come, their current Elo ratings",
+         response_model=NamedModelOutput)
+async def make_prediction_by_name(params: Annotated[NamedMatchInput, Query()]):
+    """
+    Look the players up in the player index of the circuit, then predict the match
+    """
+    index = get_player_index(params.circuit)
+    if not index.is_built:
+        # Not warmed up yet: built once, the concurrent requests waiting for it
+        await run_blocking(index.refresh_if_stale)
+    elif index.is_stale:
+        # Answered from the current index, refreshed in the background
+        blocking_executor.submit(index.refresh_if_stale, False).add_done_callback(
+            _log_failure(f"Refresh of the player index of {params.circuit}"))
+
+    players = []
+    for name in (params.player_1, params.player_2):
+        player = index.lookup(name, params.date)
+        if player is None:
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail=f"No {params.circuit.upper()} match of {name} found before {params.date or 'today'}")
+        players.append(player)
+
+    elo = get_elo_ratings(params.circuit)
+    if elo.last_date is None:
+        # Not computed yet (see the warm-up): the ratings are imputed meanwhile
+        _schedule_elo_update(params.circuit, full=False)
+
+    # The current ratings would leak the outcome of the past matches
+    if elo.last_date is not None and (params.date or datetime.now().strftime("%Y-%m-%d")) > elo.last_date:
+        for player in players:
+            ratings = elo.get(player["name"], params.surface)
+            if ratings is not None:
+                player["elo"], player["surface_elo"] = ratings
+
+    # Unknown ranks, points or ratings are imputed by the pipeline
+    missing = float('nan')
+    kwargs = dict(
+        rank_player_1=missing if players[0]["rank"] is None else players[0]["rank"],
+        rank_player_2=missing if players[1]["rank"] is None else players[1]["rank"],
+        points_player_1=missing if players[0]["points"] is None else players[0]["points"],
+        points_player_2=missing if players[1]["points"] is None else players[1]["points"],
+        elo_player_1=players[0].get("elo"),
+        elo_player_2=players[1].get("elo"),
+        surface_elo_player_1=players[0].get("surface_elo"),
+        surface_elo_player_2=players[1].get("surface_elo"),
         court=params.court,
         surface=params.surface,
         round_stage=params.round,
         series=params.series
     )
+    prediction = await _predict_match(params.model, params.version, kwargs)
+    if "result" not in prediction:
+        return prediction
 
-    logging.info(prediction)
+    return {**prediction, "player_1": players[0], "player_2": players[1]}
 
-    return prediction
+@app.post("/predict/batch",
+          tags=["model"],
+          description="Predict the outcome of several tennis matches, possibly with different models",
+          response_model=list[BatchItemOutput])
+async def make_batch_prediction(matches: Annotated[List[Dict[str, Any]], Body()]):
+    """
+    Predict the matches, grouped by model so that each model is called once
+    """
+    results: List[Dict[str, Any]] = [{} for _ in matches]
+    groups: Dict[Tuple[Optional[str], Optional[str]], List[Tuple[int, ModelInput]]] = {}
+
+    # Validate each match on its own, so that a bad one does not fail the batch
+    for i, match in enumerate(matches):
+        try:
+            params = ModelInput.model_validate(match)
+        except ValidationError as e:
+            results[i] = {"error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())}
+            continue
+
+        groups.setdefault((params.model, params.version), []).append((i, params))
+
+    for (model, version), items in groups.items():
+        try:
+            pipeline = await _get_pipeline_async(model, version)
+        except ModelNotFoundError as e:
+            logging.error(e)
+            pipeline = None
+            error = f"Model {model} not found"
+        else:
+            error = "Model not trained. Please train the model first."
+
+        if pipeline is None:
+            for i, _ in items:
+                results[i] = {"error": error}
+            continue
+
+        predict_requests.inc(len(items), model=model or 'local', version=version or 'latest')
+        predictions = await run_blocking(predict_batch, pipeline, [_to_predict_kwargs(params) for _, params in items])
+        for (i, _), prediction in zip(items, predictions):
+            results[i] = prediction
+
+    return results
+
+class DrawPlayer(BaseModel):
+    name: str = Field(description="The player's name.", examples=["Sinner J."])
+    rank: Optional[int] = Field(default=None, gt=0, description="The player's rank.")
+    points: Optional[int] = Field(default=None, ge=0, description="The player's number of points.")
+    elo: Optional[float] = Field(default=None, gt=0, description="The player's Elo rating.")
+    surface_elo: Optional[float] = Field(default=None, gt=0, description="The player's Elo rating on the surface of the tournament.")
+
+class DrawInput(BaseModel):
+    players: List[Optional[DrawPlayer]] = Field(description="The draw in bracket order (the 1st player meets the 2nd...), null for a bye. Its size must be a power of 2.")
+    series: Literal['Grand Slam', 'Masters 1000', 'Masters', 'Masters Cup', 'ATP500', 'ATP250', 'International Gold', 'International'] = 'Grand Slam'
+    surface: Literal['Grass', 'Carpet', 'Clay', 'Hard'] = 'Clay'
+    court: Literal['Outdoor', 'Indoor'] = 'Outdoor'
+    simulations: int = Field(default=10_000, gt=0, le=1_000_000, description="Number of simulated draws.")
+    seed: Optional[int] = Field(default=None, description="Seed of the simulations, for reproducible results.")
+    model: Optional[str] = 'LogisticRegression'
+    version: Optional[str] = 'latest'
+
+class DrawPlayerOutput(BaseModel):
+    name: str
+    rank: Optional[int] = None
+    points: Optional[int] = None
+    elo: Optional[float] = None
+    surface_elo: Optional[float] = None
+    rounds: Dict[str, float] = Field(description="Probability to win each round, winning 'The Final' meaning winning the tournament.")
+
+@app.post("/simulate_draw",
+          tags=["model"],
+          description="Simulate a tournament draw to estimate the chances of each player to win each round",
+          response_model=list[DrawPlayerOutput])
+async def simulate_draw(draw: DrawInput):
+    """
+    Simulate the draw many times with the probabilities of the model
+    """
+    size = len(draw.players)
+    if size < 2 or size & (size - 1):
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=f"The draw must have a power of 2 players (byes included), not {size}")
+
+    try:
+        pipeline = await _get_pipeline_async(draw.model, draw.version)
+    except ModelNotFoundError as e:
+        logging.error(e)
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=f"Model {draw.model} not found")
+
+    if pipeline is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Model not trained. Please train the model first.")
+
+    return await run_blocking(
+        simulate_tournament,
+        pipeline,
+        [player.model_dump() if player is not None else None for player in draw.players],
+        series=draw.series,
+        surface=draw.surface,
+        court=draw.court,
+        simulations=draw.simulations,
+        seed=draw.seed)
 
 @app.get("/list_available_models", tags=["model"], description="List the available models")
 async def list_available_models():
     """
     List the available models
     """
-    return list_registered_models()
+    return await run_blocking(list_registered_models)
 
+@app.get("/shadow/stats", tags=["model"], description="Get the latency and disagreement rate of the shadow models")
+async def get_shadow_stats():
+    """
+    Get, for each shadow model, the matches scored, the disagreements with the answered predictions and the latency
+    """
+    if shadow_evaluator is None:
+        return {"message": "No shadow model configured (SHADOW_MODELS)"}
+
+    return shadow_evaluator.stats()
+
+@app.get("/models/cache", tags=["model"], description="Get the statistics of the model cache")
+async def get_model_cache_stats():
+    """
+    Get the hit, miss, load and eviction counters of the model cache
+    """
+    return model_cache.stats()
 
 class Tournament(BaseModel):
     name: str = Field(description="The tournament's name.", example='Wimbledon')
@@ -192,11 +669,199 @@ class Tournament(BaseModel):
     surface: Literal['Grass', 'Carpet', 'Clay', 'Hard'] = 'Grass'
 
 @app.get("/{circuit}/tournaments", tags=["reference"], description="List the tournaments of the circuit", response_model=list[Tournament])
-async def list_tournaments(circuit: Literal["atp", "wta"]):
+async def list_tournaments(
+    circuit: Literal["atp", "wta"],
+    request: Request,
+    response: Response,
+    surface: Optional[Literal['Grass', 'Carpet', 'Clay', 'Hard']] = None,
+    series: Optional[Literal['ATP250', 'ATP500', 'Grand Slam', 'Masters 1000', 'Masters', 'Masters Cup', 'International Gold', 'International']] = None):
     """
     List the tournaments of the circuit
     """
-    return _list_tournaments(circuit)
+    headers = {"Cache-Control": f"public, max-age={int(TOURNAMENTS_CACHE_TTL)}"}
+
+    # Answer conditional requests from the cache, without touching the database
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        index = get_tournament_index(circuit, cached_only=True)
+        if index is not None:
+            etag = index.get_etag(surface, series)
+            if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+                return Response(status_code=HTTP_304_NOT_MODIFIED, headers={**headers, "ETag": etag})
+
+    index = get_tournament_index(circuit, cached_only=True) or await run_blocking(get_tournament_index, circuit)
+    response.headers.update({**headers, "ETag": index.get_etag(surface, series)})
+
+    return index.filter(surface, series)
+
+@app.post("/{circuit}/tournaments/invalidate", tags=["reference"], description="Drop the cached tournaments of the circuit")
+async def invalidate_tournaments(circuit: Literal["atp", "wta"]):
+    """
+    Drop the cached tournaments of the circuit
+    """
+    invalidate_tournaments_cache(circuit)
+    return {"message": f"Tournaments of {circuit} invalidated"}
+
+@app.post("/{circuit}/match_cache/invalidate", tags=["reference"], description="Drop the local cache of the matches of the circuit")
+async def invalidate_matches(circuit: Literal["atp", "wta"]):
+    """
+    Drop the local match cache of the circuit
+    """
+    await run_blocking(invalidate_match_cache, f"{circuit}_data")
+    return {"message": f"Match cache of {circuit} invalidated"}
+
+@app.post("/{circuit}/match_cache/refresh", tags=["reference"], description="Fetch again the matches of the circuit into the local cache")
+async def refresh_matches(
+    circuit: Literal["atp", "wta"],
+    from_date: str = "2024-01-01",
+    to_date: str = "2024-12-31"):
+    """
+    Fetch again the matches of the circuit between two dates
+    """
+    # Check dates format
+    try:
+        datetime.strptime(from_date, "%Y-%m-%d")
+        datetime.strptime(to_date, "%Y-%m-%d")
+    except ValueError:
+        return {"message": "Invalid date format. Please use the format 'YYYY-MM-DD'"}
+
+    await run_blocking(refresh_match_cache, f"{circuit}_data", from_date, to_date)
+    return {"message": f"Match cache of {circuit} refreshed from {from_date} to {to_date}"}
+
+@app.post("/training_cache/clear", tags=["model"], description="Drop the cached training data of all the circuits")
+async def clear_training_cache():
+    """
+    Drop the prepared training data, for instance after categories have been corrected in the database
+    """
+    if training_cache is None:
+        return {"message": "Training cache disabled"}
+
+    await run_blocking(training_cache.clear)
+    return {"message": "Training cache cleared"}
+
+def _log_failure(description: str):
+    """
+    Callback of a future logging its failure
+    """
+    def callback(future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(f"{description} failed: {future.exception()!r}")
+    return callback
+
+def _when_succeeded(job, func: Callable, *args):
+    """
+    Run `func(*args, result)` in the blocking thread pool once a job has succeeded,
+    off the thread of the process pool handling the results of all the jobs
+
+    The failures of the job and of `func` are logged.
+    """
+    def callback(finished):
+        if finished.status != 'succeeded':
+            logging.error(f"Job {finished.name} {finished.id} {finished.status}: {finished.error}")
+            return
+        blocking_executor.submit(func, *args, finished.result).add_done_callback(_log_failure(f"{func.__name__}{args}"))
+
+    job_manager.add_done_callback(job, callback)
+
+# Elo updates running in the blocking thread pool (without ELO_STATE_DIR), by circuit
+_elo_updates: Dict[str, Future] = {}
+_elo_updates_lock = threading.Lock()
+
+def _schedule_elo_update(circuit: str, full: bool):
+    """
+    Update the Elo ratings of a circuit as a job, the API loading them back from ELO_STATE_DIR once done;
+    in the blocking thread pool if ELO_STATE_DIR is not set, the ratings being kept in the memory of the API only
+
+    Returns:
+        Tuple[Optional[Job], bool]: The job (None without ELO_STATE_DIR), and whether it was created
+    """
+    if not ELO_STATE_DIR:
+        with _elo_updates_lock:
+            update = _elo_updates.get(circuit)
+            if update is not None and not update.done():
+                return None, False
+            update = _elo_updates[circuit] = blocking_executor.submit(update_elo_ratings, circuit, full)
+        update.add_done_callback(_log_failure(f"Elo update of {circuit}"))
+        return None, True
+
+    job, created = job_manager.submit(update_elo_ratings, circuit=circuit, full=full)
+    if created:
+        _when_succeeded(job, lambda circuit, report: reload_elo_ratings(circuit), circuit)
+
+    return job, created
+
+def _refresh_player_index(circuit: str, from_date: str, *_):
+    """
+    Add the ingested matches to the player index of a circuit, if built; rebuilt if they are older than the last one indexed
+    """
+    index = get_player_index(circuit)
+    if not index.is_stale:
+        last_date = index.stats()["last_date"]
+        index.refresh(full=last_date is not None and from_date < last_date)
+
+def _after_ingestion(circuit: str, report: Dict[str, Any]):
+    """
+    Update the cached data of a circuit once new matches have been ingested
+
+    Run in the blocking thread pool: the match cache and the Elo ratings are updated by jobs,
+    the player index (held by the API) once the match cache has been refreshed.
+    """
+    invalidate_tournaments_cache(circuit)
+    if not report["inserted"]:
+        return
+
+    if MATCH_CACHE_DIR:
+        job, _ = job_manager.submit(
+            refresh_match_cache, table_name=report["table"], from_date=report["from_date"], to_date=report["to_date"])
+        _when_succeeded(job, _refresh_player_index, circuit, report["from_date"])
+    else:
+        _refresh_player_index(circuit, report["from_date"])
+
+    elo = get_elo_ratings(circuit)
+    if elo.last_date is not None:
+        # Computed again from the start if matches of the last date rated or before have been inserted
+        _schedule_elo_update(circuit, full=report["from_date"] <= elo.last_date)
+
+@app.post("/{circuit}/elo/update", tags=["reference"], description="Schedule an update of the Elo ratings of the players of the circuit")
+async def update_elo(
+    circuit: Literal["atp", "wta"],
+    full: bool = Query(False, description="Compute the ratings again from the first match, instead of rating the new matches only")):
+    """
+    Rate the matches played since the last update, the ratings being saved in ELO_STATE_DIR
+    """
+    job, created = _schedule_elo_update(circuit, full)
+
+    return {"message": "Elo update scheduled" if created else "Elo update already scheduled",
+            "job_id": job.id if job else None}
+
+@app.post("/{circuit}/ingest", tags=["reference"], description="Schedule the ingestion of the yearly spreadsheets of tennis-data.co.uk")
+async def ingest(
+    circuit: Literal["atp", "wta"],
+    years: Annotated[List[int], Query(description="The years to download and ingest")]):
+    """
+    Download the spreadsheets of some years and insert their new matches into the table of the circuit
+    """
+    if any(year < 2000 or year > datetime.now().year for year in years):
+        return {"message": f"Years must be between 2000 and {datetime.now().year}"}
+
+    job, created = job_manager.submit(ingest_years, circuit=circuit, years=tuple(sorted(set(years))))
+    if created:
+        _when_succeeded(job, _after_ingestion, circuit)
+
+    return {"message": "Ingestion scheduled" if created else "Ingestion already scheduled",
+            "job_id": job.id}
+
+def _check_database() -> bool:
+    """
+    Check the database answers
+    """
+    try:
+        with _get_connection() as conn:
+            with conn.cursor() as cursor, db_query_seconds.time(query='health'):
+                cursor.execute("SELECT 1")
+                return True
+    except Exception:
+        return False
 
 @app.get("/check_health", tags=["general"], description="Check the health of the API")
 async def check_health():
@@ -207,16 +872,23 @@ async def check_health():
     unhealthy = 1
 
     # DB check
-    db_status = False
-    try:
-        with _get_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT 1")
-                db_status = True
-    except Exception:
-        pass
+    db_status = await run_blocking(_check_database)
 
     if db_status:
         return healthy
     else:
         return unhealthy
+
+@app.get("/db/pool", tags=["general"], description="Get the usage statistics of the database connection pool")
+async def get_pool_stats():
+    """
+    Get the size, usage and counters of the connection pool
+    """
+    return pool_stats()
+
+@app.get("/metrics", tags=["general"], description="Get the metrics of the API in the Prometheus text format", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Get the prediction, cache, database and job metrics of this process
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,336 @@
+import os
+import json
+import fcntl
+import shutil
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+# A date range, both ends included, as ISO strings (YYYY-MM-DD)
+DateRange = Tuple[str, str]
+
+def _day(value: str) -> date:
+    return date.fromisoformat(str(value)[:10])
+
+def _subtract_ranges(wanted: DateRange, covered: List[DateRange]) -> List[DateRange]:
+    """
+    Get the parts of the `wanted` range not covered by the `covered` ranges
+    """
+    start, end = _day(wanted[0]), _day(wanted[1])
+    missing = []
+    for c_start, c_end in sorted((_day(a), _day(b)) for a, b in covered):
+        if c_end < start or c_start > end:
+            continue
+        if c_start > start:
+            missing.append((start, c_start - timedelta(days=1)))
+        start = max(start, c_end + timedelta(days=1))
+        if start > end:
+            break
+    if start <= end:
+        missing.append((start, end))
+
+    return [(a.isoformat(), b.isoformat()) for a, b in missing]
+
+def _merge_ranges(ranges: List[DateRange]) -> List[DateRange]:
+    """
+    Merge the overlapping or adjacent ranges
+    """
+    merged = []
+    for start, end in sorted((_day(a), _day(b)) for a, b in ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return [(a.isoformat(), b.isoformat()) for a, b in merged]
+
+# Maximum number of segments, beyond which they are merged into one on the next write
+MAX_SEGMENTS = 32
+
+class MatchStore:
+    """
+    Local columnar cache of a match table, shared by the processes using the same directory
+
+    The matches are stored in immutable segments, each one a directory holding a NumPy
+    file per column, read through memory maps: 'date' as datetime64[D], categories as
+    int32 codes (-1 for NULL) and the other columns as float64 (NaN for NULL). A JSON
+    manifest lists the segments, the categories and the date ranges already held, so
+    that only the missing dates are fetched from the database, into a new segment.
+
+    A new segment is written first, then the manifest replacing the previous one is
+    renamed into place, so that readers always see segments and manifest in sync. The
+    manifest is read again under a lock of the directory (`fcntl`) on every access:
+    shared to read, exclusive to fetch and write, so that concurrent processes neither
+    fetch the same dates twice nor overwrite each other's categories or ranges.
+
+    Dates from today on are never recorded as held: matches may still be added for them.
+    """
+    def __init__(
+            self,
+            root: str,
+            columns: List[str],
+            category_columns: List[str],
+            fetch: Callable[[str, str], Iterable[pd.DataFrame]]):
+        """
+        Args:
+            root (str): Directory of the cache
+            columns (List[str]): Columns to store, including 'date'
+            category_columns (List[str]): Columns holding categories (strings)
+            fetch (Callable[[str, str], Iterable[pd.DataFrame]]): Fetch the matches between two dates
+                (both included) from the database, by chunks
+        """
+        if 'date' not in columns:
+            raise ValueError("The 'date' column is required")
+
+        self.root = root
+        self.columns = list(columns)
+        self.category_columns = set(category_columns)
+        self.fetch = fetch
+        self._lock = threading.Lock()
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.root, 'manifest.json')
+
+    def _segment_path(self, segment: str) -> str:
+        return os.path.join(self.root, segment)
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[Dict]:
+        """
+        Lock the cache, between the threads then between the processes, and read its manifest
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, open(os.path.join(self.root, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield self._read_manifest()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(self._manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = None
+
+        if manifest is None or manifest.get('columns') != self.columns or 'segments' not in manifest:
+            return {'columns': self.columns, 'ranges': [], 'rows': 0, 'categories': {}, 'segments': [], 'next_segment': 0}
+
+        return manifest
+
+    def _write_segment(self, manifest: Dict, arrays: Dict[str, np.ndarray]) -> Dict:
+        """
+        Write rows as a new segment (not listed in the manifest yet), through a temporary directory renamed atomically
+
+        Returns:
+            Dict: The entry of the segment in the manifest
+        """
+        name = f"segment_{manifest['next_segment']:06d}"
+        manifest['next_segment'] += 1
+        path = self._segment_path(name)
+        tmp_path = f'{path}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for column, values in arrays.items():
+            np.save(os.path.join(tmp_path, f'{column}.npy'), values)
+        os.rename(tmp_path, path)
+
+        dates = arrays['date']
+        return {'name': name, 'rows': len(dates), 'first': str(dates.min()), 'last': str(dates.max())}
+
+    def _publish(self, manifest: Dict):
+        """
+        Replace the manifest atomically, then delete the segments it no longer lists
+        (the readers open the segments under the lock, the memory maps already opened remain valid)
+        """
+        if len(manifest['segments']) > MAX_SEGMENTS:
+            arrays = self._read_segments(manifest['segments'])
+            manifest['segments'] = [self._write_segment(manifest, arrays)]
+        manifest['rows'] = sum(segment['rows'] for segment in manifest['segments'])
+
+        with open(f'{self._manifest_path}.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f'{self._manifest_path}.tmp', self._manifest_path)
+
+        listed = {segment['name'] for segment in manifest['segments']}
+        for name in os.listdir(self.root):
+            if name.startswith('segment_') and name not in listed:
+                shutil.rmtree(self._segment_path(name), ignore_errors=True)
+
+    def _read_segments(self, segments: List[Dict], from_date: str = None, to_date: str = None) -> Dict[str, np.ndarray]:
+        """
+        Read the rows of the segments between two dates (all of them if None), the segments out of the dates being skipped
+        """
+        start = np.datetime64(_day(from_date)) if from_date else None
+        end = np.datetime64(_day(to_date)) if to_date else None
+        parts = []
+        for segment in segments:
+            if (start is not None and np.datetime64(segment['last']) < start) or (end is not None and np.datetime64(segment['first']) > end):
+                continue
+            path = self._segment_path(segment['name'])
+            arrays = {column: np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r') for column in self.columns}
+            dates = arrays['date']
+            mask = np.ones(len(dates), dtype=bool)
+            if start is not None:
+                mask &= dates >= start
+            if end is not None:
+                mask &= dates <= end
+            parts.append({column: values[mask] for column, values in arrays.items()})
+
+        if not parts:
+            return {}
+
+        return {column: np.concatenate([part[column] for part in parts]) for column in self.columns}
+
+    def _encode(self, manifest: Dict, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """
+        Convert fetched matches to the stored arrays, extending the categories of the manifest if needed
+        """
+        arrays = {}
+        for column in self.columns:
+            values = df[column]
+            if column == 'date':
+                arrays[column] = pd.to_datetime(values).to_numpy(dtype='datetime64[D]')
+            elif column in self.category_columns:
+                categories = manifest['categories'].setdefault(column, [])
+                index = {category: i for i, category in enumerate(categories)}
+                for value in values.dropna().unique():
+                    if value not in index:
+                        index[value] = len(categories)
+                        categories.append(value)
+                arrays[column] = values.map(index).fillna(-1).to_numpy(dtype=np.int32)
+            else:
+                arrays[column] = pd.to_numeric(values).to_numpy(dtype=np.float64, na_value=np.nan)
+
+        return arrays
+
+    def _decode(self, manifest: Dict, arrays: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """
+        Convert stored arrays back to matches
+        """
+        if not arrays:
+            return pd.DataFrame({column: [] for column in self.columns})
+
+        data = {}
+        for column in self.columns:
+            values = arrays[column]
+            if column == 'date':
+                values = values.astype('datetime64[ns]')
+            elif column in self.category_columns:
+                # Code -1 (NULL) picks the trailing None
+                categories = np.array(manifest['categories'].get(column, []) + [None], dtype=object)
+                values = categories[values]
+            data[column] = values
+
+        return pd.DataFrame(data)
+
+    def _fetch_missing(self, manifest: Dict, from_date: str, to_date: str) -> List[pd.DataFrame]:
+        """
+        Fetch the dates missing from the cache into a new segment, and publish it
+
+        Returns:
+            List[pd.DataFrame]: The matches fetched from today on, not stored
+        """
+        today = date.today()
+        fresh, new_arrays, new_ranges = [], [], []
+
+        for start, end in _subtract_ranges((from_date, to_date), manifest['ranges']):
+            logging.info(f'Fetching matches from {start} to {end} into {self.root}')
+            # Only the dates before today are final
+            last_final = min(_day(end), today - timedelta(days=1))
+
+            for chunk in self.fetch(start, end):
+                if chunk.empty:
+                    continue
+                final = pd.to_datetime(chunk['date']).dt.date <= last_final
+                if (~final).any():
+                    fresh.append(chunk.loc[~final, self.columns])
+                if final.any():
+                    new_arrays.append(self._encode(manifest, chunk.loc[final]))
+
+            if _day(start) <= last_final:
+                new_ranges.append((start, last_final.isoformat()))
+
+        if new_ranges:
+            if new_arrays:
+                # Only the new rows are written, the segments already held are kept as they are
+                arrays = {column: np.concatenate([a[column] for a in new_arrays]) for column in self.columns}
+                manifest['segments'].append(self._write_segment(manifest, arrays))
+            manifest['ranges'] = _merge_ranges(manifest['ranges'] + new_ranges)
+            self._publish(manifest)
+
+        return fresh
+
+    def load(self, from_date: str, to_date: str) -> pd.DataFrame:
+        """
+        Load the matches between two dates (both included), fetching the missing dates first
+
+        Returns:
+            pd.DataFrame: The matches, sorted by date
+        """
+        fresh = []
+        with self._locked(exclusive=False) as manifest:
+            complete = not _subtract_ranges((from_date, to_date), manifest['ranges'])
+            if complete:
+                stored = self._decode(manifest, self._read_segments(manifest['segments'], from_date, to_date))
+
+        if not complete:
+            # The manifest is read again under the exclusive lock: another process may have fetched the dates meanwhile
+            with self._locked(exclusive=True) as manifest:
+                fresh = self._fetch_missing(manifest, from_date, to_date)
+                stored = self._decode(manifest, self._read_segments(manifest['segments'], from_date, to_date))
+
+        if fresh:
+            fresh = [chunk.assign(date=pd.to_datetime(chunk['date'])) for chunk in fresh]
+            stored = pd.concat(([stored] if len(stored) else []) + fresh, ignore_index=True)
+
+        return stored.sort_values('date', kind='stable', ignore_index=True)
+
+    def ranges(self) -> List[DateRange]:
+        """
+        Get the date ranges held by the cache
+        """
+        with self._locked(exclusive=False) as manifest:
+            return list(map(tuple, manifest['ranges']))
+
+    def invalidate(self):
+        """
+        Drop all the cached matches
+        """
+        with self._locked(exclusive=True) as manifest:
+            manifest.update(ranges=[], categories={}, segments=[])
+            self._publish(manifest)
+
+    def refresh(self, from_date: str, to_date: str) -> pd.DataFrame:
+        """
+        Drop the cached matches between two dates, then fetch them again
+        """
+        start, end = np.datetime64(_day(from_date)), np.datetime64(_day(to_date))
+        with self._locked(exclusive=True) as manifest:
+            segments = []
+            for segment in manifest['segments']:
+                if np.datetime64(segment['last']) < start or np.datetime64(segment['first']) > end:
+                    segments.append(segment)
+                    continue
+
+                # The segments holding some of the dates are written again without them
+                arrays = self._read_segments([segment])
+                keep = (arrays['date'] < start) | (arrays['date'] > end)
+                if keep.any():
+                    segments.append(self._write_segment(manifest, {column: values[keep] for column, values in arrays.items()}))
+
+            manifest['segments'] = segments
+            manifest['ranges'] = [
+                remaining
+                for range_start, range_end in manifest['ranges']
+                for remaining in _subtract_ranges((range_start, range_end), [(from_date, to_date)])
+            ]
+            self._publish(manifest)
+
+        return self.load(from_date, to_date)
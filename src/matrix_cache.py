@@ -0,0 +1,220 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+
+class MatrixCache:
+    """
+    Content-addressed store of prepared training matrices (pairwise data, encoded arrays)
+
+    Each matrix is stored in its own directory, named after its key: one NumPy
+    file per column (or per array), read back through memory maps, and a JSON manifest.
+    Text columns are stored encoded, as int32 codes (-1 for NULL) whose categories are
+    listed in the manifest. Entries are immutable: a matrix is written into a
+    temporary directory renamed atomically once complete.
+
+    When the total size exceeds `max_bytes`, the least recently used entries are evicted.
+    """
+    def __init__(self, root: str, max_bytes: Optional[int] = None):
+        """
+        Args:
+            root (str): Directory of the store
+            max_bytes (int): Maximum total size of the stored matrices, unbounded if None
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    @staticmethod
+    def key(**parts: Any) -> str:
+        """
+        Build the key of a matrix from what it depends on (JSON-serializable values)
+        """
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _read(self, key: str) -> Optional[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+        """
+        Read the manifest and memory-map the arrays of an entry, counting the hit or miss
+
+        Returns:
+            Tuple[Dict[str, Any], Dict[str, np.ndarray]]: The manifest and the arrays by file name, None if not stored
+        """
+        path = self._path(key)
+        manifest_path = os.path.join(path, 'manifest.json')
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            # The entries of the first layout hold the columns of a matrix only
+            files = manifest.get('files') or [str(i) for i in range(len(manifest['columns']))]
+            arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r').view(np.ndarray) for name in files}
+            # Record the use, for the eviction
+            os.utime(manifest_path)
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self._stats["hits"] += 1
+
+        return manifest, arrays
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        Get a stored matrix, its numerical columns being the memory-mapped arrays (read-only, not copied)
+
+        Returns:
+            pd.DataFrame: The matrix, None if it is not stored
+        """
+        stored = self._read(key)
+        if stored is None:
+            return None
+
+        manifest, arrays = stored
+        data = {}
+        for i, column in enumerate(manifest['columns']):
+            values = arrays[str(i)]
+            categories = manifest['categories'].get(column)
+            if categories is not None:
+                # Code -1 (NULL) picks the trailing None
+                values = np.array(categories + [None], dtype=object)[values]
+            data[column] = values
+
+        # Without copy, the columns are not consolidated into blocks
+        return pd.DataFrame(data, index=pd.RangeIndex(manifest['rows']), copy=False)
+
+    def get_arrays(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Get stored arrays, memory-mapped (read-only)
+
+        Returns:
+            Dict[str, np.ndarray]: The arrays by name, None if they are not stored
+        """
+        stored = self._read(key)
+        return None if stored is None else stored[1]
+
+    def put(self, key: str, df: pd.DataFrame, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Store a matrix, then evict the least recently used ones beyond the size limit
+
+        Args:
+            key (str): The key of the matrix (see `key`)
+            df (pd.DataFrame): The matrix, its index is not kept
+            metadata (Dict[str, Any]): Information recorded in the manifest (JSON-serializable)
+        """
+        manifest = {'columns': list(df.columns), 'rows': len(df), 'categories': {}}
+        arrays = {}
+        for i, column in enumerate(df.columns):
+            values = df[column].to_numpy()
+            if values.dtype == object:
+                codes, categories = pd.factorize(values, use_na_sentinel=True)
+                manifest['categories'][column] = categories.tolist()
+                values = codes.astype(np.int32)
+            arrays[str(i)] = values
+
+        self._write(key, arrays, manifest, metadata)
+
+    def put_arrays(self, key: str, arrays: Dict[str, np.ndarray], metadata: Optional[Dict[str, Any]] = None):
+        """
+        Store arrays (e.g. encoded features), then evict the least recently used entries beyond the size limit
+
+        Args:
+            key (str): The key of the arrays (see `key`)
+            arrays (Dict[str, np.ndarray]): The arrays by name, of numerical types
+            metadata (Dict[str, Any]): Information recorded in the manifest (JSON-serializable)
+        """
+        self._write(key, arrays, {}, metadata)
+
+    def _write(self, key: str, arrays: Dict[str, np.ndarray], manifest: Dict[str, Any], metadata: Optional[Dict[str, Any]]):
+        """
+        Write an entry into a temporary directory, renamed once complete
+        """
+        manifest = {**manifest, 'files': list(arrays), 'metadata': metadata or {}}
+        tmp_path = os.path.join(self.root, f'.{key}.{uuid.uuid4().hex}.tmp')
+        os.makedirs(tmp_path)
+        try:
+            for name, values in arrays.items():
+                with open(os.path.join(tmp_path, f'{name}.npy'), 'wb') as f:
+                    np.save(f, values, allow_pickle=False)
+
+            with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f)
+
+            try:
+                os.rename(tmp_path, self._path(key))
+            except OSError:
+                # Stored by another process in the meantime, with the same content
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self._stats["writes"] += 1
+        self._evict()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        List the stored matrices, the least recently used first
+        """
+        entries = []
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return entries
+
+        for name in names:
+            path = self._path(name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                last_used = os.stat(os.path.join(path, 'manifest.json')).st_mtime
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+            except FileNotFoundError:
+                continue
+            entries.append({"key": name, "bytes": size, "last_used": last_used})
+
+        return sorted(entries, key=lambda entry: entry["last_used"])
+
+    def _evict(self):
+        """
+        Remove the least recently used matrices until the total size fits
+        """
+        if self.max_bytes is None:
+            return
+
+        entries = self.entries()
+        total = sum(entry["bytes"] for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            logging.info(f'Evicting training matrix {entry["key"]} ({entry["bytes"]} bytes)')
+            shutil.rmtree(self._path(entry["key"]), ignore_errors=True)
+            total -= entry["bytes"]
+            with self._lock:
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        """
+        Remove all the stored matrices
+        """
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the usage counters and the size of the store
+        """
+        entries = self.entries()
+        with self._lock:
+            return {**self._stats, "entries": len(entries), "bytes": sum(entry["bytes"] for entry in entries)}
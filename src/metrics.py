@@ -0,0 +1,190 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# Default buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+# A sample of a collected metric: its labels and value
+Sample = Tuple[Dict[str, str], float]
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels
+    """
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+class Histogram:
+    """
+    Distribution of observed values (typically durations) over fixed buckets, optionally split by labels
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Per labels: count of each bucket (non cumulative, the last one being +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, count: int = 1, **labels: str):
+        """
+        Observe a value, `count` times (e.g. once per prediction of a batch)
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += count
+            total[0] += value * count
+
+    @contextmanager
+    def time(self, **labels: str):
+        """
+        Observe the duration of the block
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': _format_value(float(bound))}, cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+class Registry:
+    """
+    Set of metrics rendered in the Prometheus text format.
+
+    Besides the metrics updated on the fly, collectors are called at render time
+    to expose statistics kept elsewhere (caches, pools...).
+    """
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]):
+        """
+        Add a function returning (name, type, help, samples) tuples at render time
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render all the metrics in the Prometheus text format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        for collector in collectors:
+            try:
+                collected = list(collector())
+            except Exception:
+                continue
+            for name, type, help, samples in collected:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+predict_stage_seconds = registry.histogram(
+    'tennis_predict_stage_seconds',
+    'Duration of the stages of a prediction (resolve, build, score, log)',
+    ['stage'])
+predict_requests = registry.counter(
+    'tennis_predict_requests_total',
+    'Number of predictions, per model and version',
+    ['model', 'version'])
+db_query_seconds = registry.histogram(
+    'tennis_db_query_seconds',
+    'Duration of the database queries',
+    ['query'])
+job_duration_seconds = registry.histogram(
+    'tennis_job_duration_seconds',
+    'Duration of the training jobs',
+    ['name', 'status'])
+shadow_seconds = registry.histogram(
+    'tennis_shadow_seconds',
+    'Duration of the scoring of a match by a shadow model',
+    ['model', 'version'])
+shadow_predictions = registry.counter(
+    'tennis_shadow_predictions_total',
+    'Number of matches scored by a shadow model',
+    ['model', 'version'])
+shadow_disagreements = registry.counter(
+    'tennis_shadow_disagreements_total',
+    'Number of matches a shadow model predicted differently from the model which answered',
+    ['model', 'version'])
+shadow_errors = registry.counter(
+    'tennis_shadow_errors_total',
+    'Number of matches a shadow model could not score',
+    ['model', 'version'])
+shadow_dropped = registry.counter(
+    'tennis_shadow_dropped_total',
+    'Number of matches not sent to the shadow models, too many being pending')
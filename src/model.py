@@ -1,63 +1,137 @@
 import os
 import time
-import joblib
+import pickle
+import hashlib
+import shutil
+import weakref
+import tempfile
 import logging
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from typing import Literal, Any, Tuple, Dict, List
-import mlflow
-from mlflow.models import infer_signature
-from mlflow.tracking import MlflowClient
-from sklearn.model_selection import train_test_split
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.compose import ColumnTransformer
-from sklearn.linear_model import LogisticRegression
-from sklearn.pipeline import Pipeline
-from sklearn.metrics import accuracy_score, roc_auc_score, confusion_matrix
-
-from src.sql import load_matches_from_postgres
+from typing import Literal, Any, Tuple, Dict, Hashable, List, Iterator, Optional, TYPE_CHECKING
+
+from src.sql import load_matches_from_postgres, iter_matches_from_postgres, get_data_version, MATCH_CACHE_DIR
 from src.enums import Feature
+from src.elo import add_elo_ratings, ratings_before, ELO_COLUMNS, RATING_COLUMNS
+from src.scorer import get_scorer
+from src.model_cache import ModelCache, LocalModelFile
+from src.matrix_cache import MatrixCache
+from src.metrics import registry, predict_stage_seconds
+
+# MLflow, joblib and scikit-learn are imported on first use, so that importing
+# this module for predictions stays fast (scikit-learn is loaded with the models)
+if TYPE_CHECKING:
+    from mlflow.tracking import MlflowClient
+    from sklearn.pipeline import Pipeline
 
 load_dotenv()
 
-models = {}
+LOCAL_MODEL_PATH = '/data/model.pkl'
+# Number of matches fetched at a time when loading training data, 0 to fetch them all at once
+FETCH_CHUNK_SIZE = int(os.getenv("PG_FETCH_CHUNK_SIZE", 50_000))
+# Whether each prediction is logged at the info level, better disabled under heavy traffic
+PREDICT_LOG = os.getenv("PREDICT_LOG", "true").lower() in ("1", "true", "yes")
+
+# Store of the prepared training matrices, disabled if TRAINING_CACHE_DIR is not set
+TRAINING_CACHE_DIR = os.getenv("TRAINING_CACHE_DIR")
+training_cache = MatrixCache(
+    TRAINING_CACHE_DIR,
+    max_bytes=int(os.getenv("TRAINING_CACHE_MAX_BYTES", 2 * 1024**3)) or None) if TRAINING_CACHE_DIR else None
+# Version of the layout of the pairwise data, to bump when `create_pairwise_data` changes
+PAIRWISE_DATA_FORMAT = 3
+
+def _interleave(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Interleave two arrays of the same length: first[0], second[0], first[1], second[1]...
+    """
+    out = np.empty(2 * len(first), dtype=np.result_type(first, second))
+    out[0::2] = first
+    out[1::2] = second
+    return out
+
+def _pairwise_block(df: pd.DataFrame, start: int = 0) -> pd.DataFrame:
+    """
+    Build the pairwise rows of a block of matches, the index starting at `start`
+    """
+    # Record 1 : original order (winner in position 1, loser in position 2)
+    # Record 2 : invert players
+    data = {}
+    for feature in Feature.get_all_features():
+        if feature.type == 'category':
+            data[feature.name] = np.repeat(df[feature.columns[0]].to_numpy(), 2)
+            continue
+
+        # Difference winner - loser, NaN (imputed by the pipeline) if the columns are missing
+        w_column, l_column = feature.columns
+        if w_column in df.columns and l_column in df.columns:
+            diff = (df[w_column] - df[l_column]).to_numpy()
+        else:
+            diff = np.full(len(df), np.nan)
+        data[feature.name] = _interleave(diff, -diff)
+
+    data['target'] = np.tile(np.array([1, 0], dtype=np.int64), len(df)) # Player in first position won, then lost
+
+    return pd.DataFrame(data, index=pd.RangeIndex(start, start + 2 * len(df)))
+
+def _with_ratings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the Elo ratings to matches without them, from the start (see `add_elo_ratings`) if the players are known
+    """
+    if all(column in df.columns for column in RATING_COLUMNS) or not all(column in df.columns for column in ELO_COLUMNS):
+        return df
+
+    return add_elo_ratings(df)
 
 def create_pairwise_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Creates a balanced dataset with pairwise comparisons
+
+    Each match gives two consecutive rows: the winner in first position (target 1),
+    then the same match with the players inverted (target 0).
+
+    The Elo ratings of the players before each match are taken from the matches (see `add_elo_ratings`),
+    computed from these matches only if missing, NaN if the players are missing too.
     """
-    records = []
-    for _, row in df.iterrows():
-        # Record 1 : original order (winner in position 1, loser in position 2)
-        record_1 = {
-            Feature.SERIES.name: row['series'],
-            Feature.SURFACE.name: row['surface'],
-            Feature.COURT.name: row['court'],
-            Feature.ROUND.name: row['round'],
-            Feature.DIFF_RANKING.name: row['w_rank'] - row['l_rank'], # rank difference
-            Feature.DIFF_POINTS.name: row['w_points'] - row['l_points'], # points difference
-            'target': 1 # Player in first position won
-        }
+    if df.empty:
+        return pd.DataFrame()
 
-        # Record 2 : invert players
-        record_2 = record_1.copy()
-        record_2[Feature.DIFF_RANKING.name] = -record_2['diffRanking'] # Invert the ranking difference
-        record_2[Feature.DIFF_POINTS.name] = -record_2['diffPoints'] # Invert the points difference
-        record_2['target'] = 0 # Player in first position lost
+    return _pairwise_block(_with_ratings(df))
 
-        records.append(record_1)
-        records.append(record_2)
-    
-    return pd.DataFrame(records)
+def iter_pairwise_data(df: pd.DataFrame, chunk_size: int = 100_000) -> Iterator[pd.DataFrame]:
+    """
+    Same as `create_pairwise_data`, but yields the output in blocks
 
-def create_pipeline() -> Pipeline:
+    Args:
+        df (pd.DataFrame): The matches
+        chunk_size (int): Number of matches per block (each block holds 2 * chunk_size rows)
+
+    Yields:
+        pd.DataFrame: Consecutive blocks, their concatenation equals `create_pairwise_data(df)`
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be a positive integer")
+
+    df = _with_ratings(df)
+    for offset in range(0, len(df), chunk_size):
+        yield _pairwise_block(df.iloc[offset:offset + chunk_size], start=2 * offset)
+
+def create_pipeline(classifier: Any = None) -> 'Pipeline':
     """
     Creates a machine learning pipeline with SimpleImputer, StandardScaler, OneHotEncoder and LogisticRegression.
 
+    Args:
+        classifier: The classifier, LogisticRegression if None
+
     Returns:
         Pipeline: A scikit-learn pipeline object.
     """
+    from sklearn.impute import SimpleImputer
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+    from sklearn.compose import ColumnTransformer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+
     # Define the features, numerical and categorical
     cat_features = [f.name for f in Feature.get_features_by_type('category')]
     num_features = [f.name for f in Feature.get_features_by_type('number')]
@@ -82,34 +156,114 @@ def create_pipeline() -> Pipeline:
     # Full pipeline
     pipeline = Pipeline(steps=[
         ('preprocessor', preprocessor),
-        ('classifier', LogisticRegression(solver='lbfgs', max_iter=1000))
+        ('classifier', classifier if classifier is not None else LogisticRegression(solver='lbfgs', max_iter=1000))
     ])
 
     return pipeline
 
+def create_incremental_pipeline() -> 'Pipeline':
+    """
+    Creates a pipeline which can be updated with new matches (see `partial_fit_pipeline`),
+    the classifier being a logistic regression trained by stochastic gradient descent
+    """
+    from sklearn.linear_model import SGDClassifier
+
+    # A constant learning rate keeps the updates with new matches as significant as the first ones
+    pipeline = create_pipeline(SGDClassifier(loss='log_loss', learning_rate='constant', eta0=0.01, random_state=0))
+    # The features without any value yet are kept, the scaler being fitted on all of them
+    pipeline.set_params(preprocessor__num__imputer__keep_empty_features=True)
+    return pipeline
+
+def partial_fit_pipeline(
+        pipeline: 'Pipeline',
+        X: pd.DataFrame,
+        y: pd.Series,
+        epochs: int = 5,
+        random_state: int = 0) -> 'Pipeline':
+    """
+    Update a pipeline created by `create_incremental_pipeline` with new data
+
+    On the first call, the preprocessing is fitted, fixing the categories of the
+    OneHotEncoder (unknown categories are ignored afterwards). On the next calls, the
+    statistics of the StandardScaler (and the means imputed) are updated with the new
+    data only, then the classifier runs `epochs` shuffled passes over the new data.
+
+    Args:
+        pipeline (Pipeline): The pipeline, updated in place
+        X (pd.DataFrame): The new features
+        y (pd.Series): The new target
+        epochs (int): Number of passes of the classifier over the new data
+        random_state (int): Seed of the shuffling
+
+    Returns:
+        Pipeline: The updated pipeline
+    """
+    preprocessor = pipeline.named_steps['preprocessor']
+    classifier = pipeline.named_steps['classifier']
+    num_features = [f.name for f in Feature.get_features_by_type('number')]
+    numbers = X[num_features].to_numpy(dtype=np.float64)
+
+    # A feature without any value gives NaN statistics (0 / 0), handled below
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if not hasattr(preprocessor, 'transformers_'):
+            preprocessor.fit(X)
+            # Fit the scaler on the raw numbers (NaN are ignored), as on the next updates
+            preprocessor.named_transformers_['num'].named_steps['scaler'].fit(numbers)
+        else:
+            preprocessor.named_transformers_['num'].named_steps['scaler'].partial_fit(numbers)
+
+    # The features without any value seen yet are left as they are (0 once imputed),
+    # their statistics being those of the first values seen on the next updates
+    scaler = preprocessor.named_transformers_['num'].named_steps['scaler']
+    unseen = np.isnan(scaler.mean_)
+    scaler.mean_[unseen], scaler.var_[unseen], scaler.scale_[unseen] = 0.0, 0.0, 1.0
+
+    # The missing numbers are imputed with the mean of all the data seen
+    imputer = preprocessor.named_transformers_['num'].named_steps['imputer']
+    if len(imputer.statistics_) != len(scaler.mean_):
+        raise ValueError(f"The imputer holds {len(imputer.statistics_)} features, the scaler {len(scaler.mean_)}")
+    imputer.statistics_ = scaler.mean_.copy()
+
+    X_encoded = preprocessor.transform(X)
+    y = np.asarray(y)
+    rng = np.random.default_rng(random_state)
+    for _ in range(epochs):
+        order = rng.permutation(len(y))
+        classifier.partial_fit(X_encoded[order], y[order], classes=np.array([0, 1]))
+
+    return pipeline
+
 def train_model_from_scratch(
         circuit: Literal['atp', 'wta'],
         from_date: str,
         to_date: str,
-        output_path: str = '/data/model.pkl') -> Pipeline:
+        output_path: str = LOCAL_MODEL_PATH) -> 'Pipeline':
     """
     Train a model from scratch
     """
     # Load data
-    data = load_matches_from_postgres(
-        table_name=f"{circuit}_data",
-        from_date=from_date,
-        to_date=to_date)
+    X_train, _, y_train, _ = split_data(load_pairwise_data(circuit, from_date, to_date))
 
     # Train the model
-    pipeline = create_and_train_model(data)
+    pipeline = create_pipeline()
+    pipeline = train_model(pipeline, X_train, y_train)
 
-    # Save the model
-    joblib.dump(pipeline, output_path)
+    # Save the model in a temporary file first, then rename it atomically,
+    # so that readers never see a half-written file
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.NamedTemporaryFile(dir=output_dir, suffix='.tmp', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        import joblib
+        joblib.dump(pipeline, tmp_path)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
 
     return pipeline
 
-def create_and_train_model(data: pd.DataFrame) -> Pipeline:
+def create_and_train_model(data: pd.DataFrame) -> 'Pipeline':
     """
     Create and train a model on the given data
     """
@@ -123,52 +277,309 @@ def create_and_train_model(data: pd.DataFrame) -> Pipeline:
     return pipeline
 
 def train_model(
-        pipeline: Pipeline,
+        pipeline: 'Pipeline',
         X_train: pd.DataFrame,
-        y_train: pd.DataFrame) -> Pipeline:
+        y_train: pd.DataFrame) -> 'Pipeline':
     """
     Train the pipeline
     """
     pipeline.fit(X_train, y_train)
     return pipeline
 
-def preprocess_data(df: pd.DataFrame) -> Tuple:
+def load_pairwise_data(
+        circuit: Literal['atp', 'wta'],
+        from_date: str,
+        to_date: str,
+        chunk_size: int = None) -> pd.DataFrame:
     """
-    Split the dataframe into X (features) and y (target).
+    Load the matches of a circuit and format them for the model (see `create_pairwise_data`)
 
     Args:
-        df (pd.DataFrame): Input dataframe.
+        circuit (str): The circuit
+        from_date (str): First date (YYYY-MM-DD) included
+        to_date (str): Last date (YYYY-MM-DD) included
+        chunk_size (int): Number of matches fetched at a time through a server-side cursor,
+            defaults to PG_FETCH_CHUNK_SIZE; 0 to fetch them all at once.
+            Not used when the local match cache is enabled (MATCH_CACHE_DIR).
+
+    The Elo ratings of the players are computed in one chronological pass over the matches
+    up to `to_date`, starting from the latest ratings saved before `from_date` (see `ratings_before`).
+
+    The pairwise data is reused from the training cache (TRAINING_CACHE_DIR) as long as
+    the matches (all of them up to `to_date`, for the ratings), the features and the format
+    of the pairwise data are unchanged.
 
     Returns:
-        Tuple: Split data (X_train, X_test, y_train, y_test).
+        pd.DataFrame: The pairwise data
     """
-    # Format data for the model
-    df_model = create_pairwise_data(df)
+    if training_cache is None:
+        return _load_pairwise_data(circuit, from_date, to_date, chunk_size)
+
+    return _get_pairwise_data(_pairwise_data_key(circuit, from_date, to_date), circuit, from_date, to_date, chunk_size)
+
+def _pairwise_data_key(circuit: Literal['atp', 'wta'], from_date: str, to_date: str) -> str:
+    """
+    Key of the pairwise data of a circuit in the training cache
+    """
+    return _training_matrix_key(
+        circuit=circuit,
+        from_date=from_date,
+        to_date=to_date,
+        data_version=get_data_version(f"{circuit}_data", None, to_date))
+
+def _get_pairwise_data(
+        key: str,
+        circuit: Literal['atp', 'wta'],
+        from_date: str,
+        to_date: str,
+        chunk_size: int = None) -> pd.DataFrame:
+    """
+    Get the pairwise data from the training cache, prepared and stored if missing
+    """
+    df_model = training_cache.get(key)
+    if df_model is None:
+        df_model = _load_pairwise_data(circuit, from_date, to_date, chunk_size)
+        if not df_model.empty:
+            _store_training_matrix(key, df_model, {"circuit": circuit, "from_date": from_date, "to_date": to_date})
+    else:
+        logging.info(f"Pairwise data of {circuit} from {from_date} to {to_date} loaded from the training cache")
+
+    return df_model
+
+def _load_pairwise_data(
+        circuit: Literal['atp', 'wta'],
+        from_date: str,
+        to_date: str,
+        chunk_size: int = None) -> pd.DataFrame:
+    """
+    Same as `load_pairwise_data`, without the training cache
+    """
+    if chunk_size is None:
+        chunk_size = FETCH_CHUNK_SIZE
+
+    elo = ratings_before(circuit, from_date)
+
+    if not chunk_size or MATCH_CACHE_DIR:
+        return create_pairwise_data(add_elo_ratings(load_matches_from_postgres(
+            table_name=f"{circuit}_data",
+            from_date=from_date,
+            to_date=to_date), elo))
 
+    # Only the (smaller) pairwise chunks are kept, the raw matches are released chunk by chunk
+    # (they come in chronological order, the ratings being updated chunk after chunk)
+    chunks = [
+        create_pairwise_data(add_elo_ratings(chunk, elo))
+        for chunk in iter_matches_from_postgres(
+            table_name=f"{circuit}_data",
+            from_date=from_date,
+            to_date=to_date,
+            chunk_size=chunk_size)
+    ]
+    if not chunks:
+        return pd.DataFrame()
+
+    return pd.concat(chunks, ignore_index=True)
+
+def _training_matrix_key(**parts) -> str:
+    """
+    Key of a matrix of the training cache, depending on the features and the layout of the pairwise data too
+    """
+    return MatrixCache.key(
+        features=[[f.name, f.type] for f in Feature.get_all_features()],
+        format=PAIRWISE_DATA_FORMAT,
+        **parts)
+
+def _store_training_matrix(key: str, data: Any, metadata: Dict[str, Any]):
+    """
+    Store a matrix (DataFrame) or arrays (dict) in the training cache, a failure only being logged
+    """
+    try:
+        if isinstance(data, pd.DataFrame):
+            training_cache.put(key, data, metadata)
+        else:
+            training_cache.put_arrays(key, data, metadata)
+    except (OSError, TypeError, ValueError) as e:
+        logging.warning(f"Could not store the training data in the training cache: {e}")
+
+def _encode_matrix(name: str, matrix: Any) -> Dict[str, np.ndarray]:
+    """
+    Get the arrays of an encoded matrix, dense or sparse (CSR), to store them
+    """
+    import scipy.sparse
+
+    if not scipy.sparse.issparse(matrix):
+        return {name: np.asarray(matrix)}
+
+    matrix = scipy.sparse.csr_matrix(matrix)
+    return {
+        f'{name}_data': matrix.data,
+        f'{name}_indices': matrix.indices,
+        f'{name}_indptr': matrix.indptr,
+        f'{name}_shape': np.array(matrix.shape),
+    }
+
+def _decode_matrix(name: str, arrays: Dict[str, np.ndarray]) -> Any:
+    """
+    Build an encoded matrix back from its stored arrays (see `_encode_matrix`), without copying them
+    """
+    import scipy.sparse
+
+    if name in arrays:
+        return arrays[name]
+
+    return scipy.sparse.csr_matrix(
+        (arrays[f'{name}_data'], arrays[f'{name}_indices'], arrays[f'{name}_indptr']),
+        shape=tuple(arrays[f'{name}_shape']))
+
+def load_encoded_data(
+        circuit: Literal['atp', 'wta'],
+        from_date: str,
+        to_date: str) -> Tuple:
+    """
+    Load the pairwise data of a circuit (see `load_pairwise_data`), split it, and encode the training part
+    with the preprocessor of `create_pipeline`, fitted on it
+
+    With the training cache (TRAINING_CACHE_DIR), the split, the fitted preprocessor and the encoded
+    training features are stored along with the pairwise data, so that only the classifier is fitted
+    again by the next experiments on the same data.
+
+    Returns:
+        Tuple: X_train, X_test, y_train, y_test, the fitted preprocessor and the encoded X_train
+    """
+    import sklearn
+
+    preprocessor = create_pipeline().named_steps['preprocessor']
+    if training_cache is None:
+        X_train, X_test, y_train, y_test = split_data(load_pairwise_data(circuit, from_date, to_date))
+        return X_train, X_test, y_train, y_test, preprocessor, preprocessor.fit_transform(X_train)
+
+    pairwise_key = _pairwise_data_key(circuit, from_date, to_date)
+    df_model = _get_pairwise_data(pairwise_key, circuit, from_date, to_date)
+    key = MatrixCache.key(pairwise_data=pairwise_key, preprocessor=repr(preprocessor), sklearn=sklearn.__version__)
+    arrays = training_cache.get_arrays(key)
+    if arrays is None:
+        X_train, X_test, y_train, y_test = split_data(df_model)
+        encoded_train = preprocessor.fit_transform(X_train)
+        _store_training_matrix(key, {
+            'train_index': df_model.index.get_indexer(X_train.index),
+            'test_index': df_model.index.get_indexer(X_test.index),
+            'preprocessor': np.frombuffer(pickle.dumps(preprocessor), dtype=np.uint8),
+            **_encode_matrix('train', encoded_train),
+        }, {"circuit": circuit, "from_date": from_date, "to_date": to_date})
+        return X_train, X_test, y_train, y_test, preprocessor, encoded_train
+
+    logging.info(f"Encoded data of {circuit} from {from_date} to {to_date} loaded from the training cache")
+    X = df_model[[f.name for f in Feature.get_all_features()]]
+    y = df_model['target']
+    train, test = arrays['train_index'], arrays['test_index']
+    preprocessor = pickle.loads(arrays['preprocessor'].tobytes())
+
+    return X.iloc[train], X.iloc[test], y.iloc[train], y.iloc[test], preprocessor, _decode_matrix('train', arrays)
+
+def split_data(df_model: pd.DataFrame) -> Tuple:
+    """
+    Split the pairwise data into X (features) and y (target).
+
+    Args:
+        df_model (pd.DataFrame): Pairwise data (see `create_pairwise_data`).
+
+    Returns:
+        Tuple: Split data (X_train, X_test, y_train, y_test).
+    """
     features = [f.name for f in Feature.get_all_features()]
     X = df_model[features]
     y = df_model['target']
 
     # Split the data
+    from sklearn.model_selection import train_test_split
     return train_test_split(X, y, test_size=0.2)
 
-def evaluate_model(pipeline: Pipeline, X_test: pd.DataFrame, y_test: pd.Series) -> Dict:
+def preprocess_data(df: pd.DataFrame) -> Tuple:
+    """
+    Split the dataframe into X (features) and y (target).
+
+    Args:
+        df (pd.DataFrame): Input dataframe.
+
+    Returns:
+        Tuple: Split data (X_train, X_test, y_train, y_test).
+    """
+    if training_cache is None or df.empty:
+        # Format data for the model
+        return split_data(create_pairwise_data(df))
+
+    # The pairwise data is addressed by the content of the matches
+    content = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    key = _training_matrix_key(matches=hashlib.sha256(content.tobytes()).hexdigest(), columns=list(df.columns))
+    df_model = training_cache.get(key)
+    if df_model is None:
+        df_model = create_pairwise_data(df)
+        _store_training_matrix(key, df_model, {"matches": len(df)})
+
+    return split_data(df_model)
+
+def evaluate_model(pipeline: 'Pipeline', X_test: pd.DataFrame, y_test: pd.Series, n_bins: int = 10) -> Dict:
     """
     Evaluates the model
+
+    Besides the accuracy, ROC AUC and confusion matrix, the log-loss and Brier score measure
+    the quality of the probabilities, and the calibration compares, per bin of predicted
+    probability, the mean probability with the observed frequency of victories.
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        X_test (pd.DataFrame): The features
+        y_test (pd.Series): The target
+        n_bins (int): Number of bins of the calibration, of equal width
+
+    Returns:
+        Dict: The metrics
     """
+    from sklearn.metrics import accuracy_score, roc_auc_score, confusion_matrix, log_loss, brier_score_loss
+
     y_pred = pipeline.predict(X_test)
+    proba = pipeline.predict_proba(X_test)[:, 1]
+    y_true = np.asarray(y_test)
     accuracy = accuracy_score(y_test, y_pred)
-    roc_auc = roc_auc_score(y_test, pipeline.predict_proba(X_test)[:, 1])
+    roc_auc = roc_auc_score(y_test, proba)
     cm = confusion_matrix(y_test, y_pred)
 
+    # Calibration per bin of predicted probability, the empty bins being left out
+    bins = np.minimum((proba * n_bins).astype(int), n_bins - 1)
+    counts = np.bincount(bins, minlength=n_bins)
+    mean_predicted = np.bincount(bins, weights=proba, minlength=n_bins)
+    positives = np.bincount(bins, weights=y_true, minlength=n_bins)
+    calibration = [
+        {
+            "bin_start": i / n_bins,
+            "bin_end": (i + 1) / n_bins,
+            "count": int(counts[i]),
+            "mean_predicted": float(mean_predicted[i] / counts[i]),
+            "fraction_positive": float(positives[i] / counts[i]),
+        }
+        for i in np.flatnonzero(counts)
+    ]
+    expected_calibration_error = sum(
+        b["count"] * abs(b["mean_predicted"] - b["fraction_positive"]) for b in calibration) / len(proba)
+
     return {
         "accuracy": accuracy,
         "roc_auc": roc_auc,
+        "log_loss": log_loss(y_test, proba, labels=[0, 1]),
+        "brier_score": brier_score_loss(y_test, proba),
+        "expected_calibration_error": expected_calibration_error,
+        "calibration": calibration,
         "confusion_matrix": cm
     }
 
+def _difference(first: Any, second: Any) -> float:
+    """
+    Difference of two optional numbers, NaN if one is missing
+    """
+    return np.nan if first is None or second is None else first - second
+
 def predict(
-    pipeline: Pipeline,
+    pipeline: 'Pipeline',
     series: str,
     surface: str,
     court: str,
@@ -176,33 +587,339 @@ def predict(
     rank_player_1: int,
     rank_player_2: int,
     points_player_1: int,
-    points_player_2: int
+    points_player_2: int,
+    elo_player_1: float = None,
+    elo_player_2: float = None,
+    surface_elo_player_1: float = None,
+    surface_elo_player_2: float = None
 ) -> Dict[str, Any]:
+    start = time.perf_counter()
     diffRanking = rank_player_1 - rank_player_2
     diffPoints = points_player_1 - points_player_2
-    
-    # Built a DataFrame with the new match
-    new_match = pd.DataFrame([{
-        Feature.SERIES.name: series,
-        Feature.SURFACE.name: surface,
-        Feature.COURT.name: court,
-        Feature.ROUND.name: round_stage,
-        Feature.DIFF_RANKING.name: diffRanking,
-        Feature.DIFF_POINTS.name: diffPoints
-    }])
-
-    # Use the pipeline to make a prediction
-    prediction = pipeline.predict(new_match)[0]
-    proba = pipeline.predict_proba(new_match)[0]
+    # Unknown ratings are imputed by the pipeline
+    diffElo = _difference(elo_player_1, elo_player_2)
+    diffSurfaceElo = _difference(surface_elo_player_1, surface_elo_player_2)
+
+    features = {
+        Feature.SERIES.name: [series],
+        Feature.SURFACE.name: [surface],
+        Feature.COURT.name: [court],
+        Feature.ROUND.name: [round_stage],
+        Feature.DIFF_RANKING.name: [diffRanking],
+        Feature.DIFF_POINTS.name: [diffPoints],
+        Feature.DIFF_ELO.name: [diffElo],
+        Feature.DIFF_SURFACE_ELO.name: [diffSurfaceElo]
+    }
+
+    scorer = get_scorer(pipeline)
+    if scorer is not None:
+        built = time.perf_counter()
+
+        # Score straight from the compiled parameters
+        proba = scorer.predict_proba(features)[0]
+        prediction = scorer.classes_[proba.argmax()]
+    else:
+        # Built a DataFrame with the new match
+        new_match = pd.DataFrame(features)
+        built = time.perf_counter()
+
+        # Use the pipeline to make a prediction
+        prediction = pipeline.predict(new_match)[0]
+        proba = pipeline.predict_proba(new_match)[0]
+    scored = time.perf_counter()
 
     # Print the result
-    logging.info("\n--- 📊 Result ---")
-    logging.info(f"🏆 Win probability : {proba[1]:.2f}")
-    logging.info(f"❌ Lose probability : {proba[0]:.2f}")
-    logging.info(f"🎾 Prediction : {'Victory' if prediction == 1 else 'Loss'}")
+    if PREDICT_LOG:
+        logging.info("\n--- 📊 Result ---")
+        logging.info(f"🏆 Win probability : {proba[1]:.2f}")
+        logging.info(f"❌ Lose probability : {proba[0]:.2f}")
+        logging.info(f"🎾 Prediction : {'Victory' if prediction == 1 else 'Loss'}")
+
+    predict_stage_seconds.observe(built - start, stage='build')
+    predict_stage_seconds.observe(scored - built, stage='score')
+    predict_stage_seconds.observe(time.perf_counter() - scored, stage='log')
 
     return {"result": prediction.item(), "prob": [p.item() for p in proba]}
 
+def predict_proba_features(pipeline: 'Pipeline', features: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score matches given as columns of features, with the compiled scorer if the pipeline supports it
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        features (Dict[str, Any]): Values of each feature, keyed by `Feature.name`
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The probabilities of each class for each match, and the classes
+    """
+    scorer = get_scorer(pipeline)
+    if scorer is not None:
+        return scorer.predict_proba(features), scorer.classes_
+
+    return pipeline.predict_proba(pd.DataFrame(features)), pipeline.classes_
+
+def predict_batch(
+    pipeline: 'Pipeline',
+    matches: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Predict the outcome of several matches with a single call to the pipeline
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        matches (List[Dict[str, Any]]): The matches, each one holding the keyword arguments of `predict`
+            (series, surface, court, round_stage, rank_player_1, rank_player_2, points_player_1, points_player_2,
+            and optionally elo_player_1, elo_player_2, surface_elo_player_1, surface_elo_player_2)
+
+    Returns:
+        List[Dict[str, Any]]: One {"result", "prob"} dict per match, in input order
+
+    The stages are timed once per match, each one waiting for the whole batch, as with `predict`.
+    """
+    if not matches:
+        return []
+
+    start = time.perf_counter()
+    features = match_features(matches)
+    built = time.perf_counter()
+
+    # One call for the whole batch, the predicted class being the most probable one
+    probas, classes = predict_proba_features(pipeline, features)
+    scored = time.perf_counter()
+    predictions = _to_predictions(probas, classes)
+
+    predict_stage_seconds.observe(built - start, len(matches), stage='build')
+    predict_stage_seconds.observe(scored - built, len(matches), stage='score')
+    predict_stage_seconds.observe(time.perf_counter() - scored, len(matches), stage='log')
+
+    return predictions
+
+def _to_predictions(probas: np.ndarray, classes: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Format the probabilities of matches as predictions, the predicted class being the most probable one
+    """
+    predictions = classes[probas.argmax(axis=1)]
+
+    return [
+        {"result": prediction.item(), "prob": [p.item() for p in proba]}
+        for prediction, proba in zip(predictions, probas)
+    ]
+
+def match_features(matches: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Build the features of matches given as the keyword arguments of `predict`
+
+    Returns:
+        Dict[str, List[Any]]: Values of each feature, keyed by `Feature.name`
+    """
+    return {
+        Feature.SERIES.name: [m['series'] for m in matches],
+        Feature.SURFACE.name: [m['surface'] for m in matches],
+        Feature.COURT.name: [m['court'] for m in matches],
+        Feature.ROUND.name: [m['round_stage'] for m in matches],
+        Feature.DIFF_RANKING.name: [m['rank_player_1'] - m['rank_player_2'] for m in matches],
+        Feature.DIFF_POINTS.name: [m['points_player_1'] - m['points_player_2'] for m in matches],
+        Feature.DIFF_ELO.name: [_difference(m.get('elo_player_1'), m.get('elo_player_2')) for m in matches],
+        Feature.DIFF_SURFACE_ELO.name: [_difference(m.get('surface_elo_player_1'), m.get('surface_elo_player_2')) for m in matches],
+    }
+
+# Fingerprints of the fitted preprocessors of the pipelines already seen, None without preprocessor
+_preprocessor_fingerprints: 'weakref.WeakKeyDictionary[Pipeline, Optional[str]]' = weakref.WeakKeyDictionary()
+
+def preprocessor_fingerprint(pipeline: 'Pipeline') -> Optional[str]:
+    """
+    Get a hash of the fitted preprocessor of a pipeline (its first step, named 'preprocessor'),
+    computed on first use: pipelines with the same fingerprint encode the matches identically
+
+    Returns:
+        str: The fingerprint, None if the pipeline does not start with a preprocessor
+    """
+    try:
+        return _preprocessor_fingerprints[pipeline]
+    except (KeyError, TypeError):
+        pass
+
+    steps = getattr(pipeline, 'steps', None)
+    if not steps or len(steps) < 2 or steps[0][0] != 'preprocessor':
+        fingerprint = None
+    else:
+        import joblib
+        fingerprint = joblib.hash(steps[0][1])
+
+    try:
+        _preprocessor_fingerprints[pipeline] = fingerprint
+    except TypeError:
+        pass
+
+    return fingerprint
+
+def score_models(
+    pipelines: Dict[Hashable, 'Pipeline'],
+    matches: List[Dict[str, Any]]
+) -> Dict[Hashable, Dict[str, Any]]:
+    """
+    Predict the outcome of matches with several pipelines, the features being built once
+    and the matches encoded once per distinct preprocessor
+
+    A pipeline whose preprocessor is not shared with another one is scored on its own,
+    with its compiled scorer if supported.
+
+    Args:
+        pipelines (Dict[Hashable, Pipeline]): The fitted pipelines, by key (e.g. model and version)
+        matches (List[Dict[str, Any]]): The matches, as in `predict_batch`
+
+    Returns:
+        Dict[Hashable, Dict[str, Any]]: For each key, the "predictions" (see `predict_batch`) and the
+            "seconds" spent scoring them, including the encoding shared with the other pipelines
+    """
+    features = match_features(matches)
+    groups: Dict[Any, List[Hashable]] = {}
+    for key, pipeline in pipelines.items():
+        fingerprint = preprocessor_fingerprint(pipeline)
+        groups.setdefault(key if fingerprint is None else fingerprint, []).append(key)
+
+    frame = None
+    results = {}
+    for keys in groups.values():
+        first = pipelines[keys[0]]
+        start = time.perf_counter()
+        if len(keys) == 1:
+            probas, classes = predict_proba_features(first, features)
+            results[keys[0]] = {"predictions": _to_predictions(probas, classes), "seconds": time.perf_counter() - start}
+            continue
+
+        if frame is None:
+            frame = pd.DataFrame(features)
+        encoded = first[0].transform(frame)
+        encoding_seconds = time.perf_counter() - start
+
+        for key in keys:
+            start = time.perf_counter()
+            # Steps between the preprocessor and the classifier, if any, are not shared
+            probas = pipelines[key][1:].predict_proba(encoded)
+            results[key] = {
+                "predictions": _to_predictions(probas, pipelines[key].classes_),
+                "seconds": encoding_seconds + time.perf_counter() - start,
+            }
+
+    return results
+
+def create_search_space() -> List[Dict[str, List[Any]]]:
+    """
+    Candidates of the hyperparameter search: the classifier and its parameters,
+    as the `param_grid` of a GridSearchCV over a Pipeline with a 'classifier' step
+    """
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+
+    return [
+        {
+            'classifier': [LogisticRegression(max_iter=1000)],
+            'classifier__C': [0.01, 0.1, 1.0, 10.0],
+            'classifier__solver': ['lbfgs', 'liblinear', 'saga'],
+            'classifier__class_weight': [None, 'balanced'],
+        },
+        {
+            'classifier': [RandomForestClassifier(n_estimators=200, n_jobs=1, random_state=0)],
+            'classifier__max_depth': [8, 16],
+            'classifier__class_weight': [None, 'balanced'],
+        },
+        {
+            'classifier': [HistGradientBoostingClassifier(random_state=0)],
+            'classifier__learning_rate': [0.05, 0.1],
+            'classifier__max_depth': [None, 6],
+        },
+    ]
+
+def _format_params(params: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Format the parameters of a candidate for MLflow and JSON (the classifier by its class name)
+    """
+    return {
+        key.replace('classifier__', ''): type(value).__name__ if key == 'classifier' else str(value)
+        for key, value in params.items()
+    }
+
+def search_hyperparameters(
+        X_train: pd.DataFrame,
+        y_train: pd.Series,
+        cv: int = 5,
+        n_jobs: int = -1,
+        scoring: str = 'accuracy') -> Tuple['Pipeline', Dict[str, Any]]:
+    """
+    Cross-validate the candidates of `create_search_space` in parallel
+
+    The preprocessing is part of the searched pipeline, fitted on the training part
+    of each fold only, so that the scores are not biased by statistics of the
+    validation rows. Its fits are cached (`Pipeline(memory=...)`): it is fitted once
+    per fold and shared by all the candidates, instead of once per candidate and fold.
+
+    Args:
+        X_train (pd.DataFrame): The features
+        y_train (pd.Series): The target
+        cv (int): Number of folds
+        n_jobs (int): Number of fits run at once, -1 for all the cores
+        scoring (str): Metric selecting the best candidate, accuracy, ROC AUC and log-loss being computed anyway
+
+    Returns:
+        Tuple[Pipeline, Dict[str, Any]]: The pipeline with the best classifier refitted on the whole training set,
+            and the summary of the search (best candidate, scores of all the candidates, timing)
+    """
+    from sklearn.model_selection import GridSearchCV
+
+    searched = create_pipeline()
+    # Few columns, and the tree classifiers require dense data
+    searched.set_params(preprocessor__sparse_threshold=0)
+
+    cache_dir = tempfile.mkdtemp(prefix='search_')
+    searched.set_params(memory=cache_dir)
+    search = GridSearchCV(
+        searched,
+        param_grid=create_search_space(),
+        scoring={'accuracy': 'accuracy', 'roc_auc': 'roc_auc', 'log_loss': 'neg_log_loss'},
+        refit=scoring,
+        cv=cv,
+        n_jobs=n_jobs,
+        error_score=np.nan)
+
+    start = time.perf_counter()
+    try:
+        search.fit(X_train, y_train)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    wall_time = time.perf_counter() - start
+
+    results = search.cv_results_
+    candidates = [
+        {
+            "params": _format_params(params),
+            "accuracy": float(results['mean_test_accuracy'][i]),
+            "roc_auc": float(results['mean_test_roc_auc'][i]),
+            "log_loss": -float(results['mean_test_log_loss'][i]),
+            "fit_time_seconds": float(results['mean_fit_time'][i]),
+        }
+        for i, params in enumerate(results['params'])
+    ]
+    # The time the same fits would have taken one after the other
+    sequential_time = float(np.sum((results['mean_fit_time'] + results['mean_score_time']) * cv))
+
+    # Refitted on the whole training set, the cache being gone
+    pipeline = search.best_estimator_.set_params(memory=None)
+
+    summary = {
+        "best_params": _format_params(search.best_params_),
+        "best_score": float(search.best_score_),
+        "scoring": scoring,
+        "candidates": candidates,
+        "wall_time_seconds": wall_time,
+        "sequential_time_seconds": sequential_time,
+        "speedup": sequential_time / wall_time if wall_time else None,
+    }
+    logging.info(f"Search of {len(candidates)} candidates x {cv} folds done in {wall_time:.1f}s "
+                 f"(about {sequential_time:.1f}s sequentially), best: {summary['best_params']}")
+
+    return pipeline, summary
+
 def run_experiment(
         circuit: Literal['atp', 'wta'],
         from_date: str,
@@ -210,6 +927,8 @@ def run_experiment(
         artifact_path: str = None,
         registered_model_name: str = 'LogisticRegression',
         experiment_name: str = 'Logistic Tennis Prediction',
+        search: bool = False,
+        cv: int = 5,
         ):
     """
     Run the entire ML experiment pipeline.
@@ -219,7 +938,17 @@ def run_experiment(
         data_url (str): URL to load the dataset.
         artifact_path (str): Path to store the model artifact.
         registered_model_name (str): Name to register the model under in MLflow.
+        search (bool): Search the best classifier and hyperparameters (see `search_hyperparameters`)
+            instead of fitting the default pipeline
+        cv (int): Number of cross-validation folds of the search
+
+    Returns:
+        Dict: The summary of the search, None without search
     """
+    import mlflow
+    import mlflow.sklearn
+    from mlflow.models import infer_signature
+
     if not artifact_path:
         artifact_path = f'{circuit}_model'
     
@@ -229,15 +958,10 @@ def run_experiment(
     # Start timing
     start_time = time.time()
 
-    # Load and preprocess data
-    df = load_matches_from_postgres(
-        table_name=f"{circuit}_data",
-        from_date=from_date,
-        to_date=to_date)
-    X_train, X_test, y_train, y_test = preprocess_data(df)
-
-    # Create pipeline
-    pipe = create_pipeline()
+    if search:
+        X_train, X_test, y_train, y_test = split_data(load_pairwise_data(circuit, from_date, to_date))
+    else:
+        X_train, X_test, y_train, y_test, preprocessor, encoded_train = load_encoded_data(circuit, from_date, to_date)
 
     # Set experiment's info 
     mlflow.set_experiment(experiment_name)
@@ -245,12 +969,20 @@ def run_experiment(
     # Get our experiment info
     experiment = mlflow.get_experiment_by_name(experiment_name)
 
+    if search:
+        return _run_search_experiment(
+            experiment.experiment_id, X_train, X_test, y_train, y_test, cv, artifact_path, registered_model_name)
+
+    # Create pipeline
+    pipe = create_pipeline()
+
     # Call mlflow autolog
     mlflow.sklearn.autolog()
 
     with mlflow.start_run(experiment_id=experiment.experiment_id):
-        # Train model
-        train_model(pipe, X_train, y_train)
+        # Train model: the classifier only, the preprocessor being fitted along with the encoded features
+        pipe.set_params(preprocessor=preprocessor)
+        pipe.named_steps['classifier'].fit(encoded_train, y_train)
        
         # Store metrics 
         # predicted_output = pipe.predict(X_test.values)
@@ -271,6 +1003,212 @@ def run_experiment(
     # Print timing
     logging.info(f"...Training Done! --- Total training time: {time.time() - start_time} seconds")
 
+def _run_search_experiment(
+        experiment_id: str,
+        X_train: pd.DataFrame,
+        X_test: pd.DataFrame,
+        y_train: pd.Series,
+        y_test: pd.Series,
+        cv: int,
+        artifact_path: str,
+        registered_model_name: str) -> Dict[str, Any]:
+    """
+    Search the best candidate, log all the candidates to MLflow (one nested run each) and register the best one
+    """
+    import mlflow
+    import mlflow.sklearn
+    from mlflow.models import infer_signature
+
+    with mlflow.start_run(experiment_id=experiment_id, run_name='hyperparameter-search'):
+        pipe, summary = search_hyperparameters(X_train, y_train, cv=cv)
+        summary["test_accuracy"] = float(pipe.score(X_test, y_test))
+
+        for i, candidate in enumerate(summary["candidates"]):
+            with mlflow.start_run(experiment_id=experiment_id, run_name=f'candidate-{i}', nested=True):
+                mlflow.log_params(candidate["params"])
+                mlflow.log_metrics({
+                    f"cv_{metric}": candidate[metric]
+                    for metric in ("accuracy", "roc_auc", "log_loss") if not np.isnan(candidate[metric])})
+
+        mlflow.log_params({"cv": cv, **summary["best_params"]})
+        mlflow.log_metrics({
+            "best_cv_score": summary["best_score"],
+            "test_accuracy": summary["test_accuracy"],
+            "wall_time_seconds": summary["wall_time_seconds"],
+            "sequential_time_seconds": summary["sequential_time_seconds"],
+            "speedup": summary["speedup"] or 0.0,
+        })
+        mlflow.log_dict(summary, "search_results.json")
+
+        logging.info(f"Best candidate {summary['best_params']}, test accuracy: {summary['test_accuracy']}")
+        mlflow.sklearn.log_model(
+            sk_model=pipe,
+            artifact_path=artifact_path,
+            registered_model_name=registered_model_name,
+            signature=infer_signature(X_test, pipe.predict(X_test))
+        )
+
+    # The candidates are in MLflow, only the outcome is returned
+    return {key: value for key, value in summary.items() if key != "candidates"}
+
+def compare_with_full_retrain(
+        pipeline: 'Pipeline',
+        X_old: pd.DataFrame,
+        y_old: pd.Series,
+        X_new: pd.DataFrame,
+        y_new: pd.Series) -> Dict[str, Any]:
+    """
+    Compare the accuracy of an incremental update with a full retrain on the same data
+
+    A part of the new data is held out: the incremental pipeline (trained on the old data)
+    is updated with the rest of the new data, a pipeline is trained from scratch on the
+    old data and the same part of the new data, and both are scored on the held out part.
+
+    Args:
+        pipeline (Pipeline): The incremental pipeline trained on the old data, left unchanged
+        X_old (pd.DataFrame): The features the pipeline was trained on
+        y_old (pd.Series): The target the pipeline was trained on
+        X_new (pd.DataFrame): The new features
+        y_new (pd.Series): The new target
+
+    Returns:
+        Dict[str, Any]: The accuracy of both pipelines on the held out data, and their difference
+    """
+    import copy
+    from sklearn.model_selection import train_test_split
+
+    X_fit, X_holdout, y_fit, y_holdout = train_test_split(X_new, y_new, test_size=0.2, random_state=0)
+
+    incremental = partial_fit_pipeline(copy.deepcopy(pipeline), X_fit, y_fit)
+    full = train_model(create_pipeline(), pd.concat([X_old, X_fit]), pd.concat([y_old, y_fit]))
+
+    incremental_accuracy = float(incremental.score(X_holdout, y_holdout))
+    full_accuracy = float(full.score(X_holdout, y_holdout))
+
+    return {
+        "incremental_accuracy": incremental_accuracy,
+        "full_retrain_accuracy": full_accuracy,
+        "difference": incremental_accuracy - full_accuracy,
+        "holdout_samples": len(y_holdout),
+    }
+
+def update_model(
+        circuit: Literal['atp', 'wta'],
+        registered_model_name: str = 'SGDIncremental',
+        from_date: str = None,
+        to_date: str = None,
+        parity_check: bool = False,
+        experiment_name: str = 'Incremental Tennis Prediction') -> Dict[str, Any]:
+    """
+    Update the latest version of an incremental model with the matches played since its
+    training cutoff, and register the result as a new version
+
+    The first date, the cutoff (last date included) and the number of samples of the
+    training data are stored as tags of each version.
+
+    Args:
+        circuit (str): The circuit
+        registered_model_name (str): The registered model
+        from_date (str): First date (YYYY-MM-DD) of the training data, only used to train the first version
+        to_date (str): Last date (YYYY-MM-DD) of the new matches, yesterday if empty
+        parity_check (bool): Compare the update with a full retrain on the same data
+            (see `compare_with_full_retrain`), which loads the former training data
+        experiment_name (str): Name of the MLflow experiment
+
+    Returns:
+        Dict[str, Any]: The new version and its training data, or a message if there is no new match
+    """
+    import mlflow
+    import mlflow.sklearn
+    from mlflow.models import infer_signature
+    from datetime import date, timedelta
+
+    client = _get_registry_client()
+    try:
+        version = get_latest_version(registered_model_name)
+    except ModelNotFoundError:
+        version = None
+
+    if version is not None:
+        tags = client.get_model_version(registered_model_name, version).tags
+        if 'training_cutoff' not in tags:
+            raise ValueError(f"Model {registered_model_name} version {version} has no training cutoff, it was not trained incrementally")
+        # Loaded again rather than taken from the model cache: it is updated in place
+        pipeline = _load_registered_model(registered_model_name, version)
+        training_start, cutoff = tags['training_start'], tags['training_cutoff']
+        samples = int(tags['training_samples'])
+        from_date = (date.fromisoformat(cutoff) + timedelta(days=1)).isoformat()
+    else:
+        if not from_date:
+            raise ValueError(f"Model {registered_model_name} is not registered yet, from_date is required to train its first version")
+        pipeline = create_incremental_pipeline()
+        training_start, cutoff, samples = from_date, None, 0
+
+    # Matches may still be added for today
+    to_date = to_date or (date.today() - timedelta(days=1)).isoformat()
+    if from_date > to_date:
+        return {"message": f"Model {registered_model_name} is up to date", "version": version, "training_cutoff": cutoff}
+
+    df_new = load_pairwise_data(circuit, from_date, to_date)
+    if df_new.empty:
+        return {"message": f"No new match since {cutoff}", "version": version, "training_cutoff": cutoff}
+
+    features = [f.name for f in Feature.get_all_features()]
+    X_new, y_new = df_new[features], df_new['target']
+
+    summary = {
+        "previous_version": version,
+        "from_date": from_date,
+        "to_date": to_date,
+        "new_samples": len(df_new),
+        "training_samples": samples + len(df_new),
+    }
+    if version is not None:
+        # Scored before the update, the new matches are unseen
+        summary["accuracy_before_update"] = float(pipeline.score(X_new, y_new))
+        if parity_check:
+            df_old = load_pairwise_data(circuit, training_start, cutoff)
+            summary["parity"] = compare_with_full_retrain(pipeline, df_old[features], df_old['target'], X_new, y_new)
+
+    start_time = time.time()
+    partial_fit_pipeline(pipeline, X_new, y_new)
+    summary["update_time_seconds"] = time.time() - start_time
+
+    mlflow.set_experiment(experiment_name)
+    experiment = mlflow.get_experiment_by_name(experiment_name)
+
+    with mlflow.start_run(experiment_id=experiment.experiment_id, run_name=f'update-{to_date}'):
+        mlflow.log_params({
+            "circuit": circuit,
+            "previous_version": version,
+            "training_start": training_start,
+            "from_date": from_date,
+            "training_cutoff": to_date,
+        })
+        mlflow.log_metrics({
+            key: value for key, value in {
+                "new_samples": summary["new_samples"],
+                "training_samples": summary["training_samples"],
+                "accuracy_before_update": summary.get("accuracy_before_update"),
+                "update_time_seconds": summary["update_time_seconds"],
+                **{f"parity_{key}": value for key, value in summary.get("parity", {}).items()},
+            }.items() if value is not None
+        })
+        model_info = mlflow.sklearn.log_model(
+            sk_model=pipeline,
+            artifact_path=f'{circuit}_model',
+            registered_model_name=registered_model_name,
+            signature=infer_signature(X_new, pipeline.predict(X_new))
+        )
+
+    summary["version"] = model_info.registered_model_version
+    for key, value in {"training_start": training_start, "training_cutoff": to_date, "training_samples": summary["training_samples"]}.items():
+        client.set_model_version_tag(registered_model_name, summary["version"], key, str(value))
+
+    logging.info(f"Model {registered_model_name} updated with {len(df_new)} samples up to {to_date}: version {summary['version']}")
+
+    return summary
+
 def list_registered_models() -> List[Dict]:
     """
     List all the registered models
@@ -281,6 +1219,7 @@ def list_registered_models() -> List[Dict]:
         raise ValueError("MLFLOW_SERVER_URI environment variable is not set.")
     print(f"MLflow tracking URI: {tracking_uri}")
 
+    from mlflow.tracking import MlflowClient
     client = MlflowClient(tracking_uri=tracking_uri)
     # Should be:
     #   results = client.search_registered_models()
@@ -295,23 +1234,88 @@ def list_registered_models() -> List[Dict]:
     
     return output
 
-def load_model(name: str, version: str = 'latest') -> Pipeline:
+class ModelNotFoundError(LookupError):
     """
-    Load a model from MLflow
+    The model (or its version) is not registered in MLflow
     """
-    if name in models.keys():
-        return models[name]
-    
+
+def _get_registry_client() -> 'MlflowClient':
+    """
+    Get a client of the MLflow registry
+    """
+    import mlflow
+    from mlflow.tracking import MlflowClient
+
     mlflow.set_tracking_uri(os.environ["MLFLOW_SERVER_URI"])
-    client = MlflowClient()
+    return MlflowClient()
+
+def get_latest_version(name: str) -> str:
+    """
+    Get the latest registered version of a model
+
+    Raises:
+        ModelNotFoundError: If the model is not registered
+    """
+    from mlflow.exceptions import RestException
+
+    try:
+        model_info = _get_registry_client().get_registered_model(name)
+    except RestException as e:
+        raise ModelNotFoundError(f"Model {name} not found") from e
+
+    return max((mv.version for mv in model_info.latest_versions), key=int)
+
+def _load_registered_model(name: str, version: str) -> 'Pipeline':
+    """
+    Load a given version of a model from MLflow
+
+    Raises:
+        ModelNotFoundError: If the model or the version is not registered
+    """
+    import mlflow.sklearn
+    from mlflow.exceptions import RestException
+
+    try:
+        model_version = _get_registry_client().get_model_version(name, version)
+    except RestException as e:
+        raise ModelNotFoundError(f"Model {name} version {version} not found") from e
+
+    return mlflow.sklearn.load_model(model_uri=model_version.source)
+
+def _load_local_model(path: str) -> 'Pipeline':
+    """
+    Load a model trained locally
+    """
+    import joblib
+    return joblib.load(path)
 
-    model_info = client.get_registered_model(name)
+model_cache = ModelCache(
+    loader=_load_registered_model,
+    resolver=get_latest_version,
+    max_entries=int(os.getenv("MODEL_CACHE_MAX_ENTRIES", 8)),
+    max_bytes=int(os.getenv("MODEL_CACHE_MAX_BYTES", 0)) or None)
 
-    # Load the model
-    pipeline = mlflow.sklearn.load_model(model_uri=model_info.latest_versions[0].source)
+def load_model(name: str, version: str = 'latest') -> 'Pipeline':
+    """
+    Load a model from MLflow, through the model cache
+    """
+    return model_cache.get(name, version)
 
-    logging.info(f'Model {name} loaded')
+local_model = LocalModelFile(LOCAL_MODEL_PATH, loader=_load_local_model)
 
-    models[name] = pipeline
+def _collect_model_cache_metrics():
+    """
+    Expose the statistics of the model cache as metrics
+    """
+    stats = model_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    yield 'tennis_model_cache_hits_total', 'counter', 'Lookups of the model cache served from memory', [({}, stats["hits"])]
+    yield 'tennis_model_cache_misses_total', 'counter', 'Lookups of the model cache loading the model', [({}, stats["misses"])]
+    yield 'tennis_model_cache_hit_ratio', 'gauge', 'Share of the lookups of the model cache served from memory', [({}, stats["hits"] / lookups if lookups else 0.0)]
+    yield 'tennis_model_cache_load_errors_total', 'counter', 'Failed loads of models', [({}, stats["load_errors"])]
+    yield 'tennis_model_cache_load_seconds_total', 'counter', 'Time spent loading models', [({}, stats["load_time_seconds"])]
+    yield 'tennis_model_cache_evictions_total', 'counter', 'Models evicted from the cache', [({}, stats["evictions"])]
+    yield 'tennis_model_cache_entries', 'gauge', 'Models held by the cache', [({}, stats["entries"])]
+    yield 'tennis_model_cache_bytes', 'gauge', 'Estimated size of the models held by the cache', [({}, stats["bytes"])]
 
-    return pipeline
\ No newline at end of file
+registry.add_collector(_collect_model_cache_metrics)
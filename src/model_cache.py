@@ -0,0 +1,307 @@
+import os
+import time
+import pickle
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+class ModelCache:
+    """
+    LRU cache of the models, keyed on (name, resolved version)
+
+    - 'latest' is resolved once through `resolver`, then kept up to date by `refresh_latest`
+      (called periodically by the poller started with `start_polling`)
+    - concurrent loads of the same key are collapsed into a single call to `loader`
+    - entries are evicted, least recently used first, once `max_entries` or `max_bytes` is exceeded
+    """
+    def __init__(
+            self,
+            loader: Callable[[str, str], Any],
+            resolver: Callable[[str], str],
+            max_entries: int = 8,
+            max_bytes: Optional[int] = None):
+        """
+        Args:
+            loader (Callable[[str, str], Any]): Load the model of the given name and version
+            resolver (Callable[[str], str]): Get the latest version of the given model
+            max_entries (int): Maximum number of models kept in memory
+            max_bytes (int): Maximum (pickled) size of the models kept in memory, unbounded if None
+        """
+        self.loader = loader
+        self.resolver = resolver
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[Any, int]]' = OrderedDict()
+        self._loading: Dict[Tuple[str, str], Future] = {}
+        self._latest: Dict[str, str] = {}
+        self._bytes = 0
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "load_time_seconds": 0.0,
+            "evictions": 0,
+            "swaps": 0,
+        }
+
+        # Threads do not survive a fork: the locks they held must be released in the child
+        if hasattr(os, 'register_at_fork'):
+            after_fork = weakref.WeakMethod(self._after_fork)
+            os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
+
+    def _after_fork(self):
+        """
+        Reset the state of the threads in a forked process (e.g. a pre-forked worker):
+        the models stay shared copy-on-write, but the poller and pending loads belong to the parent
+        """
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._poller = None
+        self._stop = threading.Event()
+
+    def resolve(self, name: str, version: Optional[str] = 'latest') -> str:
+        """
+        Resolve the version of a model, 'latest' (or empty) giving the latest known version
+        """
+        if version and version != 'latest':
+            return str(version)
+
+        with self._lock:
+            latest = self._latest.get(name)
+
+        if latest is None:
+            latest = str(self.resolver(name))
+            with self._lock:
+                latest = self._latest.setdefault(name, latest)
+
+        return latest
+
+    def get(self, name: str, version: Optional[str] = 'latest') -> Any:
+        """
+        Get a model, loading it if needed
+
+        Args:
+            name (str): Name of the model
+            version (str): Version of the model, or 'latest'
+
+        Returns:
+            Any: The model
+        """
+        return self._get((name, self.resolve(name, version)))
+
+    def get_if_cached(self, name: str, version: Optional[str] = 'latest') -> Any:
+        """
+        Get a model only if it is already in memory, without any call to the registry
+
+        Returns:
+            Any: The model, None if it would have to be resolved or loaded
+        """
+        with self._lock:
+            if not version or version == 'latest':
+                version = self._latest.get(name)
+                if version is None:
+                    return None
+
+            entry = self._entries.get((name, str(version)))
+            if entry is None:
+                return None
+
+            self._entries.move_to_end((name, str(version)))
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def _get(self, key: Tuple[str, str]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+
+            self._stats["misses"] += 1
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = Future()
+
+        if not owner:
+            # Another thread is already loading this model
+            return future.result()
+
+        try:
+            model = self._load(key)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(model)
+            return model
+        finally:
+            with self._lock:
+                del self._loading[key]
+
+    def _load(self, key: Tuple[str, str]) -> Any:
+        """
+        Load a model and store it, evicting the least recently used ones if needed
+        """
+        start = time.perf_counter()
+        try:
+            model = self.loader(*key)
+        except Exception:
+            with self._lock:
+                self._stats["load_errors"] += 1
+            raise
+        elapsed = time.perf_counter() - start
+        size = len(pickle.dumps(model)) if self.max_bytes else 0
+
+        logging.info(f'Model {key[0]} version {key[1]} loaded in {elapsed:.2f}s')
+
+        with self._lock:
+            self._stats["loads"] += 1
+            self._stats["load_time_seconds"] += elapsed
+            self._entries[key] = (model, size)
+            self._bytes += size
+            self._evict()
+
+        return model
+
+    def _evict(self):
+        """
+        Evict the least recently used models while over budget, keeping at least the last one.
+        Must be called with the lock held.
+        """
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes and self._bytes > self.max_bytes)):
+            key, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._stats["evictions"] += 1
+            logging.info(f'Model {key[0]} version {key[1]} evicted from the cache')
+
+    def refresh_latest(self):
+        """
+        Check the registry for new latest versions of the models already requested as 'latest'.
+        A new version is loaded first, then swapped in.
+        """
+        with self._lock:
+            latest = dict(self._latest)
+
+        for name, current in latest.items():
+            try:
+                version = str(self.resolver(name))
+                if version == current:
+                    continue
+
+                self._get((name, version))
+            except Exception as e:
+                logging.error(f'Could not refresh model {name}: {e}')
+                continue
+
+            with self._lock:
+                self._latest[name] = version
+                self._stats["swaps"] += 1
+            logging.info(f'Model {name}: latest version is now {version} (was {current})')
+
+    def start_polling(self, interval: float):
+        """
+        Start a daemon thread calling `refresh_latest` every `interval` seconds
+        """
+        if self._poller is not None or interval <= 0:
+            return
+
+        def poll():
+            while not self._stop.wait(interval):
+                self.refresh_latest()
+
+        self._stop.clear()
+        self._poller = threading.Thread(target=poll, name='model-cache-poller', daemon=True)
+        self._poller.start()
+
+    def stop_polling(self):
+        """
+        Stop the poller thread
+        """
+        if self._poller is None:
+            return
+
+        self._stop.set()
+        self._poller.join()
+        self._poller = None
+
+    def clear(self):
+        """
+        Empty the cache
+        """
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the usage counters of the cache
+        """
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "models": [{"name": name, "version": version} for name, version in self._entries],
+                "latest": dict(self._latest),
+            }
+
+class LocalModelFile:
+    """
+    Model stored in a local file, kept in memory and reloaded only when the file changes
+    (different modification time or size)
+    """
+    def __init__(self, path: str, loader: Callable[[str], Any]):
+        """
+        Args:
+            path (str): Path of the file
+            loader (Callable[[str], Any]): Load the model from the file
+        """
+        self.path = path
+        self.loader = loader
+
+        self._lock = threading.Lock()
+        self._model = None
+        self._signature: Optional[Tuple[int, int]] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self) -> Any:
+        """
+        Get the model
+
+        Returns:
+            Any: The model, None if the file does not exist
+        """
+        signature = self._stat()
+        if signature is None:
+            return None
+        if signature == self._signature:
+            return self._model
+
+        with self._lock:
+            # Another thread may have reloaded it while waiting for the lock
+            signature = self._stat()
+            if signature is not None and signature != self._signature:
+                self._model = self.loader(self.path)
+                self._signature = signature
+                logging.info(f'Model reloaded from {self.path}')
+
+            return self._model if signature is not None else None
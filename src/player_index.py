@@ -0,0 +1,191 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Callable, Dict, Literal, Optional, Tuple
+
+from src.sql import load_matches_from_postgres
+
+PLAYER_INDEX_TTL = float(os.getenv("PLAYER_INDEX_TTL", 3600))
+
+# Columns needed to build the index
+PLAYER_COLUMNS = ['date', 'winner', 'loser', 'w_rank', 'l_rank', 'w_points', 'l_points']
+
+# Dates, ranks and points of the matches of a player, sorted by date
+History = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+def _key(name: str) -> str:
+    return ' '.join(str(name).split()).lower()
+
+class PlayerIndex:
+    """
+    In-memory index of the rank and points of the players, as recorded at each of their matches
+
+    The history of each player is held in NumPy arrays sorted by date, so that the rank
+    and points as of a date are found by binary search. The index is refreshed
+    incrementally: only the matches from the last date already indexed are fetched again.
+    """
+    def __init__(self, fetch: Callable[[Optional[str]], pd.DataFrame], ttl: float = 3600):
+        """
+        Args:
+            fetch (Callable[[Optional[str]], pd.DataFrame]): Fetch the matches (PLAYER_COLUMNS) from a date
+                (YYYY-MM-DD, included), all of them if None
+            ttl (float): Seconds after which `is_stale` is True
+        """
+        self.fetch = fetch
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._players: Dict[str, History] = {}
+        self._names: Dict[str, str] = {}
+        self._last_date: Optional[np.datetime64] = None
+        self._refreshed_at: Optional[float] = None
+
+    @property
+    def is_built(self) -> bool:
+        return self._refreshed_at is not None
+
+    @property
+    def is_stale(self) -> bool:
+        return self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.ttl
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Add the matches played since the last refresh
+
+        The matches of the last date indexed are fetched again, matches may have been added for it since.
+
+        Args:
+            full (bool): Rebuild the whole index, needed when older matches have been added
+
+        Returns:
+            int: The number of matches fetched
+        """
+        with self._lock:
+            return self._refresh(full)
+
+    def refresh_if_stale(self, wait: bool = True) -> Optional[int]:
+        """
+        Refresh the index unless it is fresh, staleness being checked again under the lock,
+        so that concurrent callers seeing a stale index refresh it once
+
+        Args:
+            wait (bool): Wait for a refresh already running, instead of returning at once
+
+        Returns:
+            int: The number of matches fetched, None if the index was not refreshed
+        """
+        if not self._lock.acquire(blocking=wait):
+            return None
+        try:
+            return self._refresh(False) if self.is_stale else None
+        finally:
+            self._lock.release()
+
+    def _refresh(self, full: bool) -> int:
+        """
+        Same as `refresh`, with the lock held
+        """
+        if full or self._last_date is None:
+            # Built aside, the lookups go on with the current index meanwhile
+            since, players, names, last_date = None, {}, {}, None
+        else:
+            since, players, names, last_date = str(self._last_date), self._players, self._names, self._last_date
+
+        matches = self.fetch(since)
+        if not matches.empty:
+            last_date = self._add(matches, players, names, last_date)
+        self._players, self._names, self._last_date = players, names, last_date
+        self._refreshed_at = time.monotonic()
+
+        logging.info(f'Player index refreshed from {since}: {len(matches)} matches, {len(self._players)} players')
+        return len(matches)
+
+    @staticmethod
+    def _add(
+            matches: pd.DataFrame,
+            players: Dict[str, History],
+            names: Dict[str, str],
+            last_date: Optional[np.datetime64]) -> np.datetime64:
+        """
+        Merge matches into the histories of the players
+
+        Returns:
+            np.datetime64: The last date indexed
+        """
+        dates = pd.to_datetime(matches['date']).to_numpy(dtype='datetime64[D]')
+        observations = pd.DataFrame({
+            'name': np.concatenate([matches['winner'].to_numpy(dtype=object), matches['loser'].to_numpy(dtype=object)]),
+            'date': np.concatenate([dates, dates]),
+            'rank': pd.to_numeric(pd.concat([matches['w_rank'], matches['l_rank']]), errors='coerce').to_numpy(dtype=np.float64),
+            'points': pd.to_numeric(pd.concat([matches['w_points'], matches['l_points']]), errors='coerce').to_numpy(dtype=np.float64),
+        })
+        observations = observations[observations['name'].notna()]
+        observations = observations[observations['rank'].notna() | observations['points'].notna()]
+        observations['key'] = observations['name'].astype(str).str.split().str.join(' ').str.lower()
+        observations = observations.sort_values(['key', 'date'], kind='stable')
+
+        first_fetched = dates.min()
+        for key, group in observations.groupby('key', sort=False):
+            new = (group['date'].to_numpy(dtype='datetime64[D]'), group['rank'].to_numpy(), group['points'].to_numpy())
+            if key in players:
+                # Drop the matches fetched again, then append (the new matches are not older)
+                old = players[key]
+                keep = np.searchsorted(old[0], first_fetched, side='left')
+                new = tuple(np.concatenate([o[:keep], n]) for o, n in zip(old, new))
+            players[key] = new
+            names[key] = group['name'].iloc[-1]
+
+        return dates.max() if last_date is None else max(last_date, dates.max())
+
+    def lookup(self, name: str, as_of: Optional[str] = None) -> Optional[Dict]:
+        """
+        Get the rank and points of a player as of a date, from the last match played on or before it
+
+        Args:
+            name (str): The player's name, as in the match tables (case and spaces do not matter)
+            as_of (str): The date (YYYY-MM-DD), today if empty
+
+        Returns:
+            Dict: The player's name, rank, points and the date of the match they come from,
+                None if the player is unknown or has no match before the date
+        """
+        key = _key(name)
+        history = self._players.get(key)
+        if history is None:
+            return None
+
+        dates, ranks, points = history
+        i = np.searchsorted(dates, np.datetime64(as_of or date.today(), 'D'), side='right') - 1
+        if i < 0:
+            return None
+
+        return {
+            "name": self._names[key],
+            "rank": None if np.isnan(ranks[i]) else int(ranks[i]),
+            "points": None if np.isnan(points[i]) else int(points[i]),
+            "as_of": str(dates[i]),
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "players": len(self._players),
+            "last_date": None if self._last_date is None else str(self._last_date),
+            "stale": self.is_stale,
+        }
+
+_indexes: Dict[str, PlayerIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_player_index(circuit: Literal['atp', 'wta'], ttl: float = PLAYER_INDEX_TTL) -> PlayerIndex:
+    """
+    Get the player index of a circuit, empty until refreshed, stale every PLAYER_INDEX_TTL seconds
+    """
+    with _indexes_lock:
+        if circuit not in _indexes:
+            _indexes[circuit] = PlayerIndex(
+                fetch=lambda since: load_matches_from_postgres(f"{circuit}_data", from_date=since, columns=PLAYER_COLUMNS),
+                ttl=ttl)
+        return _indexes[circuit]
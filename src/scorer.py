@@ -0,0 +1,212 @@
+import weakref
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+# scikit-learn is imported when compiling, the pipelines being already loaded by then
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
+# Compiled scorers of the pipelines already seen, None when the pipeline is not supported
+_scorers: 'weakref.WeakKeyDictionary[Pipeline, Tuple[Any, Optional[CompiledScorer]]]' = weakref.WeakKeyDictionary()
+
+class CompiledScorer:
+    """
+    Scorer equivalent to a fitted pipeline made of a ColumnTransformer
+    (SimpleImputer + StandardScaler on numbers, OneHotEncoder on categories)
+    followed by a binary LogisticRegression.
+
+    The fitted parameters are held in flat NumPy arrays, so that scoring
+    neither builds a DataFrame nor goes through scikit-learn.
+    """
+    def __init__(
+            self,
+            numeric_features: List[str],
+            fill: np.ndarray,
+            mean: np.ndarray,
+            scale: np.ndarray,
+            numeric_coef: np.ndarray,
+            categorical_features: List[str],
+            category_index: List[Dict[Any, int]],
+            categorical_coef: np.ndarray,
+            intercept: float,
+            classes: np.ndarray):
+        self.numeric_features = numeric_features
+        self.fill = fill
+        self.mean = mean
+        self.scale = scale
+        self.numeric_coef = numeric_coef
+        self.categorical_features = categorical_features
+        self.category_index = category_index
+        # One extra trailing zero, the coefficient of unknown categories
+        self.categorical_coef = np.append(categorical_coef, 0.0)
+        self.unknown = len(categorical_coef)
+        self.intercept = intercept
+        self.classes_ = classes
+
+    def decision_function(self, features: Dict[str, Sequence[Any]]) -> np.ndarray:
+        """
+        Compute the linear decision of the classifier
+
+        Args:
+            features (Dict[str, Sequence[Any]]): Values of each feature, keyed by `Feature.name`
+
+        Returns:
+            np.ndarray: The decision of each match
+        """
+        numeric = np.array([features[name] for name in self.numeric_features], dtype=np.float64).T
+        numeric = np.where(np.isnan(numeric), self.fill, numeric)
+        decision = ((numeric - self.mean) / self.scale) @ self.numeric_coef + self.intercept
+
+        for name, index in zip(self.categorical_features, self.category_index):
+            positions = np.fromiter((index.get(value, self.unknown) for value in features[name]),
+                                    dtype=np.intp,
+                                    count=len(features[name]))
+            decision += self.categorical_coef[positions]
+
+        return decision
+
+    def predict_proba(self, features: Dict[str, Sequence[Any]]) -> np.ndarray:
+        """
+        Same as `Pipeline.predict_proba`
+
+        Returns:
+            np.ndarray: Probabilities [class 0, class 1] of each match
+        """
+        # Logistic function, computed without overflow
+        proba = np.exp(-np.logaddexp(0, -self.decision_function(features)))
+        return np.column_stack([1 - proba, proba])
+
+    def predict(self, features: Dict[str, Sequence[Any]]) -> np.ndarray:
+        """
+        Same as `Pipeline.predict`
+        """
+        return self.classes_[(self.decision_function(features) > 0).astype(int)]
+
+def _compile_numeric(transformer: Any, size: int) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Get the (fill values, mean, scale) of a numerical transformer, None if not supported
+    """
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    steps = transformer.steps if isinstance(transformer, Pipeline) else [(None, transformer)]
+    fill = np.full(size, np.nan)
+    mean = np.zeros(size)
+    scale = np.ones(size)
+
+    for i, (_, step) in enumerate(steps):
+        if isinstance(step, SimpleImputer) and i == 0:
+            if step.strategy == 'constant' or not (isinstance(step.missing_values, float) and np.isnan(step.missing_values)) \
+                    or len(step.statistics_) != size or np.isnan(step.statistics_).any() or step.add_indicator:
+                return None
+            fill = step.statistics_.astype(np.float64)
+        elif isinstance(step, StandardScaler) and i == len(steps) - 1:
+            # The statistics are fitted whatever the options, but only those enabled are applied
+            if step.with_mean and step.mean_ is not None:
+                mean = step.mean_.astype(np.float64)
+            if step.with_std and step.scale_ is not None:
+                scale = step.scale_.astype(np.float64)
+        else:
+            return None
+
+    return fill, mean, scale
+
+def _is_supported_encoder(encoder: Any) -> bool:
+    """
+    Check the OneHotEncoder only maps known categories to their own column
+    """
+    from sklearn.preprocessing import OneHotEncoder
+
+    return isinstance(encoder, OneHotEncoder) \
+        and encoder.handle_unknown == 'ignore' \
+        and encoder.drop_idx_ is None \
+        and getattr(encoder, 'infrequent_categories_', None) is None
+
+def compile_pipeline(pipeline: 'Pipeline') -> Optional[CompiledScorer]:
+    """
+    Compile a fitted pipeline (as created by `create_pipeline`)
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+
+    Returns:
+        CompiledScorer: The equivalent scorer, None if the pipeline's shape is not supported
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.linear_model import LogisticRegression, SGDClassifier
+    from sklearn.pipeline import Pipeline
+
+    if not isinstance(pipeline, Pipeline) or len(pipeline.steps) != 2:
+        return None
+
+    preprocessor, classifier = pipeline.steps[0][1], pipeline.steps[1][1]
+    # A SGDClassifier with the log loss is a logistic regression too
+    logistic = isinstance(classifier, LogisticRegression) \
+        or (isinstance(classifier, SGDClassifier) and classifier.loss == 'log_loss')
+    if not isinstance(preprocessor, ColumnTransformer) or not logistic \
+            or not hasattr(classifier, 'coef_') or classifier.coef_.shape[0] != 1:
+        return None
+
+    coef = classifier.coef_[0].astype(np.float64)
+    numeric_features, fill, mean, scale, numeric_coef = [], [], [], [], []
+    categorical_features, category_index, categorical_coef = [], [], []
+
+    for name, transformer, columns in preprocessor.transformers_:
+        if transformer == 'drop':
+            continue
+        if isinstance(transformer, str) or not all(isinstance(c, str) for c in columns):
+            return None
+
+        position = preprocessor.output_indices_[name].start
+        if _is_supported_encoder(transformer):
+            for column, categories in zip(columns, transformer.categories_):
+                offset = len(categorical_coef)
+                categorical_features.append(column)
+                category_index.append({category: offset + i for i, category in enumerate(categories)})
+                categorical_coef.extend(coef[position:position + len(categories)])
+                position += len(categories)
+        else:
+            params = _compile_numeric(transformer, len(columns))
+            if params is None:
+                return None
+            numeric_features.extend(columns)
+            fill.extend(params[0])
+            mean.extend(params[1])
+            scale.extend(params[2])
+            numeric_coef.extend(coef[position:position + len(columns)])
+
+    return CompiledScorer(
+        numeric_features=numeric_features,
+        fill=np.array(fill, dtype=np.float64),
+        mean=np.array(mean, dtype=np.float64),
+        scale=np.array(scale, dtype=np.float64),
+        numeric_coef=np.array(numeric_coef, dtype=np.float64),
+        categorical_features=categorical_features,
+        category_index=category_index,
+        categorical_coef=np.array(categorical_coef, dtype=np.float64),
+        intercept=float(classifier.intercept_[0]),
+        classes=classifier.classes_)
+
+def get_scorer(pipeline: 'Pipeline') -> Optional[CompiledScorer]:
+    """
+    Get the compiled scorer of a pipeline, compiling it on first use
+
+    Returns:
+        CompiledScorer: The scorer, None if the pipeline's shape is not supported
+    """
+    try:
+        classifier = pipeline.steps[-1][1]
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+    # The coefficients are replaced on each fit: compile again if the pipeline was refitted
+    fitted = getattr(classifier, 'coef_', None)
+    cached = _scorers.get(pipeline)
+    if cached is not None and cached[0] is fitted:
+        return cached[1]
+
+    scorer = compile_pipeline(pipeline) if fitted is not None else None
+    _scorers[pipeline] = (fitted, scorer)
+
+    return scorer
@@ -0,0 +1,136 @@
+import logging
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.model import score_models
+from src.metrics import shadow_seconds, shadow_predictions, shadow_disagreements, shadow_errors, shadow_dropped
+
+def parse_models(specs: str) -> List[Tuple[str, str]]:
+    """
+    Parse a list of models such as "LogisticRegression:latest,SGDIncremental:3", the version defaulting to latest
+    """
+    models = []
+    for spec in specs.split(","):
+        name, _, version = spec.strip().partition(":")
+        if name:
+            models.append((name, version or "latest"))
+
+    return models
+
+class ShadowEvaluator:
+    """
+    Score the answered predictions again with shadow models, off the critical path of the responses
+
+    The matches are queued to a dedicated thread, the shadow models sharing the
+    encoding of the matches when their preprocessors are identical (see `score_models`).
+    The latency of each shadow model and how often it disagrees with the model which
+    answered are recorded. When too many matches are pending, the new ones are dropped.
+    """
+    def __init__(
+            self,
+            models: List[Tuple[str, str]],
+            load: Callable[[str, str], Any],
+            max_pending: int = 1000,
+            executor: Optional[Executor] = None):
+        """
+        Args:
+            models (List[Tuple[str, str]]): The name and version of each shadow model
+            load (Callable[[str, str], Any]): Load a model from its name and version (see `load_model`)
+            max_pending (int): Number of matches waiting to be scored beyond which the new ones are dropped
+            executor (Executor): Where to score the matches, a dedicated thread if None
+        """
+        self.models = list(models)
+        self.load = load
+        self.max_pending = max_pending
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {model: {"predictions": 0, "disagreements": 0, "errors": 0, "seconds": 0.0} for model in self.models}
+        self._dropped = 0
+
+    def submit(self, match: Dict[str, Any], prediction: Dict[str, Any]) -> bool:
+        """
+        Queue a match to be scored by the shadow models, without waiting
+
+        Args:
+            match (Dict[str, Any]): The keyword arguments of `predict`
+            prediction (Dict[str, Any]): The prediction answered
+
+        Returns:
+            bool: False if the match was dropped
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._dropped += 1
+                shadow_dropped.inc()
+                return False
+            self._pending += 1
+
+        self.executor.submit(self._evaluate, match, prediction)
+        return True
+
+    def _evaluate(self, match: Dict[str, Any], prediction: Dict[str, Any]):
+        """
+        Score a match with the shadow models and record how they compare with the answered prediction
+        """
+        try:
+            pipelines = {}
+            for model in self.models:
+                try:
+                    pipelines[model] = self.load(*model)
+                except Exception as e:
+                    logging.warning(f"Could not load the shadow model {model[0]}:{model[1]}: {e}")
+                    self._record_error(model)
+
+            try:
+                results = score_models(pipelines, [match]) if pipelines else {}
+            except Exception as e:
+                logging.warning(f"Could not score the shadow models: {e}")
+                for model in pipelines:
+                    self._record_error(model)
+                return
+
+            for model, result in results.items():
+                disagrees = result["predictions"][0]["result"] != prediction["result"]
+                labels = {"model": model[0], "version": model[1]}
+                shadow_seconds.observe(result["seconds"], **labels)
+                shadow_predictions.inc(**labels)
+                if disagrees:
+                    shadow_disagreements.inc(**labels)
+                with self._lock:
+                    stats = self._stats[model]
+                    stats["predictions"] += 1
+                    stats["disagreements"] += disagrees
+                    stats["seconds"] += result["seconds"]
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _record_error(self, model: Tuple[str, str]):
+        shadow_errors.inc(model=model[0], version=model[1])
+        with self._lock:
+            self._stats[model]["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the number of matches scored, the disagreement rate and the mean latency of each shadow model
+        """
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "dropped": self._dropped,
+                "models": [
+                    {
+                        "model": name,
+                        "version": version,
+                        **stats,
+                        "disagreement_rate": stats["disagreements"] / stats["predictions"] if stats["predictions"] else None,
+                        "mean_seconds": stats["seconds"] / stats["predictions"] if stats["predictions"] else None,
+                    }
+                    for (name, version), stats in self._stats.items()
+                ],
+            }
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,165 @@
+import numpy as np
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from src.enums import Feature
+from src.model import predict_proba_features
+
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
+# Names of the last rounds of a draw, the earlier ones being numbered (1st Round, 2nd Round...)
+LAST_ROUNDS = ['Quarterfinals', 'Semifinals', 'The Final']
+
+def round_names(rounds: int) -> List[str]:
+    """
+    Get the names of the rounds of a draw, as in the match tables
+    """
+    ordinals = {1: '1st', 2: '2nd', 3: '3rd'}
+    first = [f"{ordinals.get(i, f'{i}th')} Round" for i in range(1, max(0, rounds - len(LAST_ROUNDS)) + 1)]
+    return (first + LAST_ROUNDS)[-rounds:] if rounds else []
+
+def _round_pairings(size: int, round_index: int):
+    """
+    Get all the pairings a round of a draw can produce: the players of the first half
+    of each block of 2^(round + 1) players against those of the second half
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The positions of the first and second players of each pairing
+    """
+    half = 2 ** round_index
+    blocks = size // (2 * half)
+    first = (np.arange(blocks)[:, None] * 2 * half + np.arange(half)[None, :])[:, :, None]
+    second = (first + half).transpose(0, 2, 1)
+    shape = (blocks, half, half)
+    return np.broadcast_to(first, shape).ravel(), np.broadcast_to(second, shape).ravel()
+
+def win_probabilities(
+        pipeline: 'Pipeline',
+        players: List[Optional[Dict[str, Any]]],
+        series: str,
+        surface: str,
+        court: str) -> np.ndarray:
+    """
+    Compute the probability of each player to beat each possible opponent, round by round
+
+    All the pairings the draw can produce are scored in a single batch, in both orders
+    (the model is not exactly symmetric, the two probabilities are averaged).
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        players (List[Optional[Dict[str, Any]]]): The draw, in order, each player with its 'rank' and 'points',
+            and optionally its 'elo' and 'surface_elo' ratings; None for a bye (losing against anyone)
+        series (str): The series of the tournament
+        surface (str): The surface of the tournament
+        court (str): The court of the tournament
+
+    Returns:
+        np.ndarray: P[r, i, j], the probability of player i to beat player j in round r
+    """
+    size = len(players)
+    rounds = size.bit_length() - 1
+    if size < 2 or size != 2 ** rounds:
+        raise ValueError(f"The draw must have a power of 2 players (byes included), not {size}")
+
+    byes = np.array([player is None for player in players])
+    def values(key: str) -> np.ndarray:
+        return np.array([np.nan if player is None or player.get(key) is None else player[key] for player in players], dtype=np.float64)
+
+    ranks, points, elo, surface_elo = values('rank'), values('points'), values('elo'), values('surface_elo')
+
+    pairings = [_round_pairings(size, r) for r in range(rounds)]
+    first = np.concatenate([i for i, _ in pairings])
+    second = np.concatenate([j for _, j in pairings])
+    names = round_names(rounds)
+    round_of_pair = np.concatenate([np.full(len(i), names[r], dtype=object) for r, (i, _) in enumerate(pairings)])
+
+    # Each pairing in both orders
+    a, b = np.concatenate([first, second]), np.concatenate([second, first])
+    count = len(a)
+    features = {
+        Feature.SERIES.name: np.full(count, series, dtype=object),
+        Feature.SURFACE.name: np.full(count, surface, dtype=object),
+        Feature.COURT.name: np.full(count, court, dtype=object),
+        Feature.ROUND.name: np.concatenate([round_of_pair, round_of_pair]),
+        Feature.DIFF_RANKING.name: ranks[a] - ranks[b],
+        Feature.DIFF_POINTS.name: points[a] - points[b],
+        Feature.DIFF_ELO.name: elo[a] - elo[b],
+        Feature.DIFF_SURFACE_ELO.name: surface_elo[a] - surface_elo[b],
+    }
+    probas, classes = predict_proba_features(pipeline, features)
+    win = probas[:, list(classes).index(1)]
+    win = (win[:len(first)] + 1 - win[len(first):]) / 2
+
+    P = np.full((rounds, size, size), 0.5, dtype=np.float32)
+    offset = 0
+    for r, (i, j) in enumerate(pairings):
+        P[r, i, j] = win[offset:offset + len(i)]
+        P[r, j, i] = 1 - win[offset:offset + len(i)]
+        offset += len(i)
+
+    # A bye loses against anyone
+    P[:, byes, :] = 0
+    P[:, :, byes] = np.where(byes[None, :, None], P[:, :, byes], 1)
+
+    return P
+
+def simulate_draw(P: np.ndarray, simulations: int = 10_000, seed: Optional[int] = None, chunk_size: int = 8192) -> np.ndarray:
+    """
+    Simulate a draw many times, all the matches of a round of a chunk of simulations at once
+
+    Args:
+        P (np.ndarray): The probabilities of each player to beat each other, per round (see `win_probabilities`)
+        simulations (int): Number of simulated draws
+        seed (int): Seed of the random draws
+        chunk_size (int): Number of draws simulated together, bounding the memory used
+
+    Returns:
+        np.ndarray: A[i, r], the probability of player i to win round r
+    """
+    rounds, size, _ = P.shape
+    rng = np.random.default_rng(seed)
+    wins = np.zeros((size, rounds), dtype=np.int64)
+    positions = np.arange(size, dtype=np.int16 if size < 2 ** 15 else np.int32)
+
+    for start in range(0, simulations, chunk_size):
+        alive = np.broadcast_to(positions, (min(chunk_size, simulations - start), size))
+        for r in range(rounds):
+            a, b = alive[:, 0::2], alive[:, 1::2]
+            p = P[r][a, b]
+            alive = np.where(rng.random(p.shape, dtype=np.float32) < p, a, b)
+            wins[:, r] += np.bincount(alive.ravel(), minlength=size)
+
+    return wins / simulations
+
+def simulate_tournament(
+        pipeline: 'Pipeline',
+        players: List[Optional[Dict[str, Any]]],
+        series: str,
+        surface: str,
+        court: str,
+        simulations: int = 10_000,
+        seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Estimate the chances of each player of the draw to win each round
+
+    Args:
+        pipeline (Pipeline): The fitted pipeline
+        players (List[Optional[Dict[str, Any]]]): The draw (see `win_probabilities`)
+        series (str): The series of the tournament
+        surface (str): The surface of the tournament
+        court (str): The court of the tournament
+        simulations (int): Number of simulated draws
+        seed (int): Seed of the random draws
+
+    Returns:
+        List[Dict[str, Any]]: Each player (byes left out) with its probability to win each round,
+            keyed by round name, winning 'The Final' meaning winning the tournament
+    """
+    P = win_probabilities(pipeline, players, series, surface, court)
+    advancement = simulate_draw(P, simulations, seed)
+    names = round_names(P.shape[0])
+
+    return [
+        {**player, "rounds": dict(zip(names, advancement[i].tolist()))}
+        for i, player in enumerate(players) if player is not None
+    ]
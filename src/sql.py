@@ -1,10 +1,21 @@
 import pandas as pd
 import psycopg2
-from typing import Literal
+import psycopg2.pool
+import threading
+import logging
+import time
+import uuid
+import json
+import hashlib
+from contextlib import contextmanager
+from typing import Literal, Callable, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
 import os
 
+from src.match_store import MatchStore
+from src.metrics import registry, db_query_seconds
+
 load_dotenv()
 
 PG_USER = os.getenv("PG_USER")
@@ -13,10 +24,17 @@ PG_HOST = os.getenv("PG_HOST")
 PG_PORT = os.getenv("PG_PORT")
 PG_DB = os.getenv("PG_DB")
 PG_SSLMODE = os.getenv("PG_SSLMODE")
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", 1))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", 10))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", 10))
+# Directory of the local cache of the match tables, disabled if empty
+MATCH_CACHE_DIR = os.getenv("MATCH_CACHE_DIR")
+# Seconds the list of tournaments is kept in memory
+TOURNAMENTS_CACHE_TTL = float(os.getenv("TOURNAMENTS_CACHE_TTL", 3600))
 
-def _get_connection() -> psycopg2.extensions.connection:
+def _connect() -> psycopg2.extensions.connection:
     """
-    Get a connection to the Postgres database
+    Open a new connection to the Postgres database
     """
     conn = psycopg2.connect(
         dbname=PG_DB,
@@ -28,24 +46,326 @@ def _get_connection() -> psycopg2.extensions.connection:
     )
     return conn
 
-def load_matches_from_postgres(
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections
+
+    - at most `maxconn` connections are open, `minconn` are opened on first use
+    - a checkout waits up to `timeout` seconds for a free connection
+    - connections are validated on checkout, and replaced when broken
+    """
+    def __init__(
+            self,
+            connect: Callable[[], psycopg2.extensions.connection],
+            minconn: int = 1,
+            maxconn: int = 10,
+            timeout: float = 10):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size")
+
+        self.connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+
+        self._condition = threading.Condition()
+        self._idle: List[psycopg2.extensions.connection] = []
+        self._size = 0
+        self._waiting = 0
+        self._started = False
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "validation_failures": 0,
+            "wait_time_seconds": 0.0,
+        }
+
+    def _open(self) -> psycopg2.extensions.connection:
+        """
+        Open a connection, the slot being already reserved in `_size`
+        """
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn: psycopg2.extensions.connection):
+        """
+        Close a connection and free its slot
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+        with self._condition:
+            self._size -= 1
+            self._stats["connections_discarded"] += 1
+            self._condition.notify()
+
+    @staticmethod
+    def _is_valid(conn: psycopg2.extensions.connection) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _prefill(self):
+        """
+        Open the minimum number of connections
+        """
+        with self._condition:
+            if self._started:
+                return
+            self._started = True
+            missing = max(0, self.minconn - self._size)
+            self._size += missing
+
+        for _ in range(missing):
+            try:
+                conn = self._open()
+            except Exception as e:
+                logging.error(f'Could not open a database connection: {e}')
+                continue
+            with self._condition:
+                self._idle.append(conn)
+                self._condition.notify()
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        """
+        Check out a valid connection
+
+        Raises:
+            psycopg2.pool.PoolError: If no connection is available within the timeout
+        """
+        self._prefill()
+        start = time.perf_counter()
+        deadline = start + self.timeout
+
+        while True:
+            with self._condition:
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise psycopg2.pool.PoolError(f"No database connection available after {self.timeout}s")
+                    self._waiting += 1
+                    self._condition.wait(remaining)
+                    self._waiting -= 1
+
+                conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    self._size += 1
+
+            if conn is None:
+                conn = self._open()
+            elif not self._is_valid(conn):
+                # Broken connection (server restart, network failure...): replace it
+                with self._condition:
+                    self._stats["validation_failures"] += 1
+                self._discard(conn)
+                continue
+
+            with self._condition:
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_seconds"] += time.perf_counter() - start
+            return conn
+
+    def putconn(self, conn: psycopg2.extensions.connection, broken: bool = False):
+        """
+        Give a connection back to the pool
+        """
+        if broken or conn.closed:
+            self._discard(conn)
+            return
+
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[psycopg2.extensions.connection]:
+        """
+        Check out a connection for the duration of the block.
+        The transaction is committed on success and rolled back on error.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def closeall(self):
+        """
+        Close the idle connections
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the usage statistics of the pool
+        """
+        with self._condition:
+            return {
+                **self._stats,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+            }
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """
+    Get the process-wide connection pool, created on first use
+    (and again in a forked process, connections cannot be shared across processes)
+    """
+    global _pool, _pool_pid
+
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(_connect, minconn=PG_POOL_MIN, maxconn=PG_POOL_MAX, timeout=PG_POOL_TIMEOUT)
+                _pool_pid = os.getpid()
+
+    return _pool
+
+def _get_connection():
+    """
+    Get a connection to the Postgres database from the pool, to use as a context manager:
+
+        with _get_connection() as conn:
+            ...
+    """
+    return get_pool().connection()
+
+def pool_stats() -> Dict[str, float]:
+    """
+    Get the usage statistics of the connection pool
+    """
+    return get_pool().stats()
+
+def _collect_pool_metrics():
+    """
+    Expose the statistics of the connection pool as metrics, if it has been created
+    """
+    if _pool is None or _pool_pid != os.getpid():
+        return
+    stats = _pool.stats()
+    yield 'tennis_db_pool_checkouts_total', 'counter', 'Connections taken from the pool', [({}, stats["checkouts"])]
+    yield 'tennis_db_pool_timeouts_total', 'counter', 'Waits for a connection that timed out', [({}, stats["timeouts"])]
+    yield 'tennis_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a connection', [({}, stats["wait_time_seconds"])]
+    yield 'tennis_db_pool_connections', 'gauge', 'Connections of the pool', [({"state": "idle"}, stats["idle"]), ({"state": "in_use"}, stats["in_use"])]
+
+registry.add_collector(_collect_pool_metrics)
+
+# Columns needed to build the features of the model (see `create_pairwise_data`), the players for their Elo ratings
+MATCH_COLUMNS = [
+    'date',
+    'series',
+    'surface',
+    'court',
+    'round',
+    'winner',
+    'loser',
+    'w_rank',
+    'l_rank',
+    'w_points',
+    'l_points',
+]
+
+# Columns identifying a match: the matches already ingested are skipped (see `src.ingest`),
+# and the matches are loaded in this order, chronological and the same on every load
+MATCH_KEY = ['date', 'tournament', 'round', 'winner', 'loser']
+
+def _matches_query(
         table_name: Literal['atp_data', 'wta_data'],
-        from_date: str = None,
-        to_date: str = None) -> pd.DataFrame:
+        from_date: Optional[str],
+        to_date: Optional[str],
+        columns: Optional[List[str]],
+        ordered: bool = False) -> Tuple[str, List[str]]:
     """
-    Load data from Postgres
+    Build the query selecting the matches between two dates, sorted by MATCH_KEY if `ordered`
     """
     if not to_date:
         to_date = datetime.now().strftime("%Y-%m-%d")
     
     if not from_date:
         from_date = "1900-01-01"
-    
-    query = f"SELECT * FROM {table_name} WHERE date BETWEEN %s AND %s"
-    vars = [from_date, to_date]
-    
+
+    selected = ", ".join(columns) if columns else "*"
+    query = f"SELECT {selected} FROM {table_name} WHERE date BETWEEN %s AND %s"
+    if ordered:
+        query += f" ORDER BY {', '.join(MATCH_KEY)}"
+
+    return query, [from_date, to_date]
+
+# Columns holding categories, the others being dates or numbers
+CATEGORY_COLUMNS = ['series', 'surface', 'court', 'round', 'winner', 'loser']
+
+def load_matches_from_postgres(
+        table_name: Literal['atp_data', 'wta_data'],
+        from_date: str = None,
+        to_date: str = None,
+        columns: Optional[List[str]] = MATCH_COLUMNS,
+        use_cache: Optional[bool] = None) -> pd.DataFrame:
+    """
+    Load data from Postgres
+
+    Args:
+        table_name (str): The table of the circuit
+        from_date (str): First date (YYYY-MM-DD) included, 1900-01-01 if empty
+        to_date (str): Last date (YYYY-MM-DD) included, today if empty
+        columns (List[str]): The columns to select, all of them if None
+        use_cache (bool): Go through the local match cache, defaults to True when MATCH_CACHE_DIR is set.
+            Only the MATCH_COLUMNS can be served from the cache.
+
+    Returns:
+        pd.DataFrame: The matches, sorted by MATCH_KEY
+    """
+    if use_cache is None:
+        use_cache = bool(MATCH_CACHE_DIR)
+
+    if use_cache and columns and set(columns) <= set(MATCH_COLUMNS):
+        _, (from_date, to_date) = _matches_query(table_name, from_date, to_date, columns)
+        return get_match_store(table_name).load(from_date, to_date)[columns]
+
+    # The Elo ratings depend on the order of the matches of a same date
+    query, vars = _matches_query(table_name, from_date, to_date, columns, ordered=True)
+
     with _get_connection() as conn:
-        with conn.cursor() as cursor:
+        with conn.cursor() as cursor, db_query_seconds.time(query='load_matches'):
             cursor.execute(query, vars)
             data = cursor.fetchall()
 
@@ -53,9 +373,108 @@ def load_matches_from_postgres(
 
     return data
 
+def iter_matches_from_postgres(
+        table_name: Literal['atp_data', 'wta_data'],
+        from_date: str = None,
+        to_date: str = None,
+        columns: Optional[List[str]] = MATCH_COLUMNS,
+        chunk_size: int = 50_000) -> Iterator[pd.DataFrame]:
+    """
+    Load data from Postgres through a server-side cursor, chunk by chunk,
+    so that the whole result set is never held in memory
+
+    Args:
+        table_name (str): The table of the circuit
+        from_date (str): First date (YYYY-MM-DD) included, 1900-01-01 if empty
+        to_date (str): Last date (YYYY-MM-DD) included, today if empty
+        columns (List[str]): The columns to select, all of them if None
+        chunk_size (int): Number of matches per chunk
+
+    Yields:
+        pd.DataFrame: The matches sorted by MATCH_KEY, at most `chunk_size` at a time
+    """
+    # The Elo ratings are computed chunk by chunk (see `load_pairwise_data`)
+    query, vars = _matches_query(table_name, from_date, to_date, columns, ordered=True)
+
+    with _get_connection() as conn:
+        # Named cursors are server-side cursors
+        with conn.cursor(name=f"{table_name}_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = chunk_size
+            with db_query_seconds.time(query='iter_matches'):
+                cursor.execute(query, vars)
+
+            while True:
+                with db_query_seconds.time(query='iter_matches_fetch'):
+                    rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
+
+def get_data_version(
+        table_name: Literal['atp_data', 'wta_data'],
+        from_date: str = None,
+        to_date: str = None) -> str:
+    """
+    Get a fingerprint of the matches between two dates, changing when matches are added,
+    removed or their rankings and points are corrected (not their categories)
+
+    Args:
+        table_name (str): The table of the circuit
+        from_date (str): First date (YYYY-MM-DD) included, 1900-01-01 if empty
+        to_date (str): Last date (YYYY-MM-DD) included, today if empty
+
+    Returns:
+        str: The fingerprint
+    """
+    query, vars = _matches_query(table_name, from_date, to_date, [
+        'count(*)', 'max(date)', 'sum(w_rank)', 'sum(l_rank)', 'sum(w_points)', 'sum(l_points)'])
+
+    with _get_connection() as conn:
+        with conn.cursor() as cursor, db_query_seconds.time(query='data_version'):
+            cursor.execute(query, vars)
+            row = cursor.fetchone()
+
+    return hashlib.sha256(json.dumps(list(row), default=str).encode()).hexdigest()[:16]
+
+_match_stores: Dict[str, MatchStore] = {}
+_match_stores_lock = threading.Lock()
+
+def get_match_store(table_name: Literal['atp_data', 'wta_data']) -> MatchStore:
+    """
+    Get the local cache of a match table, stored in MATCH_CACHE_DIR
+    """
+    if not MATCH_CACHE_DIR:
+        raise ValueError("MATCH_CACHE_DIR environment variable is not set.")
+
+    with _match_stores_lock:
+        if table_name not in _match_stores:
+            _match_stores[table_name] = MatchStore(
+                root=os.path.join(MATCH_CACHE_DIR, table_name),
+                columns=MATCH_COLUMNS,
+                category_columns=CATEGORY_COLUMNS,
+                fetch=lambda from_date, to_date: iter_matches_from_postgres(table_name, from_date, to_date))
+
+        return _match_stores[table_name]
+
+def invalidate_match_cache(table_name: Literal['atp_data', 'wta_data']):
+    """
+    Drop the local cache of a match table
+    """
+    get_match_store(table_name).invalidate()
+
+def refresh_match_cache(
+        table_name: Literal['atp_data', 'wta_data'],
+        from_date: str = None,
+        to_date: str = None):
+    """
+    Fetch again the matches of a table between two dates into the local cache
+    """
+    _, (from_date, to_date) = _matches_query(table_name, from_date, to_date, None)
+    get_match_store(table_name).refresh(from_date, to_date)
+
 def list_tournaments(circuit: Literal["atp", "wta"]):
     """
-    List the tournaments of the circuit
+    List the tournaments of the circuit, in a stable order (their ETag depends on it)
     """
     query = f"""
         SELECT DISTINCT
@@ -63,11 +482,90 @@ def list_tournaments(circuit: Literal["atp", "wta"]):
             series,
             court,
             surface
-        FROM {circuit}_data;
+        FROM {circuit}_data
+        ORDER BY name, series, court, surface;
     """
     with _get_connection() as conn:
-        with conn.cursor() as cursor:
+        with conn.cursor() as cursor, db_query_seconds.time(query='list_tournaments'):
             cursor.execute(query)
             tournaments = [{'name': row[0], 'series': row[1], 'court': row[2], 'surface': row[3]} for row in cursor.fetchall()]
 
-    return tournaments
\ No newline at end of file
+    return tournaments
+
+class TournamentIndex:
+    """
+    Tournaments of a circuit, indexed by surface and series
+    """
+    def __init__(self, tournaments: List[Dict[str, str]], ttl: float):
+        self.tournaments = tournaments
+        self.expires_at = time.monotonic() + ttl
+        self.etag = hashlib.sha1(json.dumps(tournaments, sort_keys=True, default=str).encode()).hexdigest()
+        self.by_surface: Dict[str, List[int]] = {}
+        self.by_series: Dict[str, List[int]] = {}
+        for i, tournament in enumerate(tournaments):
+            self.by_surface.setdefault(tournament['surface'], []).append(i)
+            self.by_series.setdefault(tournament['series'], []).append(i)
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def get_etag(self, surface: Optional[str] = None, series: Optional[str] = None) -> str:
+        """
+        Get the (quoted) ETag of the tournaments matching the filters
+        """
+        if surface is None and series is None:
+            return f'"{self.etag}"'
+        return f'"{self.etag}-{hashlib.sha1(f"{surface}|{series}".encode()).hexdigest()[:12]}"'
+
+    def filter(self, surface: Optional[str] = None, series: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Get the tournaments matching the filters
+        """
+        if surface is None and series is None:
+            return self.tournaments
+
+        indices = None
+        if surface is not None:
+            indices = set(self.by_surface.get(surface, []))
+        if series is not None:
+            matching = set(self.by_series.get(series, []))
+            indices = matching if indices is None else indices & matching
+
+        return [self.tournaments[i] for i in sorted(indices)]
+
+_tournament_indexes: Dict[str, TournamentIndex] = {}
+_tournament_indexes_lock = threading.Lock()
+
+def get_tournament_index(circuit: Literal["atp", "wta"], cached_only: bool = False) -> Optional[TournamentIndex]:
+    """
+    Get the tournaments of the circuit, from the database once every TOURNAMENTS_CACHE_TTL seconds
+
+    Args:
+        circuit (str): The circuit
+        cached_only (bool): Do not query the database, None being returned if the cache is empty or expired
+
+    Returns:
+        TournamentIndex: The tournaments
+    """
+    index = _tournament_indexes.get(circuit)
+    if (index is not None and index.fresh) or cached_only:
+        return index if index is not None and index.fresh else None
+
+    with _tournament_indexes_lock:
+        # Another request may have refreshed it while waiting for the lock
+        index = _tournament_indexes.get(circuit)
+        if index is None or not index.fresh:
+            index = _tournament_indexes[circuit] = TournamentIndex(list_tournaments(circuit), TOURNAMENTS_CACHE_TTL)
+
+    return index
+
+def invalidate_tournaments_cache(circuit: Optional[Literal["atp", "wta"]] = None):
+    """
+    Drop the cached tournaments of a circuit, of all circuits if None
+    """
+    with _tournament_indexes_lock:
+        if circuit is None:
+            _tournament_indexes.clear()
+        else:
+            _tournament_indexes.pop(circuit, None)
@@ -1,5 +1,9 @@
 import pytest
+import numpy as np
 import pandas as pd
+from sklearn.pipeline import Pipeline
+
+from src.model import create_pipeline, preprocess_data, train_model
 
 @pytest.fixture
 def simple_match():
@@ -12,6 +16,10 @@ def simple_match():
         'l_rank': [300],
         'w_points': [2000],
         'l_points': [40],
+        'w_elo': [1850.0],
+        'l_elo': [1600.0],
+        'w_surface_elo': [1700.0],
+        'l_surface_elo': [1720.0],
     })
 
 @pytest.fixture
@@ -23,6 +31,8 @@ def simple_match_pairwise_data(simple_match: pd.DataFrame):
         'Round': ['Round Robin', 'Round Robin'],
         'diffRanking': [-295, 295],
         'diffPoints': [1960, -1960],
+        'diffElo': [250.0, -250.0],
+        'diffSurfaceElo': [-20.0, 20.0],
         'target': [1, 0]
     })
 
@@ -35,5 +45,37 @@ def simple_match_empty():
         'Round': [],
         'diffRanking': [],
         'diffPoints': [],
+        'diffElo': [],
+        'diffSurfaceElo': [],
         'target': []
     })
+
+@pytest.fixture(scope='session')
+def random_matches() -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    size = 500
+    w_rank = rng.integers(1, 300, size)
+    l_rank = w_rank + rng.integers(-50, 200, size).clip(min=1 - w_rank)
+
+    return pd.DataFrame({
+        'date': pd.date_range('2023-01-01', periods=size, freq='D'),
+        'series': rng.choice(['ATP250', 'ATP500', 'Masters 1000', 'Grand Slam'], size),
+        'surface': rng.choice(['Clay', 'Hard', 'Grass'], size),
+        'court': rng.choice(['Indoor', 'Outdoor'], size),
+        'round': rng.choice(['1st Round', '2nd Round', 'Quarterfinals', 'Semifinals', 'The Final'], size),
+        'w_rank': w_rank,
+        'l_rank': l_rank,
+        'w_points': (10000 / w_rank).astype(int),
+        'l_points': (10000 / l_rank).astype(int),
+        'w_elo': 2200 - 2 * w_rank + rng.normal(0, 50, size),
+        'l_elo': 2200 - 2 * l_rank + rng.normal(0, 50, size),
+        'w_surface_elo': 2200 - 2 * w_rank + rng.normal(0, 100, size),
+        'l_surface_elo': 2200 - 2 * l_rank + rng.normal(0, 100, size),
+        'winner': [f'Player {i}' for i in w_rank // 5],
+        'loser': [f'Player {i}' for i in l_rank // 5],
+    })
+
+@pytest.fixture(scope='session')
+def fitted_pipeline(random_matches: pd.DataFrame) -> Pipeline:
+    X_train, _, y_train, _ = preprocess_data(random_matches)
+    return train_model(create_pipeline(), X_train, y_train)
@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+import src.backtest as backtest
+from src.backtest import make_windows, run_backtest
+from src.elo import EloRatings
+
+def test_make_windows():
+    rolling = make_windows('2020-01-01', '2021-12-31', train_months=12, test_months=6)
+    expanding = make_windows('2020-01-01', '2021-12-31', train_months=12, test_months=6, mode='expanding')
+
+    assert rolling == [
+        {"train_start": "2020-01-01", "train_end": "2020-12-31", "test_start": "2021-01-01", "test_end": "2021-06-30"},
+        {"train_start": "2020-07-01", "train_end": "2021-06-30", "test_start": "2021-07-01", "test_end": "2021-12-31"},
+    ]
+    assert [w["train_start"] for w in expanding] == ["2020-01-01", "2020-01-01"]
+    assert [w["test_start"] for w in expanding] == ["2021-01-01", "2021-07-01"]
+
+def test_run_backtest(monkeypatch: pytest.MonkeyPatch, random_matches: pd.DataFrame):
+    """
+    The matches are loaded once, each window is evaluated on the matches following its training period
+    """
+    matches = random_matches.assign(date=pd.date_range('2020-01-01', periods=len(random_matches), freq='2D').date)
+    loads = []
+    def load_matches(table_name, from_date, to_date):
+        loads.append((table_name, from_date, to_date))
+        return matches
+    monkeypatch.setattr(backtest, 'load_matches_from_postgres', load_matches)
+    monkeypatch.setattr(backtest, 'ratings_before', lambda circuit, date: EloRatings())
+    monkeypatch.delenv('MLFLOW_SERVER_URI', raising=False)
+
+    output = run_backtest('atp', '2020-01-01', '2022-09-30', train_months=12, test_months=6, n_jobs=2)
+
+    assert loads == [('atp_data', '2020-01-01', '2022-09-30')], "The matches should be loaded once"
+    assert output["summary"]["windows"] == output["summary"]["evaluated_windows"] == 4
+    for window in output["windows"]:
+        assert window["train_end"] < window["test_start"]
+        assert 0.5 < window["accuracy"] <= 1 and window["log_loss"] > 0
+        assert sum(b["count"] for b in window["calibration"]) == 2 * window["test_matches"]
+        assert window["test_matches"] == ((matches['date'] >= pd.Timestamp(window["test_start"]).date())
+                                          & (matches['date'] <= pd.Timestamp(window["test_end"]).date())).sum()
@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from src.batching import PredictionBatcher
+
+def test_batcher_coalesces_predictions():
+    """
+    Concurrent predictions of a key are scored in one batch, each caller getting its own result
+    """
+    batches = []
+    def score(pipeline, matches):
+        batches.append((pipeline, len(matches)))
+        return [{"result": match["value"] * 2} for match in matches]
+
+    batcher = PredictionBatcher(score, window=0.01, max_size=100)
+
+    async def run():
+        return await asyncio.gather(
+            *[batcher.submit('a', 'pipeline-a', {"value": i}) for i in range(10)],
+            batcher.submit('b', 'pipeline-b', {"value": 100}))
+    results = asyncio.run(run())
+
+    assert [r["result"] for r in results] == [i * 2 for i in range(10)] + [200]
+    assert sorted(batches) == [('pipeline-a', 10), ('pipeline-b', 1)], "One batch per key expected"
+
+def test_batcher_max_size():
+    batches = []
+    def score(pipeline, matches):
+        batches.append(len(matches))
+        return [{} for _ in matches]
+
+    # The window is long enough that only the maximum size can flush in time
+    batcher = PredictionBatcher(score, window=0.5, max_size=4)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(*[batcher.submit('a', None, {}) for i in range(8)]), timeout=0.4)
+    asyncio.run(run())
+
+    assert batches == [4, 4], "Full batches should be flushed immediately"
+
+def test_batcher_errors():
+    def score(pipeline, matches):
+        raise ValueError("Broken model")
+
+    batcher = PredictionBatcher(score, window=0.001)
+
+    async def run():
+        return await asyncio.gather(*[batcher.submit('a', None, {}) for i in range(3)], return_exceptions=True)
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, ValueError) for r in results), "Every caller should get the error"
+
+def test_batcher_executor():
+    """
+    Batches can be scored in an executor
+    """
+    def score(pipeline, matches):
+        return [{"result": match["value"]} for match in matches]
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        batcher = PredictionBatcher(score, window=0.001, executor=executor)
+
+        async def run():
+            return await asyncio.gather(*[batcher.submit('a', None, {"value": i}) for i in range(5)])
+        results = asyncio.run(run())
+
+    assert [r["result"] for r in results] == list(range(5))
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.elo as elo_module
+from src.elo import EloRatings, add_elo_ratings, update_elo_ratings, RATING_COLUMNS
+
+def _matches(rows):
+    return pd.DataFrame(rows, columns=['date', 'winner', 'loser', 'surface'])
+
+def test_ratings_before_each_match():
+    """
+    Each match gets the ratings before it, in input order, the matches being rated chronologically
+    """
+    matches = _matches([
+        ('2024-01-02', 'Sinner J.', 'Alcaraz C.', 'Clay'),
+        ('2024-01-01', 'Alcaraz C.', 'Medvedev D.', 'Hard'),
+        ('2024-01-03', 'Sinner J.', 'Medvedev D.', None),
+    ])
+    elo = EloRatings()
+    ratings = pd.DataFrame(elo.update(matches), columns=RATING_COLUMNS)
+
+    gain = 250 / 5 ** 0.4 / 2 # First match, between equal ratings
+    assert ratings.loc[1].tolist() == [1500, 1500, 1500, 1500]
+    assert ratings.loc[0, 'w_elo'] == 1500 and ratings.loc[0, 'l_elo'] == pytest.approx(1500 + gain)
+    assert ratings.loc[0, 'l_surface_elo'] == 1500, "Surface ratings only count the matches on the surface"
+    assert np.isnan(ratings.loc[2, 'w_surface_elo']), "No surface rating without surface"
+    assert elo.get('Sinner J.', 'Clay')[1] > 1500 and elo.get('Sinner J.')[1] is None
+    assert elo.get('Nobody') is None
+    assert elo.last_date == '2024-01-03'
+
+def test_incremental_update(tmp_path, random_matches: pd.DataFrame):
+    """
+    Rating the matches in two steps, with a saved state in between, gives the same ratings as at once
+    """
+    full = EloRatings()
+    expected = full.update(random_matches)
+
+    first = EloRatings()
+    head, tail = random_matches.iloc[:300], random_matches.iloc[300:]
+    first.update(head)
+    first.save(str(tmp_path / 'elo.json'))
+    second = EloRatings.load(str(tmp_path / 'elo.json'))
+
+    assert np.allclose(np.vstack([expected[:300], second.update(tail)]), expected, equal_nan=True)
+    for name in full.players:
+        assert second.get(name, 'Clay') == pytest.approx(full.get(name, 'Clay')), f"Different ratings of {name}"
+
+    with pytest.raises(ValueError):
+        second.update(head)
+
+    with_ratings = add_elo_ratings(random_matches)
+    assert np.allclose(with_ratings[RATING_COLUMNS].to_numpy(), expected, equal_nan=True)
+
+def test_update_elo_ratings(monkeypatch: pytest.MonkeyPatch, tmp_path, random_matches: pd.DataFrame):
+    """
+    Only the matches after the last rated date are loaded, the state being saved after each update
+    """
+    loads = []
+    def load_matches(table_name, from_date=None, to_date=None, columns=None):
+        loads.append(from_date)
+        dates = random_matches['date']
+        return random_matches[dates >= pd.Timestamp(from_date or '1900-01-01')][columns]
+    monkeypatch.setattr(elo_module, 'load_matches_from_postgres', load_matches)
+    monkeypatch.setattr(elo_module, 'ELO_STATE_DIR', str(tmp_path))
+    monkeypatch.setattr(elo_module, '_ratings', {})
+
+    assert update_elo_ratings('atp')["matches"] == len(random_matches)
+    assert update_elo_ratings('atp')["matches"] == 0
+    assert loads == [None, '2024-05-15']
+
+    monkeypatch.setattr(elo_module, '_ratings', {})
+    assert elo_module.get_elo_ratings('atp').last_date == '2024-05-14', "The state should be loaded back"
+    update_elo_ratings('atp', full=True)
+    assert loads[-1] is None
+
+def test_ratings_before_starts_from_saved_ratings(monkeypatch: pytest.MonkeyPatch, tmp_path, random_matches: pd.DataFrame):
+    """
+    The ratings before a date start from the latest saved ratings before it, giving the same ratings as a full pass
+    """
+    loads = []
+    def load_matches(table_name, from_date=None, to_date=None, columns=None):
+        loads.append((from_date, to_date))
+        dates = random_matches['date']
+        return random_matches[(dates >= pd.Timestamp(from_date or '1900-01-01')) & (dates <= pd.Timestamp(to_date or '2100-01-01'))][columns]
+    monkeypatch.setattr(elo_module, 'load_matches_from_postgres', load_matches)
+    monkeypatch.setattr(elo_module, 'ELO_STATE_DIR', str(tmp_path))
+    monkeypatch.setattr(elo_module, '_ratings', {})
+
+    update_elo_ratings('atp')
+    assert elo_module._snapshot_dates('atp') == ['2023-12-31'], "A snapshot at the end of each complete year"
+
+    expected = EloRatings()
+    expected.update(random_matches[random_matches['date'] < pd.Timestamp('2024-03-01')])
+    loads.clear()
+    elo = elo_module.ratings_before('atp', '2024-03-01')
+    assert loads == [('2024-01-01', '2024-02-29')], "Only the matches after the snapshot are loaded"
+    for name in expected.players:
+        assert elo.get(name, 'Hard') == pytest.approx(expected.get(name, 'Hard')), f"Different ratings of {name}"
+
+    loads.clear()
+    elo = elo_module.ratings_before('atp', '2024-06-01')
+    assert loads == [('2024-05-15', '2024-05-31')], "Starts from the current ratings"
+    assert elo is not elo_module.get_elo_ratings('atp') and elo.last_date == '2024-05-14'
+
+    loads.clear()
+    elo_module.ratings_before('atp', '2023-06-01')
+    assert loads == [(None, '2023-05-31')], "No saved ratings before the date"
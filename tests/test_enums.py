@@ -9,7 +9,7 @@ def test_get_features_by_type():
     assert all([feature.type == 'category' for feature in features])
 
     features = Feature.get_features_by_type('number')
-    assert len(features) == 2
+    assert len(features) == 4
     assert all([feature.type == 'number' for feature in features])
 
 def test_get_all_features():
@@ -17,5 +17,5 @@ def test_get_all_features():
     Test the method Feature.get_all_features
     """
     features = Feature.get_all_features()
-    assert len(features) == 6
+    assert len(features) == 8
 
@@ -0,0 +1,151 @@
+import re
+import csv
+from types import SimpleNamespace
+from contextlib import contextmanager
+import psycopg2.errors
+import pandas as pd
+import pytest
+
+import src.ingest as ingest
+from src.ingest import MATCH_KEY, read_matches, ingest_files
+
+class FakePostgres:
+    """
+    In-memory stand-in for the statements run by the ingestion
+    """
+    def __init__(self):
+        self.tables = {}
+        self.copied = []
+        self.queries = []
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        return FakeCursor(self)
+
+class FakeCursor:
+    def __init__(self, db: FakePostgres):
+        self.db = db
+        self.rows = []
+        self.rowcount = -1
+
+    def execute(self, query, vars=None):
+        query = ' '.join(query.split())
+        self.db.queries.append(query)
+        if 'information_schema.columns' in query:
+            self.rows = list(self.db.tables.get(vars[0], {}).get('types', {}).items())
+        elif match := re.match(r'CREATE TABLE (\w+) \((.*)\)', query):
+            types = dict(column.split() for column in match.group(2).split(', '))
+            self.db.tables[match.group(1)] = {'types': types, 'rows': [], 'indexes': set()}
+        elif match := re.match(r'CREATE UNIQUE INDEX IF NOT EXISTS (\w+) ON (\w+) \((.*)\)', query):
+            table = self.db.tables[match.group(2)]
+            keys = [tuple(row[c] for c in match.group(3).split(', ')) for row in table['rows']]
+            if len(set(keys)) < len(keys):
+                raise psycopg2.errors.UniqueViolation(f'could not create unique index "{match.group(1)}"')
+            table['indexes'].add(match.group(1))
+        elif query.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            pass
+        elif match := re.match(r'CREATE TEMP TABLE (\w+) \(LIKE (\w+)', query):
+            self.db.tables[match.group(1)] = {'types': self.db.tables[match.group(2)]['types'], 'rows': []}
+        elif match := re.match(r'INSERT INTO (\w+) \((.*?)\) SELECT .* FROM (\w+) s', query):
+            table, staging = self.db.tables[match.group(1)], self.db.tables.pop(match.group(3))
+            if 'ON CONFLICT' in query and not table['indexes']:
+                raise psycopg2.errors.InvalidColumnReference('there is no unique constraint matching the ON CONFLICT specification')
+            existing = {tuple(row[c] for c in MATCH_KEY) for row in table['rows']}
+            new = [row for row in staging['rows'] if tuple(row[c] for c in MATCH_KEY) not in existing]
+            table['rows'].extend(new)
+            self.rowcount = len(new)
+        else:
+            raise AssertionError(f'Unexpected query: {query}')
+
+    def copy_expert(self, sql, file):
+        table, columns = re.match(r'COPY (\w+) \((.*?)\)', sql).groups()
+        content = file.read()
+        self.db.copied.append(content)
+        for values in csv.reader(content.splitlines()):
+            self.db.tables[table]['rows'].append({c: v or None for c, v in zip(columns.split(', '), values)})
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+@pytest.fixture
+def spreadsheet(tmp_path) -> str:
+    """
+    A yearly file shaped as the ones of tennis-data.co.uk
+    """
+    path = tmp_path / 'atp_2024.xlsx'
+    pd.DataFrame({
+        'ATP': [1, 1, 1, 1, 2],
+        'Location': ['Brisbane', 'Brisbane', 'Brisbane', 'Brisbane', 'Doha'],
+        'Tournament': ['Brisbane International ', 'Brisbane International', 'Brisbane International', 'Brisbane International', 'Qatar Open'],
+        'Date': pd.to_datetime(['2024-01-01', '2024-01-01', '2024-01-02', '2024-01-02', '2024-01-08']),
+        'Series': ['ATP250', 'ATP250', 'ATP250', 'ATP250', 'ATP250'],
+        'Court': ['Outdoor'] * 5,
+        'Surface': ['Hard'] * 5,
+        'Round': ['1st Round', '1st Round', '2nd Round', '2nd Round', '1st Round'],
+        'Best of': [3] * 5,
+        'Winner': ['Dimitrov G.', 'Dimitrov G.', 'Rune H.', None, 'Murray A.'],
+        'Loser': ['Thompson J.', 'Thompson J.', 'Safiullin R.', 'Nadal R.', 'Mannarino A.'],
+        'WRank': [14, 14, 8, 10, 'NR'],
+        'LRank': [55, 55, 41, 672, 22],
+        'WPts': [2570, 2570, 3660, 3000, None],
+        'LPts': [780, 780, 1013, 20, 1680],
+        'B365W': [1.2, 1.2, 1.5, 1.1, 2.5],
+    }).to_excel(path, index=False)
+    return str(path)
+
+def test_read_matches(spreadsheet: str):
+    """
+    The columns are renamed, the text stripped, the missing ranks NULL, duplicates and incomplete matches dropped
+    """
+    matches = read_matches(spreadsheet)
+
+    assert len(matches) == 3, "The duplicate and the match without winner should be dropped"
+    assert {'tournament', 'date', 'series', 'round', 'winner', 'loser', 'w_rank', 'l_rank', 'w_points', 'l_points', 'best_of', 'b365w'} <= set(matches.columns)
+    assert matches.loc[0, 'tournament'] == 'Brisbane International'
+    assert pd.isna(matches.loc[2, 'w_rank']) and pd.isna(matches.loc[2, 'w_points'])
+    assert str(matches.loc[0, 'date']) == '2024-01-01'
+
+def test_ingest_files_skips_present_matches(monkeypatch: pytest.MonkeyPatch, spreadsheet: str):
+    db = FakePostgres()
+    monkeypatch.setattr(ingest, '_get_connection', db.connection)
+
+    first = ingest_files('atp', [spreadsheet])
+    second = ingest_files('atp', [spreadsheet])
+
+    assert (first['inserted'], first['skipped']) == (3, 0)
+    assert (second['inserted'], second['skipped']) == (0, 3), "Matches already present should be skipped"
+    assert first['rows_per_second'] > 0
+    assert (first['from_date'], first['to_date']) == ('2024-01-01', '2024-01-08')
+
+    assert len(db.tables['atp_data']['rows']) == 3
+    assert 'b365w' not in db.tables['atp_data']['rows'][0], "Only the columns of the table are ingested"
+    assert '14,' in db.copied[0] and '14.0' not in db.copied[0], "Integers must be copied as integers"
+    assert db.tables['atp_data']['indexes'] == {'atp_data_match_key'}, "The matches should be indexed"
+    assert not [query for query in db.queries if 'WHERE NOT EXISTS' in query], "The index should be used to skip the present matches"
+
+def test_ingest_without_index(monkeypatch: pytest.MonkeyPatch, spreadsheet: str):
+    """
+    A table holding duplicate matches cannot be indexed, the present matches being looked up instead
+    """
+    db = FakePostgres()
+    monkeypatch.setattr(ingest, '_get_connection', db.connection)
+    ingest_files('atp', [spreadsheet])
+    table = db.tables['atp_data']
+    table['indexes'].clear()
+    table['rows'].append(dict(table['rows'][0]))
+
+    # Too fast to be timed
+    monkeypatch.setattr(ingest, 'time', SimpleNamespace(perf_counter=lambda: 0.0))
+    report = ingest.ingest_matches('atp', read_matches(spreadsheet))
+
+    assert (report['inserted'], report['skipped']) == (0, 3) and report['rows_per_second'] is None
+    assert not table['indexes'] and [query for query in db.queries if 'WHERE NOT EXISTS' in query]
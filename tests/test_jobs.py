@@ -0,0 +1,143 @@
+import os
+import time
+import pickle
+import multiprocessing
+import pytest
+
+from src.jobs import JobClient, JobManager, start_job_server
+
+def slow_square(value: int, delay: float = 0) -> int:
+    time.sleep(delay)
+    return value * value
+
+def failing(value: int):
+    raise ValueError(f"Bad value {value}")
+
+def crashing(code: int):
+    os._exit(code)
+
+@pytest.fixture(scope='module')
+def job_manager():
+    manager = JobManager(max_workers=1)
+    yield manager
+    manager.shutdown()
+
+def test_job_succeeds(job_manager: JobManager):
+    job, created = job_manager.submit(slow_square, value=3)
+    assert created
+
+    job = job_manager.wait(job.id, timeout=30)
+    status = job.to_dict()
+    assert status['status'] == 'succeeded' and status['result'] == 9
+    assert status['duration_seconds'] is not None and status['started_at'] >= status['submitted_at']
+
+def test_job_fails(job_manager: JobManager):
+    job, _ = job_manager.submit(failing, value=3)
+
+    job = job_manager.wait(job.id, timeout=30)
+    assert job.status == 'failed' and 'Bad value 3' in job.error
+
+def test_identical_jobs_are_deduplicated(job_manager: JobManager):
+    first, created = job_manager.submit(slow_square, value=4, delay=0.5)
+    second, duplicate = job_manager.submit(slow_square, value=4, delay=0.5)
+    other, other_created = job_manager.submit(slow_square, value=5, delay=0.5)
+
+    assert created and not duplicate and second.id == first.id, "Identical jobs should be merged"
+    assert other_created and other.id != first.id, "Different jobs should not be merged"
+
+    job_manager.wait(first.id, timeout=30)
+    job_manager.wait(other.id, timeout=30)
+    third, created = job_manager.submit(slow_square, value=4, delay=0.5)
+    assert created and third.id != first.id, "A finished job should not be merged"
+    job_manager.wait(third.id, timeout=30)
+
+def test_queued_job_is_pending(job_manager: JobManager):
+    """
+    A job waiting behind another one in the pool is pending, not running, until a worker starts it
+    """
+    first, _ = job_manager.submit(slow_square, value=6, delay=1)
+    queued, _ = job_manager.submit(slow_square, value=7)
+
+    deadline = time.monotonic() + 30
+    while first.to_dict()['status'] == 'pending' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert first.to_dict()['status'] == 'running' and first.started_at is not None
+    assert queued.to_dict()['status'] == 'pending' and queued.started_at is None, "A queued job should not be reported as running"
+
+    with pytest.raises(TimeoutError):
+        job_manager.wait(queued.id, timeout=0.1)
+    assert job_manager.wait(queued.id, timeout=30).result == 49
+    assert queued.started_at >= first.finished_at, "The queued job should start once the first one has finished"
+
+def test_wait_unknown_job(job_manager: JobManager):
+    with pytest.raises(KeyError):
+        job_manager.wait('unknown', timeout=1)
+
+def test_queued_jobs_are_cancelled_on_shutdown():
+    manager = JobManager(max_workers=1)
+    running, _ = manager.submit(slow_square, value=2, delay=1)
+    # The pool takes one more call than it has workers, the following ones wait in the manager
+    queued = [manager.submit(slow_square, value=value)[0] for value in range(3, 6)]
+    manager.shutdown(wait=False)
+
+    assert manager.wait(queued[-1].id, timeout=30).status == 'cancelled', "A cancelled job should be finished"
+    assert manager.wait(running.id, timeout=30).status == 'succeeded', "A running job should complete"
+
+def test_broken_pool_is_replaced():
+    manager = JobManager(max_workers=1)
+    try:
+        crashed, _ = manager.submit(crashing, code=1)
+        assert manager.wait(crashed.id, timeout=30).status == 'failed'
+        assert 'BrokenProcessPool' in crashed.error
+
+        job, _ = manager.submit(slow_square, value=3)
+        assert manager.wait(job.id, timeout=30).result == 9, "The next jobs should run in a new pool"
+    finally:
+        manager.shutdown()
+
+def _submit_from_process(address: str, results):
+    job, created = JobClient(address).submit(slow_square, value=8, delay=1)
+    results.put((job.id, created))
+
+def test_job_server_shared_by_clients(tmp_path):
+    """
+    The processes connected to the job server (the gunicorn workers) share its jobs and their deduplication
+    """
+    address = str(tmp_path / 'jobs.sock')
+    server = start_job_server(address, max_workers=1)
+    try:
+        client = JobClient(address)
+        job, created = client.submit(slow_square, value=8, delay=1)
+        assert created and job.status == 'pending' and job.future is None
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        process = context.Process(target=_submit_from_process, args=(address, results))
+        process.start()
+        assert results.get(timeout=30) == (job.id, False), "Another process should get the same job"
+        process.join(timeout=30)
+
+        done = []
+        client.add_done_callback(job, done.append)
+        other = JobClient(address)
+        assert other.get(job.id).id == job.id, "Any client should find the job"
+        assert other.wait(job.id, timeout=30).result == 64 and client.active == 0
+
+        deadline = time.monotonic() + 10
+        while not done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [finished.status for finished in done] == ['succeeded'], "The callback should get the finished job"
+        with pytest.raises(KeyError):
+            other.wait('unknown')
+    finally:
+        server.shutdown()
+
+def test_job_pickling(job_manager: JobManager):
+    """
+    Jobs are sent to the clients without their future, finished or not
+    """
+    job, _ = job_manager.submit(slow_square, value=9)
+    job = job_manager.wait(job.id, timeout=30)
+    copy = pickle.loads(pickle.dumps(job))
+
+    assert copy.future is None and copy.finished.is_set() and copy.to_dict() == job.to_dict()
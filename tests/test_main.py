@@ -0,0 +1,282 @@
+import os
+import re
+import sys
+import time
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import pytest
+import pandas as pd
+from fastapi import Request, Response
+from sklearn.pipeline import Pipeline
+
+import src.main as main
+import src.sql as sql
+from src.player_index import PlayerIndex
+from src.elo import EloRatings
+from src.shadow import ShadowEvaluator
+from src.batching import PredictionBatcher
+from src.model import predict_batch
+from src.jobs import Job
+
+def test_make_batch_prediction(monkeypatch: pytest.MonkeyPatch, fitted_pipeline: Pipeline):
+    """
+    Test the batch endpoint: results in input order, errors isolated per match
+    """
+    loaded = []
+    def fake_load_model(name, version='latest'):
+        loaded.append((name, version))
+        return fitted_pipeline
+    monkeypatch.setattr(main, 'load_model', fake_load_model)
+
+    matches = [
+        {'rank_player_1': 1, 'rank_player_2': 100},
+        {'rank_player_1': -1},
+        {'rank_player_1': 100, 'rank_player_2': 1, 'version': '2'},
+        {'rank_player_1': 1, 'rank_player_2': 100},
+    ]
+    results = asyncio.run(main.make_batch_prediction(matches))
+
+    assert len(results) == 4, "Wrong number of results"
+    assert 'rank_player_1' in results[1]['error'], "Invalid match should report an error"
+    assert results[0] == results[3], "Identical matches should give the same result"
+    assert results[0]['result'] == 1 and results[2]['result'] == 0, "Results are not in input order"
+    assert sorted(loaded) == [('LogisticRegression', '2'), ('LogisticRegression', 'latest')], "Models should be loaded once per group"
+
+def test_list_tournaments_conditional_get(monkeypatch: pytest.MonkeyPatch):
+    """
+    A matching If-None-Match is answered with a 304, without querying the database
+    """
+    calls = []
+    tournaments = [{'name': 'Wimbledon', 'series': 'Grand Slam', 'court': 'Outdoor', 'surface': 'Grass'}]
+    monkeypatch.setattr(sql, 'list_tournaments', lambda circuit: calls.append(circuit) or tournaments)
+    sql.invalidate_tournaments_cache()
+
+    def request(etag=None):
+        headers = [(b'if-none-match', etag.encode())] if etag else []
+        return Request({'type': 'http', 'method': 'GET', 'path': '/atp/tournaments', 'query_string': b'', 'headers': headers})
+
+    response = Response()
+    result = asyncio.run(main.list_tournaments('atp', request(), response))
+    etag = response.headers['etag']
+    assert result == tournaments
+    assert 'max-age' in response.headers['cache-control']
+
+    not_modified = asyncio.run(main.list_tournaments('atp', request(etag), Response()))
+    assert not_modified.status_code == 304 and not_modified.headers['etag'] == etag
+    assert calls == ['atp'], "The database should be queried once"
+
+    modified = asyncio.run(main.list_tournaments('atp', request('"stale"'), Response()))
+    assert modified == tournaments
+
+def test_slow_database_does_not_delay_predictions(monkeypatch: pytest.MonkeyPatch, fitted_pipeline: Pipeline):
+    """
+    A slow query runs in the thread pool, concurrent predictions are not delayed by it
+    """
+    def slow_list_tournaments(circuit):
+        time.sleep(1)
+        return []
+    monkeypatch.setattr(sql, 'list_tournaments', slow_list_tournaments)
+    monkeypatch.setattr(main, 'load_model', lambda name, version='latest': fitted_pipeline)
+    sql.invalidate_tournaments_cache()
+
+    async def run():
+        request = Request({'type': 'http', 'method': 'GET', 'path': '/atp/tournaments', 'query_string': b'', 'headers': []})
+        slow = asyncio.create_task(main.list_tournaments('atp', request, Response()))
+        await asyncio.sleep(0.05)
+
+        start = time.perf_counter()
+        predictions = await asyncio.gather(*[main.make_prediction(main.ModelInput()) for _ in range(10)])
+        elapsed = time.perf_counter() - start
+
+        assert not slow.done(), "The slow query should still be running"
+        await slow
+        return predictions, elapsed
+
+    predictions, elapsed = asyncio.run(run())
+
+    assert all(p['result'] in (0, 1) for p in predictions)
+    assert elapsed < 0.5, f"Predictions took {elapsed:.2f}s, they were blocked by the query"
+
+def test_import_is_lazy():
+    """
+    Importing the API does not load the training stack (MLflow, scikit-learn, joblib)
+    """
+    code = "import sys, src.main; print(sorted({m.split('.')[0] for m in sys.modules} & {'mlflow', 'sklearn', 'joblib'}))"
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    assert output.stdout.strip() == '[]', f"Heavy modules imported: {output.stdout.strip()}"
+
+def test_metrics(monkeypatch: pytest.MonkeyPatch, fitted_pipeline: Pipeline):
+    """
+    Predictions are counted per model and timed per stage
+    """
+    monkeypatch.setattr(main, 'load_model', lambda name, version='latest': fitted_pipeline)
+    monkeypatch.setattr(main, 'prediction_batcher', None)
+
+    asyncio.run(main.make_prediction(main.ModelInput(model='metrics-test', version='3')))
+    body = asyncio.run(main.get_metrics()).body.decode()
+
+    assert 'tennis_predict_requests_total{model="metrics-test",version="3"} 1' in body
+    for stage in ('resolve', 'build', 'score', 'log'):
+        assert f'tennis_predict_stage_seconds_count{{stage="{stage}"}}' in body, f"Stage {stage} not timed"
+    assert 'tennis_model_cache_hit_ratio' in body
+
+def test_metrics_batched(monkeypatch: pytest.MonkeyPatch, fitted_pipeline: Pipeline):
+    """
+    Batched predictions are timed per stage as the others
+    """
+    def stage_counts():
+        body = asyncio.run(main.get_metrics()).body.decode()
+        return {stage: float(re.search(rf'tennis_predict_stage_seconds_count{{stage="{stage}"}} (\S+)', body).group(1))
+                for stage in ('resolve', 'build', 'score', 'log')}
+
+    monkeypatch.setattr(main, 'load_model', lambda name, version='latest': fitted_pipeline)
+    monkeypatch.setattr(main, 'prediction_batcher', None)
+    asyncio.run(main.make_prediction(main.ModelInput(model='metrics-test')))
+    before = stage_counts()
+
+    monkeypatch.setattr(main, 'prediction_batcher', PredictionBatcher(score=predict_batch, window=0.001))
+    async def predict_concurrently():
+        return await asyncio.gather(*(main.make_prediction(main.ModelInput(model='metrics-test')) for _ in range(3)))
+    asyncio.run(predict_concurrently())
+
+    after = stage_counts()
+    assert all(after[stage] - before[stage] == 3 for stage in before), f"Each batched prediction should be timed per stage: {before} -> {after}"
+
+def test_simulate_draw(monkeypatch: pytest.MonkeyPatch, fitted_pipeline: Pipeline):
+    monkeypatch.setattr(main, 'load_model', lambda name, version='latest': fitted_pipeline)
+    players = [main.DrawPlayer(name=f'Player {i}', rank=i * 10, points=5000 // i) for i in range(1, 9)]
+
+    results = asyncio.run(main.simulate_draw(main.DrawInput(players=players, simulations=2000, seed=0, model='draw-test')))
+
+    assert [r['name'] for r in results] == [p.name for p in players]
+    assert sum(r['rounds']['The Final'] for r in results) == pytest.approx(1.0)
+
+    with pytest.raises(main.HTTPException):
+        asyncio.run(main.simulate_draw(main.DrawInput(players=players[:6])))
+
+def test_predict_by_name(monkeypatch: pytest.MonkeyPatch, fitted_pipeline: Pipeline):
+    """
+    The players' rank and points are looked up as of the match date
+    """
+    monkeypatch.setattr(main, 'load_model', lambda name, version='latest': fitted_pipeline)
+    monkeypatch.setattr(main, 'prediction_batcher', None)
+    matches = pd.DataFrame([
+        ('2024-01-10', 'Sinner J.', 'Alcaraz C.', 1, 100, 4000, 500),
+        ('2024-06-10', 'Alcaraz C.', 'Sinner J.', 1, 100, 4000, 500),
+    ], columns=['date', 'winner', 'loser', 'w_rank', 'l_rank', 'w_points', 'l_points'])
+    index = PlayerIndex(lambda since: matches)
+    monkeypatch.setattr(main, 'get_player_index', lambda circuit: index)
+    elo = EloRatings()
+    elo.update(matches.assign(surface='Clay'))
+    monkeypatch.setattr(main, 'get_elo_ratings', lambda circuit: elo)
+
+    before = asyncio.run(main.make_prediction_by_name(main.NamedMatchInput(player_1='Sinner J.', player_2='alcaraz c.', date='2024-02-01')))
+    after = asyncio.run(main.make_prediction_by_name(main.NamedMatchInput(player_1='Sinner J.', player_2='alcaraz c.', date='2024-07-01')))
+
+    assert before['player_1'] == {'name': 'Sinner J.', 'rank': 1, 'points': 4000, 'as_of': '2024-01-10'}
+    assert before['result'] == 1 and after['result'] == 0, "The rankings as of the date should be used"
+    assert 'elo' not in before['player_1'], "The current ratings should not be used for past matches"
+    assert after['player_1']['elo'] < after['player_2']['elo'] and after['player_1']['surface_elo'] is not None
+
+    with pytest.raises(main.HTTPException):
+        asyncio.run(main.make_prediction_by_name(main.NamedMatchInput(player_1='Sinner J.', player_2='Nobody')))
+
+    # Ratings not computed yet: scheduled, the request being answered without them
+    scheduled = []
+    monkeypatch.setattr(main, 'get_elo_ratings', lambda circuit: EloRatings())
+    monkeypatch.setattr(main, '_schedule_elo_update', lambda circuit, full: scheduled.append(circuit))
+    cold = asyncio.run(main.make_prediction_by_name(main.NamedMatchInput(player_1='Sinner J.', player_2='alcaraz c.')))
+    assert 'elo' not in cold['player_1'] and scheduled == ['atp']
+
+def test_compare_predictions_and_shadow(monkeypatch: pytest.MonkeyPatch, fitted_pipeline: Pipeline):
+    """
+    Several models score a match side by side; shadow models score the /predict matches in the background
+    """
+    def load_model(name, version='latest'):
+        if name == 'Missing':
+            raise main.ModelNotFoundError(name)
+        return fitted_pipeline
+    monkeypatch.setattr(main, 'load_model', load_model)
+    monkeypatch.setattr(main, 'prediction_batcher', None)
+
+    results = asyncio.run(main.compare_predictions(main.ModelInput(), ['LogisticRegression', 'Candidate:2', 'Missing']))
+
+    assert [(r['model'], r['version']) for r in results] == [('LogisticRegression', 'latest'), ('Candidate', '2'), ('Missing', 'latest')]
+    assert results[0]['prob'] == results[1]['prob'] and results[0]['seconds'] > 0
+    assert results[2]['error'] == 'Model Missing not found'
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    shadow = ShadowEvaluator([('Candidate', '2')], main.load_model, executor=executor)
+    monkeypatch.setattr(main, 'shadow_evaluator', shadow)
+    prediction = asyncio.run(main.make_prediction(main.ModelInput()))
+    executor.shutdown(wait=True)
+
+    assert 'result' in prediction
+    assert asyncio.run(main.get_shadow_stats())['models'][0]['predictions'] == 1
+
+class _InlineExecutor:
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+class _FakeJobManager:
+    def __init__(self, failing=()):
+        self.submitted = []
+        self.failing = failing
+
+    def submit(self, func, **params):
+        self.submitted.append((func.__name__, params))
+        job = Job(id=func.__name__, name=func.__name__, params=params, submitted_at=None)
+        if func.__name__ in self.failing:
+            job.status, job.error = 'failed', 'RuntimeError: database down'
+        else:
+            job.status, job.result = 'succeeded', {"func": func.__name__}
+        return job, True
+
+    def add_done_callback(self, job, callback):
+        callback(job)
+
+def test_after_ingestion_chains_jobs(monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture):
+    """
+    After an ingestion, the match cache and the Elo ratings are updated by jobs, then the player index and the ratings
+    of the API are refreshed in the blocking thread pool; the failures are logged
+    """
+    refreshes, reloads = [], []
+    class FakeIndex:
+        is_stale = False
+        def stats(self):
+            return {"last_date": "2024-06-01"}
+        def refresh(self, full=False):
+            refreshes.append(full)
+    elo = EloRatings()
+    elo.last_date = '2024-06-01'
+    jobs = _FakeJobManager()
+    monkeypatch.setattr(main, 'job_manager', jobs)
+    monkeypatch.setattr(main, 'blocking_executor', _InlineExecutor())
+    monkeypatch.setattr(main, 'MATCH_CACHE_DIR', 'cache')
+    monkeypatch.setattr(main, 'ELO_STATE_DIR', 'state')
+    monkeypatch.setattr(main, 'invalidate_tournaments_cache', lambda circuit: None)
+    monkeypatch.setattr(main, 'get_player_index', lambda circuit: FakeIndex())
+    monkeypatch.setattr(main, 'get_elo_ratings', lambda circuit: elo)
+    monkeypatch.setattr(main, 'reload_elo_ratings', reloads.append)
+
+    ingestion, _ = jobs.submit(main.ingest_years, circuit='atp', years=(2024,))
+    ingestion.result = {"table": "atp_data", "inserted": 10, "from_date": "2024-05-01", "to_date": "2024-06-30"}
+    main._when_succeeded(ingestion, main._after_ingestion, 'atp')
+
+    assert [name for name, _ in jobs.submitted] == ['ingest_years', 'refresh_match_cache', 'update_elo_ratings']
+    assert jobs.submitted[2][1] == {"circuit": "atp", "full": True}, "Older matches than the last rated one: full recompute"
+    assert refreshes == [True] and reloads == ['atp']
+
+    caplog.clear()
+    monkeypatch.setattr(main, 'job_manager', _FakeJobManager(failing=('refresh_match_cache',)))
+    main._after_ingestion('atp', {"table": "atp_data", "inserted": 10, "from_date": "2024-07-01", "to_date": "2024-07-02"})
+    assert refreshes == [True], "The index waits for the match cache"
+    assert 'refresh_match_cache' in caplog.text and 'database down' in caplog.text, "Failures should be logged"
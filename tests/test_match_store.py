@@ -0,0 +1,123 @@
+import multiprocessing
+import pandas as pd
+import pytest
+from pathlib import Path
+from datetime import date, timedelta
+
+from src.match_store import MatchStore, _merge_ranges, _subtract_ranges
+
+COLUMNS = ['date', 'series', 'w_rank']
+
+@pytest.fixture
+def table() -> pd.DataFrame:
+    today = date.today()
+    return pd.DataFrame({
+        'date': [date(2024, 1, 1), date(2024, 1, 15), date(2024, 2, 1), date(2024, 3, 1), today],
+        'series': ['ATP250', 'Grand Slam', None, 'ATP250', 'ATP500'],
+        'w_rank': [1.0, 2.0, None, 4.0, 5.0],
+    })
+
+@pytest.fixture
+def fetches() -> list:
+    return []
+
+@pytest.fixture
+def store(tmp_path, table: pd.DataFrame, fetches: list) -> MatchStore:
+    def fetch(from_date, to_date):
+        fetches.append((from_date, to_date))
+        dates = pd.to_datetime(table['date']).dt.date
+        yield table[(dates >= date.fromisoformat(from_date)) & (dates <= date.fromisoformat(to_date))]
+    return MatchStore(str(tmp_path / 'atp_data'), COLUMNS, ['series'], fetch)
+
+def test_ranges():
+    assert _subtract_ranges(('2024-01-01', '2024-12-31'), [('2024-03-01', '2024-03-31')]) == [
+        ('2024-01-01', '2024-02-29'), ('2024-04-01', '2024-12-31')]
+    assert _subtract_ranges(('2024-03-05', '2024-03-10'), [('2024-03-01', '2024-03-31')]) == []
+    assert _merge_ranges([('2024-01-01', '2024-01-31'), ('2024-02-01', '2024-02-10'), ('2024-05-01', '2024-05-02')]) == [
+        ('2024-01-01', '2024-02-10'), ('2024-05-01', '2024-05-02')]
+
+def test_match_store_fetches_missing_dates_only(store: MatchStore, fetches: list):
+    first = store.load('2024-01-01', '2024-01-31')
+    assert len(first) == 2
+
+    result = store.load('2024-01-10', '2024-02-29')
+    assert fetches == [('2024-01-01', '2024-01-31'), ('2024-02-01', '2024-02-29')], "Only the missing dates should be fetched"
+    assert list(result['w_rank'].fillna(-1)) == [2.0, -1]
+    assert list(result['series']) == ['Grand Slam', None], "NULL categories should be kept"
+
+    store.load('2024-01-01', '2024-02-29')
+    assert len(fetches) == 2, "Cached dates should not be fetched again"
+
+def test_match_store_persistence(store: MatchStore, table: pd.DataFrame, fetches: list):
+    store.load('2024-01-01', '2024-12-31')
+
+    reopened = MatchStore(store.root, COLUMNS, ['series'], store.fetch)
+    result = reopened.load('2024-01-01', '2024-12-31')
+
+    assert len(fetches) == 1, "The cache should be read back from disk"
+    assert list(result['series']) == ['ATP250', 'Grand Slam', None, 'ATP250']
+
+def test_match_store_today_is_not_final(store: MatchStore, fetches: list):
+    today = date.today().isoformat()
+    assert len(store.load(today, today)) == 1
+    assert len(store.load(today, today)) == 1, "Today's matches should not be duplicated"
+    assert len(fetches) == 2, "Today's matches should be fetched again"
+    assert store.ranges() == [], "Today should not be recorded as held"
+
+def test_match_store_invalidate_refresh(store: MatchStore, table: pd.DataFrame, fetches: list):
+    store.load('2024-01-01', '2024-03-31')
+    table.loc[3, 'w_rank'] = 40.0
+
+    result = store.refresh('2024-03-01', '2024-03-31')
+    assert list(result['w_rank']) == [40.0], "Refreshed dates should be fetched again"
+    assert len(store.load('2024-01-01', '2024-03-31')) == 4
+
+    store.invalidate()
+    assert store.ranges() == []
+    store.load('2024-01-01', '2024-01-31')
+    assert fetches[-1] == ('2024-01-01', '2024-01-31'), "Invalidated dates should be fetched again"
+
+def test_match_store_shared_between_instances(store: MatchStore, table: pd.DataFrame, fetches: list):
+    """
+    Stores on the same directory (as in several processes) see each other's matches and categories
+    """
+    other = MatchStore(store.root, COLUMNS, ['series'], store.fetch)
+    store.load('2024-01-01', '2024-01-31')
+    segments = sorted(p.name for p in Path(store.root).glob('segment_*'))
+
+    table.loc[2, 'series'] = 'Masters 1000'
+    assert list(other.load('2024-01-01', '2024-02-29')['series']) == ['ATP250', 'Grand Slam', 'Masters 1000']
+    assert fetches == [('2024-01-01', '2024-01-31'), ('2024-02-01', '2024-02-29')], "The other store's dates are not fetched again"
+    assert set(segments) < {p.name for p in Path(store.root).glob('segment_*')}, "The new rows are appended as a new segment"
+
+    assert list(store.load('2024-01-01', '2024-02-29')['series']) == ['ATP250', 'Grand Slam', 'Masters 1000']
+    assert len(fetches) == 2
+
+def _load_in_process(root: str, table: pd.DataFrame, from_date: str, to_date: str):
+    def fetch(start, end):
+        dates = pd.to_datetime(table['date']).dt.date
+        yield table[(dates >= date.fromisoformat(start)) & (dates <= date.fromisoformat(end))]
+    MatchStore(root, COLUMNS, ['series'], fetch).load(from_date, to_date)
+
+def test_match_store_concurrent_processes(tmp_path, table: pd.DataFrame):
+    """
+    Concurrent syncs from several processes neither lose nor duplicate matches
+    """
+    table = pd.concat([table.iloc[:4]] * 50, ignore_index=True)
+    table['series'] = [f'Series {i % 7}' for i in range(len(table))]
+    root = str(tmp_path / 'atp_data')
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=_load_in_process, args=(root, table, from_date, to_date))
+        for from_date, to_date in [('2024-01-01', '2024-01-31'), ('2024-02-01', '2024-03-31'), ('2024-01-01', '2024-03-31')] * 2
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+
+    result = MatchStore(root, COLUMNS, ['series'], lambda start, end: iter([])).load('2024-01-01', '2024-03-31')
+    expected = table.assign(date=pd.to_datetime(table['date'])).sort_values('date', kind='stable', ignore_index=True)
+    assert len(result) == len(expected), "Matches lost or duplicated"
+    assert sorted(result['series']) == sorted(expected['series']), "Categories overwritten"
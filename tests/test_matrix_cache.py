@@ -0,0 +1,60 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from src.matrix_cache import MatrixCache
+from src.model import create_pairwise_data
+
+def test_round_trip(tmp_path, random_matches: pd.DataFrame):
+    """
+    A stored matrix is read back identical, its text columns being stored as codes
+    """
+    cache = MatrixCache(str(tmp_path))
+    df_model = create_pairwise_data(random_matches)
+    df_model.loc[3, 'Series'] = None
+    key = MatrixCache.key(circuit='atp', from_date='2024-01-01')
+
+    assert cache.get(key) is None
+    cache.put(key, df_model)
+    stored = cache.get(key)
+
+    pd.testing.assert_frame_equal(stored, df_model)
+    assert not stored['diffRanking'].to_numpy().flags.writeable, "Numerical columns should be the memory maps, not copies"
+    assert np.load(tmp_path / key / '0.npy', mmap_mode='r').dtype == np.int32, "Categories must be encoded"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.')], "No temporary directory should be left"
+
+def test_arrays_round_trip(tmp_path):
+    cache = MatrixCache(str(tmp_path))
+    arrays = {'train': np.arange(12.0).reshape(4, 3), 'index': np.array([3, 0, 2], dtype=np.int64)}
+    cache.put_arrays('a', arrays)
+
+    stored = cache.get_arrays('a')
+    assert list(stored) == ['train', 'index']
+    assert all(np.array_equal(stored[name], values) for name, values in arrays.items())
+    assert isinstance(stored['train'].base, np.memmap), "Arrays should be memory-mapped"
+    assert cache.get_arrays('b') is None
+
+def test_key_depends_on_all_parts():
+    assert MatrixCache.key(a=1, b=2) == MatrixCache.key(b=2, a=1)
+    assert MatrixCache.key(a=1, b=2) != MatrixCache.key(a=1, b=3)
+
+def test_eviction_by_size(tmp_path, random_matches: pd.DataFrame):
+    """
+    The least recently used matrices are evicted once the total size exceeds the limit
+    """
+    df_model = create_pairwise_data(random_matches)
+    cache = MatrixCache(str(tmp_path))
+    cache.put('a', df_model)
+    size = cache.stats()["bytes"]
+
+    cache.max_bytes = int(2.5 * size)
+    cache.put('b', df_model)
+    time.sleep(0.01)
+    cache.get('a')
+    time.sleep(0.01)
+    cache.put('c', df_model)
+
+    assert [entry["key"] for entry in cache.entries()] == ['a', 'c'], "'b' was the least recently used"
+    assert cache.stats()["evictions"] == 1
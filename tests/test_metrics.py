@@ -0,0 +1,39 @@
+from src.metrics import Registry
+
+def test_render_prometheus_text():
+    """
+    Counters, histograms and collected metrics are rendered in the Prometheus text format
+    """
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', ['model'])
+    latency = registry.histogram('latency_seconds', 'Latency', ['stage'], buckets=(0.1, 1))
+    registry.add_collector(lambda: [('cache_entries', 'gauge', 'Entries', [({}, 3)])])
+
+    requests.inc(model='a')
+    requests.inc(2, model='a')
+    requests.inc(model='b"c')
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, stage='score')
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{model="a"} 3' in lines
+    assert 'requests_total{model="b\\"c"} 1' in lines, "Label values must be escaped"
+    assert 'latency_seconds_bucket{stage="score",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="score",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{stage="score",le="+Inf"} 3' in lines, "Buckets must be cumulative"
+    assert 'latency_seconds_sum{stage="score"} 5.55' in lines
+    assert 'latency_seconds_count{stage="score"} 3' in lines
+    assert 'cache_entries 3' in lines
+
+def test_failing_collector_is_skipped():
+    registry = Registry()
+    registry.counter('requests_total', 'Requests').inc()
+
+    def failing():
+        raise RuntimeError('unavailable')
+        yield
+    registry.add_collector(failing)
+
+    assert 'requests_total 1' in registry.render().splitlines()
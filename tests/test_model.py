@@ -1,7 +1,13 @@
+import pytest
+import joblib
+import numpy as np
 import pandas as pd
 from sklearn.pipeline import Pipeline
 
-from src.model import create_pairwise_data, create_pipeline
+import src.model as model
+from src.model import create_pairwise_data, create_pipeline, iter_pairwise_data, predict, predict_batch
+from src.matrix_cache import MatrixCache
+from src.elo import EloRatings, add_elo_ratings, RATING_COLUMNS
 
 def test_create_pairwise_data(simple_match: pd.DataFrame, simple_match_pairwise_data: pd.DataFrame):
     result = create_pairwise_data(simple_match)
@@ -9,11 +15,31 @@ def test_create_pairwise_data(simple_match: pd.DataFrame, simple_match_pairwise_
     assert set(result.columns) == set(simple_match_pairwise_data.columns), "Columns are different"
     assert simple_match_pairwise_data.equals(result), "Dataframes are different"
 
+def test_create_pairwise_data_without_ratings(simple_match: pd.DataFrame, random_matches: pd.DataFrame):
+    """
+    Matches as loaded from the tables, without the Elo ratings, are still formatted
+    """
+    result = create_pairwise_data(simple_match.drop(columns=RATING_COLUMNS))
+    assert result[['diffElo', 'diffSurfaceElo']].isna().all().all(), "Ratings are NaN without the players"
+    assert result['diffRanking'].tolist() == [-295, 295]
+
+    raw = random_matches.drop(columns=RATING_COLUMNS)
+    assert create_pairwise_data(raw).equals(create_pairwise_data(add_elo_ratings(raw))), "Ratings are computed from the players"
+    assert pd.concat(iter_pairwise_data(raw, chunk_size=64)).equals(create_pairwise_data(raw))
+
 def test_create_pairwise_data_empty(simple_match_empty: pd.DataFrame):
     result = create_pairwise_data(simple_match_empty)
 
     assert result.empty, "Dataframe is not empty"
 
+def test_iter_pairwise_data(simple_match: pd.DataFrame):
+    matches = pd.concat([simple_match] * 5, ignore_index=True)
+    chunks = list(iter_pairwise_data(matches, chunk_size=2))
+
+    assert len(chunks) == 3, "Wrong number of chunks"
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2], "Wrong chunk sizes"
+    assert pd.concat(chunks).equals(create_pairwise_data(matches)), "Chunks differ from the full dataset"
+
 def test_create_pipeline():
     pipeline = create_pipeline()
     assert pipeline is not None, "Pipeline is None"
@@ -21,3 +47,168 @@ def test_create_pipeline():
     assert len(pipeline.named_steps) == 2, "Pipeline has wrong number of steps"
     assert 'preprocessor' in pipeline.named_steps, "Preprocessor is missing"
     assert 'classifier' in pipeline.named_steps, "Classifier is missing"
+
+def test_predict_batch(fitted_pipeline: Pipeline):
+    matches = [
+        dict(series='Grand Slam', surface='Clay', court='Outdoor', round_stage='1st Round',
+             rank_player_1=1, rank_player_2=100, points_player_1=4000, points_player_2=500),
+        dict(series='ATP250', surface='Hard', court='Indoor', round_stage='The Final',
+             rank_player_1=150, rank_player_2=3, points_player_1=300, points_player_2=5000),
+    ]
+    results = predict_batch(fitted_pipeline, matches)
+
+    assert len(results) == 2, "Wrong number of results"
+    for match, result in zip(matches, results):
+        expected = predict(fitted_pipeline, **match)
+        assert result['result'] == expected['result'], "Batch and single predictions differ"
+        assert result['prob'] == pytest.approx(expected['prob']), "Batch and single probabilities differ"
+
+def test_predict_batch_empty(fitted_pipeline: Pipeline):
+    assert predict_batch(fitted_pipeline, []) == [], "Empty batch should give no result"
+
+def test_train_model_from_scratch(monkeypatch: pytest.MonkeyPatch, tmp_path, random_matches: pd.DataFrame):
+    """
+    The trained model is written atomically to the output path
+    """
+    monkeypatch.setattr(model, 'iter_matches_from_postgres',
+                        lambda chunk_size, **kwargs: (random_matches.iloc[i:i + chunk_size] for i in range(0, len(random_matches), chunk_size)))
+    monkeypatch.setattr(model, 'ratings_before', lambda circuit, date: EloRatings())
+    output_path = tmp_path / 'model.pkl'
+
+    pipeline = model.train_model_from_scratch('atp', '2024-01-01', '2024-12-31', output_path=str(output_path))
+
+    assert isinstance(joblib.load(output_path), Pipeline), "The model should be saved"
+    assert pipeline is not None
+    assert [p.name for p in tmp_path.iterdir()] == ['model.pkl'], "No temporary file should be left"
+
+def test_load_pairwise_data(monkeypatch: pytest.MonkeyPatch, random_matches: pd.DataFrame):
+    """
+    Loading by chunks gives the same data as loading at once
+    """
+    monkeypatch.setattr(model, 'load_matches_from_postgres', lambda **kwargs: random_matches)
+    monkeypatch.setattr(model, 'iter_matches_from_postgres',
+                        lambda chunk_size, **kwargs: (random_matches.iloc[i:i + chunk_size] for i in range(0, len(random_matches), chunk_size)))
+    monkeypatch.setattr(model, 'ratings_before', lambda circuit, date: EloRatings())
+
+    expected = model.load_pairwise_data('atp', '2024-01-01', '2024-12-31', chunk_size=0)
+    result = model.load_pairwise_data('atp', '2024-01-01', '2024-12-31', chunk_size=64)
+
+    assert expected.equals(create_pairwise_data(add_elo_ratings(random_matches)))
+    assert result.equals(expected), "Chunked loading gives different data"
+
+def test_load_pairwise_data_from_training_cache(tmp_path, monkeypatch: pytest.MonkeyPatch, random_matches: pd.DataFrame):
+    """
+    The pairwise data is prepared once per data version, then read from the training cache
+    """
+    loads = []
+    def load_matches(**kwargs):
+        loads.append(kwargs)
+        return random_matches
+    monkeypatch.setattr(model, 'load_matches_from_postgres', load_matches)
+    monkeypatch.setattr(model, 'get_data_version', lambda *args: 'v1')
+    monkeypatch.setattr(model, 'ratings_before', lambda circuit, date: EloRatings())
+    monkeypatch.setattr(model, 'training_cache', MatrixCache(str(tmp_path)))
+
+    first = model.load_pairwise_data('atp', '2024-01-01', '2024-12-31', chunk_size=0)
+    second = model.load_pairwise_data('atp', '2024-01-01', '2024-12-31', chunk_size=0)
+    assert len(loads) == 1, "The matches should have been loaded once"
+    pd.testing.assert_frame_equal(second, first)
+
+    monkeypatch.setattr(model, 'get_data_version', lambda *args: 'v2')
+    model.load_pairwise_data('atp', '2024-01-01', '2024-12-31', chunk_size=0)
+    assert len(loads) == 2, "New data should be loaded again"
+
+def test_load_encoded_data_from_training_cache(tmp_path, monkeypatch: pytest.MonkeyPatch, random_matches: pd.DataFrame):
+    """
+    The split and the encoded features are stored with the pairwise data, the preprocessor being fitted once
+    """
+    from sklearn.compose import ColumnTransformer
+
+    monkeypatch.setattr(model, 'load_matches_from_postgres', lambda **kwargs: random_matches)
+    monkeypatch.setattr(model, 'FETCH_CHUNK_SIZE', 0)
+    monkeypatch.setattr(model, 'get_data_version', lambda *args: 'v1')
+    monkeypatch.setattr(model, 'ratings_before', lambda circuit, date: EloRatings())
+    monkeypatch.setattr(model, 'training_cache', MatrixCache(str(tmp_path)))
+
+    X_train, X_test, y_train, y_test, preprocessor, encoded = model.load_encoded_data('atp', '2024-01-01', '2024-12-31')
+
+    def fit_transform(*args, **kwargs):
+        raise AssertionError("The preprocessor should not be fitted again")
+    monkeypatch.setattr(ColumnTransformer, 'fit_transform', fit_transform)
+    cached = model.load_encoded_data('atp', '2024-01-01', '2024-12-31')
+
+    for expected, result in zip((X_train, X_test, y_train, y_test), cached[:4]):
+        pd.testing.assert_frame_equal(pd.DataFrame(result), pd.DataFrame(expected))
+    assert abs(cached[5] - encoded).max() == 0, "Encoded features differ"
+    assert abs(cached[4].transform(X_test) - preprocessor.transform(X_test)).max() == 0, "Preprocessors differ"
+
+def test_search_hyperparameters(random_matches: pd.DataFrame):
+    """
+    All the candidates are cross-validated with the preprocessing fitted per fold, the best one being refitted
+    """
+    X_train, X_test, y_train, y_test = model.preprocess_data(random_matches)
+
+    pipeline, summary = model.search_hyperparameters(X_train, y_train, cv=2, n_jobs=2)
+
+    grid_size = sum(np.prod([len(values) for values in grid.values()]) for grid in model.create_search_space())
+    assert len(summary["candidates"]) == grid_size, "Every candidate should be scored"
+    assert summary["best_score"] == max(c["accuracy"] for c in summary["candidates"])
+    assert summary["sequential_time_seconds"] > 0 and summary["wall_time_seconds"] > 0
+    assert list(pipeline.named_steps) == ['preprocessor', 'classifier']
+    assert pipeline.predict_proba(X_test).shape == (len(X_test), 2)
+
+    # The preprocessing is fitted on the training part of each fold only
+    from sklearn.base import clone
+    from sklearn.model_selection import cross_val_score
+    expected = cross_val_score(clone(pipeline), X_train, y_train, cv=2, scoring='accuracy').mean()
+    assert summary["best_score"] == pytest.approx(expected), "The folds should not see the statistics of their validation rows"
+
+def test_incremental_update_parity(random_matches: pd.DataFrame):
+    """
+    Updating an incremental pipeline with new matches is about as accurate as a full retrain
+    """
+    df_model = create_pairwise_data(random_matches)
+    features = [column for column in df_model.columns if column != 'target']
+    old, new = df_model.iloc[:700], df_model.iloc[700:]
+
+    pipeline = model.partial_fit_pipeline(model.create_incremental_pipeline(), old[features], old['target'])
+    coef = pipeline.named_steps['classifier'].coef_.copy()
+    parity = model.compare_with_full_retrain(pipeline, old[features], old['target'], new[features], new['target'])
+
+    assert (pipeline.named_steps['classifier'].coef_ == coef).all(), "The compared pipeline should be left unchanged"
+    assert abs(parity["difference"]) <= 0.05, f"Incremental update not on par with a full retrain: {parity}"
+
+def test_partial_fit_updates_scaler(random_matches: pd.DataFrame):
+    """
+    The scaling and the imputed means follow all the data seen, the categories stay fixed
+    """
+    df_model = create_pairwise_data(random_matches)
+    features = [column for column in df_model.columns if column != 'target']
+    first, second = df_model.iloc[:500], df_model.iloc[500:]
+
+    pipeline = model.partial_fit_pipeline(model.create_incremental_pipeline(), first[features], first['target'])
+    categories = [list(c) for c in pipeline.named_steps['preprocessor'].named_transformers_['cat'].categories_]
+    model.partial_fit_pipeline(pipeline, second[features], second['target'])
+
+    num = pipeline.named_steps['preprocessor'].named_transformers_['num']
+    expected = df_model[['diffRanking', 'diffPoints', 'diffElo', 'diffSurfaceElo']].mean().to_numpy()
+    assert np.allclose(num.named_steps['scaler'].mean_, expected)
+    assert np.allclose(num.named_steps['imputer'].statistics_, expected)
+    assert [list(c) for c in pipeline.named_steps['preprocessor'].named_transformers_['cat'].categories_] == categories
+
+def test_partial_fit_with_empty_feature(random_matches: pd.DataFrame):
+    """
+    A feature without any value (e.g. no surface rating yet) is kept, and learnt once it has values
+    """
+    df_model = create_pairwise_data(random_matches)
+    features = [column for column in df_model.columns if column != 'target']
+    first, second = df_model.iloc[:500].copy(), df_model.iloc[500:]
+    first['diffSurfaceElo'] = np.nan
+
+    pipeline = model.partial_fit_pipeline(model.create_incremental_pipeline(), first[features], first['target'])
+    assert pipeline.predict_proba(first[features].head(3)).shape == (3, 2)
+
+    model.partial_fit_pipeline(pipeline, second[features], second['target'])
+    scaler = pipeline.named_steps['preprocessor'].named_transformers_['num'].named_steps['scaler']
+    assert np.isclose(scaler.mean_[3], second['diffSurfaceElo'].mean()), "Statistics of the values seen since"
+    assert np.isfinite(pipeline.predict_proba(df_model[features])).all()
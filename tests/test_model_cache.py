@@ -0,0 +1,136 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.model_cache import ModelCache, LocalModelFile
+
+class FakeRegistry:
+    def __init__(self, latest: str = '1', delay: float = 0):
+        self.latest = latest
+        self.delay = delay
+        self.loads = []
+
+    def load(self, name: str, version: str):
+        time.sleep(self.delay)
+        self.loads.append((name, version))
+        return f'{name}-v{version}'
+
+    def resolve(self, name: str) -> str:
+        return self.latest
+
+def test_model_cache_versions():
+    """
+    Versions are cached separately and 'latest' is resolved
+    """
+    registry = FakeRegistry(latest='2')
+    cache = ModelCache(registry.load, registry.resolve)
+
+    assert cache.get('model', '1') == 'model-v1'
+    assert cache.get('model', 'latest') == 'model-v2'
+    assert cache.get('model', '2') == 'model-v2'
+    assert registry.loads == [('model', '1'), ('model', '2')], "Each version should be loaded once"
+
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 2 and stats['loads'] == 2, "Wrong counters"
+
+def test_model_cache_eviction():
+    """
+    The least recently used model is evicted
+    """
+    registry = FakeRegistry()
+    cache = ModelCache(registry.load, registry.resolve, max_entries=2)
+
+    cache.get('a', '1')
+    cache.get('b', '1')
+    cache.get('a', '1')
+    cache.get('c', '1')
+
+    models = cache.stats()['models']
+    assert {'name': 'b', 'version': '1'} not in models, "b should have been evicted"
+    assert len(models) == 2 and cache.stats()['evictions'] == 1, "Wrong number of entries"
+
+def test_model_cache_single_flight():
+    """
+    Concurrent loads of the same model are collapsed into a single one
+    """
+    registry = FakeRegistry(delay=0.2)
+    cache = ModelCache(registry.load, registry.resolve)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: cache.get('model', '1'), range(8)))
+
+    assert results == ['model-v1'] * 8
+    assert registry.loads == [('model', '1')], "The model should be loaded once"
+
+def test_model_cache_refresh_latest():
+    """
+    A new latest version is loaded, then swapped in
+    """
+    registry = FakeRegistry(latest='1')
+    cache = ModelCache(registry.load, registry.resolve)
+    assert cache.get('model') == 'model-v1'
+
+    registry.latest = '2'
+    assert cache.get('model') == 'model-v1', "The version should not change before the refresh"
+
+    cache.refresh_latest()
+    assert cache.get('model') == 'model-v2', "The new version should be swapped in"
+    assert cache.stats()['swaps'] == 1
+
+def test_model_cache_polling():
+    registry = FakeRegistry(latest='1')
+    cache = ModelCache(registry.load, registry.resolve)
+    cache.get('model')
+
+    registry.latest = '2'
+    cache.start_polling(0.01)
+    try:
+        deadline = time.time() + 2
+        while cache.stats()['latest']['model'] != '2' and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        cache.stop_polling()
+
+    assert cache.get('model') == 'model-v2', "The poller should swap in the new version"
+
+def test_local_model_file(tmp_path):
+    """
+    The local model is loaded once, then again only when the file changes
+    """
+    path = tmp_path / 'model.pkl'
+    loads = []
+    def loader(p):
+        time.sleep(0.05)
+        loads.append(p)
+        return path.read_text()
+
+    local_model = LocalModelFile(str(path), loader)
+    assert local_model.get() is None, "No model before the file exists"
+
+    path.write_text('v1')
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: local_model.get(), range(8)))
+    assert results == ['v1'] * 8
+    assert len(loads) == 1, "Concurrent requests should load the file once"
+
+    assert local_model.get() == 'v1' and len(loads) == 1, "Unchanged file should not be reloaded"
+
+    path.write_text('v2 (bigger)')
+    assert local_model.get() == 'v2 (bigger)' and len(loads) == 2, "Changed file should be reloaded"
+
+def test_model_cache_after_fork():
+    """
+    A forked process can use the cache even if the parent held its lock while forking
+    """
+    registry = FakeRegistry()
+    cache = ModelCache(registry.load, registry.resolve)
+    cache.get('model', '1')
+
+    with cache._lock:
+        pid = os.fork()
+        if pid == 0:
+            # Child: the lock must have been reset
+            os._exit(0 if cache.get('model', '1') == 'model-v1' else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0, "The cache should be usable in the child"
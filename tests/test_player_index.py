@@ -0,0 +1,129 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from src.player_index import PlayerIndex
+
+def _matches(rows):
+    return pd.DataFrame(rows, columns=['date', 'winner', 'loser', 'w_rank', 'l_rank', 'w_points', 'l_points'])
+
+class FakeTable:
+    """
+    Matches fetched by date, recording the dates asked for
+    """
+    def __init__(self, matches: pd.DataFrame):
+        self.matches = matches
+        self.calls = []
+
+    def fetch(self, since):
+        self.calls.append(since)
+        if since is None:
+            return self.matches
+        return self.matches[pd.to_datetime(self.matches['date']) >= pd.Timestamp(since)]
+
+def test_lookup_as_of_date():
+    """
+    The rank and points are those of the last match played on or before the date
+    """
+    table = FakeTable(_matches([
+        ('2024-01-10', 'Sinner J.', 'Alcaraz C.', 4, 2, 5000, 8000),
+        ('2024-03-01', 'Alcaraz C.', 'Sinner J.', 3, 2, 7000, 9000),
+        ('2024-05-01', 'Medvedev D.', 'Sinner J.', 5, 1, 4000, 9500),
+    ]))
+    index = PlayerIndex(table.fetch)
+    index.refresh()
+
+    assert index.lookup('Sinner J.', '2024-01-09') is None, "No match before the date"
+    assert index.lookup('Sinner J.', '2024-01-10') == {'name': 'Sinner J.', 'rank': 4, 'points': 5000, 'as_of': '2024-01-10'}
+    assert index.lookup('Sinner J.', '2024-04-30')['rank'] == 2
+    assert index.lookup(' sinner   j. ', '2024-06-01')['rank'] == 1, "Names are matched regardless of case and spaces"
+    assert index.lookup('Sinner J.')['as_of'] == '2024-05-01', "Today by default"
+    assert index.lookup('Djokovic N.') is None
+
+def test_incremental_refresh():
+    """
+    Only the matches from the last date indexed are fetched again, without duplicating them
+    """
+    table = FakeTable(_matches([
+        ('2024-01-10', 'Sinner J.', 'Alcaraz C.', 4, 2, 5000, 8000),
+        ('2024-03-01', 'Alcaraz C.', 'Sinner J.', 3, 2, 7000, 9000),
+    ]))
+    index = PlayerIndex(table.fetch, ttl=0)
+    index.refresh()
+
+    table.matches = pd.concat([table.matches, _matches([
+        ('2024-03-01', 'Medvedev D.', 'Zverev A.', 5, 6, 4000, 3900),
+        ('2024-04-01', 'Zverev A.', 'Sinner J.', 6, 1, 4100, 9600),
+    ])], ignore_index=True)
+    assert index.is_stale
+    assert index.refresh() == 3, "The last date indexed is fetched again"
+
+    assert table.calls == [None, '2024-03-01']
+    assert len(index._players['sinner j.'][0]) == 3, "Matches fetched again must not be duplicated"
+    assert index.lookup('Sinner J.', '2024-04-01')['rank'] == 1
+    assert index.lookup('Zverev A.', '2024-03-15')['rank'] == 6
+    assert index.stats()['players'] == 4 and index.stats()['last_date'] == '2024-04-01'
+
+    # Older matches inserted: rebuilt from scratch
+    table.matches = pd.concat([table.matches, _matches([('2023-12-01', 'Sinner J.', 'Zverev A.', 7, 9, 4000, 3000)])])
+    index.refresh(full=True)
+    assert index.lookup('Sinner J.', '2023-12-31')['rank'] == 7
+
+def test_missing_ranks():
+    """
+    Missing ranks or points are returned as None, matches without any are left out
+    """
+    table = FakeTable(_matches([
+        ('2024-01-10', 'Sinner J.', 'Qualifier Q.', 4, None, 5000, None),
+        ('2024-01-12', 'Sinner J.', 'Qualifier Q.', None, 250, 5100, None),
+    ]))
+    index = PlayerIndex(table.fetch)
+    index.refresh()
+
+    assert index.lookup('Qualifier Q.', '2024-01-11') is None
+    assert index.lookup('Qualifier Q.', '2024-01-12') == {'name': 'Qualifier Q.', 'rank': 250, 'points': None, 'as_of': '2024-01-12'}
+    assert index.lookup('Sinner J.', '2024-01-12')['rank'] is None
+
+def test_lookup_is_fast():
+    rng = np.random.default_rng(0)
+    n = 200_000
+    dates = pd.Timestamp('2000-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 9000, n)), unit='D')
+    table = FakeTable(pd.DataFrame({
+        'date': dates,
+        'winner': [f'Player {i}' for i in rng.integers(0, 2000, n)],
+        'loser': [f'Player {i}' for i in rng.integers(0, 2000, n)],
+        'w_rank': rng.integers(1, 500, n),
+        'l_rank': rng.integers(1, 500, n),
+        'w_points': rng.integers(1, 10000, n),
+        'l_points': rng.integers(1, 10000, n),
+    }))
+    index = PlayerIndex(table.fetch)
+    index.refresh()
+
+    lookups = 2000
+    start = time.perf_counter()
+    for i in range(lookups):
+        index.lookup(f'Player {i}', '2015-06-01')
+    per_lookup = (time.perf_counter() - start) / lookups
+
+    assert per_lookup < 1e-3, f"Lookups take {per_lookup * 1e6:.0f}µs"
+
+def test_concurrent_refresh_if_stale():
+    """
+    Concurrent callers seeing a stale index refresh it once
+    """
+    table = FakeTable(_matches([('2024-01-10', 'Sinner J.', 'Alcaraz C.', 4, 2, 5000, 8000)]))
+    fetch = table.fetch
+    def slow_fetch(since):
+        time.sleep(0.05)
+        return fetch(since)
+    table.fetch = slow_fetch
+    index = PlayerIndex(table.fetch, ttl=60)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: index.refresh_if_stale(), range(8)))
+
+    assert table.calls == [None], "The index should be built once"
+    assert results.count(None) == 7 and index.is_built and not index.is_stale
+    assert index.refresh_if_stale(wait=False) is None, "A fresh index is not refreshed"
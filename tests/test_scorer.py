@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier
+
+from src.enums import Feature
+from src.model import create_incremental_pipeline, partial_fit_pipeline, predict, preprocess_data
+from src.scorer import compile_pipeline, get_scorer
+
+def _random_features(size: int) -> dict:
+    rng = np.random.default_rng(0)
+    diff_ranking = rng.integers(-300, 300, size).astype(float)
+    diff_ranking[::7] = np.nan # Missing values are imputed
+    diff_elo = rng.normal(0, 200, size)
+    diff_elo[::5] = np.nan
+
+    return {
+        Feature.SERIES.name: rng.choice(['ATP250', 'Grand Slam', 'Masters 1000', 'Unknown series'], size),
+        Feature.SURFACE.name: rng.choice(['Clay', 'Hard', 'Grass', 'Carpet'], size),
+        Feature.COURT.name: rng.choice(['Indoor', 'Outdoor'], size),
+        Feature.ROUND.name: rng.choice(['1st Round', 'The Final', 'Round Robin'], size),
+        Feature.DIFF_RANKING.name: diff_ranking,
+        Feature.DIFF_POINTS.name: rng.integers(-8000, 8000, size),
+        Feature.DIFF_ELO.name: diff_elo,
+        Feature.DIFF_SURFACE_ELO.name: diff_elo + rng.normal(0, 100, size),
+    }
+
+def test_compiled_scorer_parity(fitted_pipeline: Pipeline):
+    """
+    The compiled scorer gives the same probabilities as the scikit-learn pipeline
+    """
+    scorer = compile_pipeline(fitted_pipeline)
+    assert scorer is not None, "Pipeline should be supported"
+
+    features = _random_features(1000)
+    expected = fitted_pipeline.predict_proba(pd.DataFrame(features))
+
+    assert np.abs(scorer.predict_proba(features) - expected).max() < 1e-9, "Probabilities differ"
+    assert (scorer.predict(features) == fitted_pipeline.predict(pd.DataFrame(features))).all(), "Predictions differ"
+
+def test_get_scorer_fallback(random_matches: pd.DataFrame, fitted_pipeline: Pipeline):
+    """
+    Unsupported pipelines are scored by scikit-learn
+    """
+    pipeline = clone(fitted_pipeline).set_params(classifier=DecisionTreeClassifier(random_state=0))
+    X_train, _, y_train, _ = preprocess_data(random_matches)
+    pipeline.fit(X_train, y_train)
+
+    assert get_scorer(pipeline) is None, "Decision trees are not supported"
+
+    result = predict(pipeline, series='ATP250', surface='Clay', court='Indoor', round_stage='1st Round',
+                     rank_player_1=1, rank_player_2=100, points_player_1=4000, points_player_2=500)
+    assert result['result'] in (0, 1), "Prediction should go through the pipeline"
+
+def test_get_scorer_refit(random_matches: pd.DataFrame, fitted_pipeline: Pipeline):
+    """
+    A refitted pipeline is compiled again
+    """
+    pipeline = clone(fitted_pipeline)
+    X_train, _, y_train, _ = preprocess_data(random_matches)
+    pipeline.fit(X_train, y_train)
+    first = get_scorer(pipeline)
+
+    assert get_scorer(pipeline) is first, "Scorer should be cached"
+
+    pipeline.fit(X_train.iloc[:100], y_train.iloc[:100])
+    assert get_scorer(pipeline) is not first, "Scorer should be compiled again after a fit"
+
+def test_compiled_scorer_parity_incremental(random_matches: pd.DataFrame):
+    """
+    Pipelines updated incrementally (SGD logistic regression) are compiled too
+    """
+    X_train, _, y_train, _ = preprocess_data(random_matches)
+    pipeline = partial_fit_pipeline(create_incremental_pipeline(), X_train, y_train)
+    scorer = compile_pipeline(pipeline)
+    assert scorer is not None, "Pipeline should be supported"
+
+    features = _random_features(1000)
+    expected = pipeline.predict_proba(pd.DataFrame(features))
+
+    assert np.abs(scorer.predict_proba(features) - expected).max() < 1e-9, "Probabilities differ"
+
+def test_compiled_scorer_parity_scaler_options(random_matches: pd.DataFrame, fitted_pipeline: Pipeline):
+    """
+    A scaler that does not center or does not scale is compiled as such
+    """
+    X_train, _, y_train, _ = preprocess_data(random_matches)
+    features = _random_features(1000)
+
+    for options in ({'with_mean': False}, {'with_std': False}):
+        params = {f'preprocessor__num__scaler__{name}': value for name, value in options.items()}
+        pipeline = clone(fitted_pipeline).set_params(**params).fit(X_train, y_train)
+        scorer = compile_pipeline(pipeline)
+        assert scorer is not None, f"Pipeline should be supported with {options}"
+
+        expected = pipeline.predict_proba(pd.DataFrame(features))
+        assert np.abs(scorer.predict_proba(features) - expected).max() < 1e-9, f"Probabilities differ with {options}"
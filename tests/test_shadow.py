@@ -0,0 +1,89 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.base import clone
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+
+import src.model as model
+from src.model import create_pipeline, predict_batch, preprocessor_fingerprint, score_models, train_model
+from src.shadow import ShadowEvaluator, parse_models
+
+MATCHES = [
+    dict(series='Grand Slam', surface='Clay', court='Outdoor', round_stage='1st Round',
+         rank_player_1=1, rank_player_2=100, points_player_1=4000, points_player_2=500),
+    dict(series='ATP250', surface='Hard', court='Indoor', round_stage='The Final',
+         rank_player_1=80, rank_player_2=3, points_player_1=700, points_player_2=6000, elo_player_1=1700, elo_player_2=2000),
+]
+
+def _with_classifier(pipeline: Pipeline, classifier) -> Pipeline:
+    """
+    A pipeline sharing the fitted preprocessor of another one
+    """
+    X = pipeline[0].transform(pd.DataFrame(model.match_features(MATCHES * 20)))
+    return Pipeline([('preprocessor', pipeline[0]), ('classifier', classifier.fit(X, [1, 0] * 20))])
+
+def test_score_models_shares_encoding(monkeypatch: pytest.MonkeyPatch, fitted_pipeline: Pipeline, random_matches: pd.DataFrame):
+    """
+    Pipelines with identical preprocessors encode the matches once, and give the same results as alone
+    """
+    other = _with_classifier(fitted_pipeline, SGDClassifier(loss='log_loss', random_state=0))
+    X_train, _, y_train, _ = model.preprocess_data(random_matches)
+    refitted = train_model(create_pipeline(), X_train.iloc[:300], y_train.iloc[:300])
+    pipelines = {'a': fitted_pipeline, 'b': other, 'c': refitted}
+
+    assert preprocessor_fingerprint(fitted_pipeline) == preprocessor_fingerprint(other)
+    assert preprocessor_fingerprint(fitted_pipeline) != preprocessor_fingerprint(refitted)
+
+    transforms = []
+    transform = type(fitted_pipeline[0]).transform
+    monkeypatch.setattr(type(fitted_pipeline[0]), 'transform', lambda self, X: transforms.append(id(self)) or transform(self, X))
+    results = score_models(pipelines, MATCHES)
+
+    assert transforms.count(id(fitted_pipeline[0])) == 1, "The shared preprocessor should encode the matches once"
+    for key, pipeline in pipelines.items():
+        expected = predict_batch(pipeline, MATCHES)
+        assert [r['result'] for r in results[key]['predictions']] == [r['result'] for r in expected]
+        assert np.allclose([r['prob'] for r in results[key]['predictions']], [r['prob'] for r in expected])
+        assert results[key]['seconds'] > 0
+
+def test_shadow_evaluator(fitted_pipeline: Pipeline):
+    """
+    Shadow models are scored in the background, their disagreements with the answered predictions counted
+    """
+    flipped = clone(fitted_pipeline).fit(
+        pd.DataFrame(model.match_features(MATCHES * 20)), [0, 1] * 20) # Learns the opposite outcomes
+    models = {('same', 'latest'): fitted_pipeline, ('flipped', '1'): flipped}
+    def load(name, version):
+        if name == 'missing':
+            raise model.ModelNotFoundError(name)
+        return models[(name, version)]
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    shadow = ShadowEvaluator(parse_models('same, flipped:1, missing'), load, executor=executor)
+    assert shadow.models == [('same', 'latest'), ('flipped', '1'), ('missing', 'latest')]
+
+    for match, prediction in zip(MATCHES, predict_batch(fitted_pipeline, MATCHES)):
+        assert shadow.submit(match, prediction)
+    executor.shutdown(wait=True)
+
+    stats = {m['model']: m for m in shadow.stats()['models']}
+    assert stats['same']['predictions'] == 2 and stats['same']['disagreement_rate'] == 0
+    disagreements = [f['result'] != p['result'] for f, p in zip(predict_batch(flipped, MATCHES), predict_batch(fitted_pipeline, MATCHES))]
+    assert any(disagreements) and stats['flipped']['disagreement_rate'] == np.mean(disagreements)
+    assert stats['missing']['errors'] == 2 and stats['missing']['predictions'] == 0
+    assert stats['same']['mean_seconds'] > 0 and shadow.stats()['pending'] == 0
+
+def test_shadow_evaluator_drops_when_saturated(fitted_pipeline: Pipeline):
+    def slow_load(name, version):
+        time.sleep(0.05)
+        return fitted_pipeline
+
+    shadow = ShadowEvaluator([('slow', 'latest')], slow_load, max_pending=2)
+    submitted = [shadow.submit(MATCHES[0], {'result': 1}) for _ in range(5)]
+    shadow.shutdown(wait=True)
+
+    assert submitted == [True, True, False, False, False], "Matches beyond max_pending should be dropped"
+    assert shadow.stats()['dropped'] == 3
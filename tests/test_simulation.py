@@ -0,0 +1,66 @@
+import time
+import numpy as np
+import pytest
+from sklearn.pipeline import Pipeline
+
+from src.simulation import round_names, win_probabilities, simulate_draw, simulate_tournament, _round_pairings
+
+def _exact_advancement(P: np.ndarray) -> np.ndarray:
+    """
+    Exact probability of each player to win each round, by dynamic programming over the bracket
+    """
+    rounds, size, _ = P.shape
+    reach = np.ones(size)
+    wins = np.zeros((size, rounds))
+    for r in range(rounds):
+        half = 2 ** r
+        for i in range(size):
+            block = i // (2 * half) * 2 * half
+            opponents = np.arange(block, block + half) if i >= block + half else np.arange(block + half, block + 2 * half)
+            wins[i, r] = reach[i] * (reach[opponents] * P[r, i, opponents]).sum()
+        reach = wins[:, r].copy()
+    return wins
+
+def _draw(size: int) -> list:
+    rng = np.random.default_rng(1)
+    ranks = rng.permutation(np.arange(1, 4 * size))[:size]
+    return [{"name": f"Player {rank}", "rank": int(rank), "points": int(20000 / rank)} for rank in ranks]
+
+def test_round_names():
+    assert round_names(7) == ['1st Round', '2nd Round', '3rd Round', '4th Round', 'Quarterfinals', 'Semifinals', 'The Final']
+    assert round_names(2) == ['Semifinals', 'The Final']
+
+def test_round_pairings():
+    """
+    Each pair of players can meet in exactly one round
+    """
+    size = 16
+    pairs = [tuple(sorted(p)) for r in range(4) for p in zip(*_round_pairings(size, r))]
+    assert len(pairs) == len(set(pairs)) == size * (size - 1) // 2
+
+def test_simulation_matches_exact_probabilities(fitted_pipeline: Pipeline):
+    P = win_probabilities(fitted_pipeline, _draw(16), 'Grand Slam', 'Clay', 'Outdoor')
+    assert np.allclose(P + P.transpose(0, 2, 1), 1), "Probabilities of both players should sum to 1"
+
+    simulated = simulate_draw(P, simulations=100_000, seed=0)
+
+    assert np.abs(simulated - _exact_advancement(P)).max() < 0.01
+    assert np.allclose(simulated.sum(axis=0), [8, 4, 2, 1]), "Each round has a winner per match"
+
+def test_byes(fitted_pipeline: Pipeline):
+    players = _draw(8)
+    players[1] = players[6] = None
+
+    results = simulate_tournament(fitted_pipeline, players, 'ATP250', 'Hard', 'Indoor', simulations=1000, seed=0)
+
+    assert len(results) == 6, "Byes are left out"
+    assert results[0]["rounds"]["Quarterfinals"] == 1.0, "A player always beats a bye"
+    assert sum(r["rounds"]["The Final"] for r in results) == pytest.approx(1.0)
+
+def test_large_draw_is_interactive(fitted_pipeline: Pipeline):
+    start = time.perf_counter()
+    results = simulate_tournament(fitted_pipeline, _draw(128), 'Grand Slam', 'Grass', 'Outdoor', simulations=100_000, seed=0)
+    elapsed = time.perf_counter() - start
+
+    assert len(results) == 128
+    assert elapsed < 2, f"128 players x 100k simulations took {elapsed:.2f}s"
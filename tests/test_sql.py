@@ -0,0 +1,208 @@
+import threading
+import psycopg2
+import psycopg2.pool
+import pytest
+
+import src.sql as sql
+from src.sql import ConnectionPool
+
+class FakeCursor:
+    def __init__(self, conn: 'FakeConnection'):
+        self.conn = conn
+        self.description = None
+
+    def execute(self, query, vars=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.queries.append((query, vars))
+
+    def fetchall(self):
+        return []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def connections():
+    return []
+
+@pytest.fixture
+def pool(connections):
+    def connect():
+        conn = FakeConnection()
+        connections.append(conn)
+        return conn
+    return ConnectionPool(connect, minconn=1, maxconn=2, timeout=0.1)
+
+def test_pool_reuses_connections(pool: ConnectionPool, connections: list):
+    for _ in range(5):
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 2")
+
+    assert len(connections) == 1, "The connection should be reused"
+    assert connections[0].commits == 5, "Each block should commit"
+
+    stats = pool.stats()
+    assert stats['checkouts'] == 5 and stats['size'] == 1 and stats['in_use'] == 0
+
+def test_pool_timeout(pool: ConnectionPool):
+    with pool.connection(), pool.connection():
+        with pytest.raises(psycopg2.pool.PoolError):
+            with pool.connection():
+                pass
+
+    assert pool.stats()['timeouts'] == 1
+
+def test_pool_waits_for_connection(pool: ConnectionPool):
+    pool.timeout = 2
+    conn = pool.getconn()
+    other = pool.getconn()
+    threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+
+    assert pool.getconn() is conn, "The released connection should be handed over"
+    pool.putconn(other)
+
+def test_pool_replaces_broken_connections(pool: ConnectionPool, connections: list):
+    with pool.connection():
+        pass
+    connections[0].broken = True
+
+    with pool.connection() as conn:
+        assert conn is not connections[0], "A broken connection should be replaced"
+
+    assert connections[0].closed, "The broken connection should be closed"
+    assert pool.stats()['validation_failures'] == 1
+
+def test_pool_discards_connection_after_failure(pool: ConnectionPool, connections: list):
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            conn.broken = True
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+    assert connections[0].closed and pool.stats()['size'] == 0, "The connection should be discarded"
+
+def test_get_connection_uses_pool(monkeypatch: pytest.MonkeyPatch, connections: list):
+    def connect(**kwargs):
+        conn = FakeConnection()
+        connections.append(conn)
+        return conn
+    monkeypatch.setattr(psycopg2, 'connect', connect)
+    monkeypatch.setattr(sql, '_pool', None)
+
+    for _ in range(3):
+        sql.list_tournaments('atp')
+
+    assert len(connections) == 1, "All the queries should share the pooled connection"
+    assert sql.pool_stats()['checkouts'] == 3
+    query, _ = connections[0].queries[-1]
+    assert query.strip().endswith("ORDER BY name, series, court, surface;"), "Tournaments should come in a stable order, hashed in their ETag"
+
+def test_iter_matches_from_postgres(monkeypatch: pytest.MonkeyPatch):
+    """
+    Matches are read through a named (server-side) cursor, chunk by chunk, with the projected columns only
+    """
+    rows = [('2024-01-01', 'ATP250', 'Clay', 'Indoor', '1st Round', 'Sinner J.', 'Alcaraz C.', i, i + 1, 100, 90) for i in range(5)]
+    cursors = []
+
+    class ServerSideCursor(FakeCursor):
+        def __init__(self, conn, name):
+            super().__init__(conn)
+            self.name = name
+            self.rows = list(rows)
+            self.description = [(c,) for c in sql.MATCH_COLUMNS]
+            cursors.append(self)
+
+        def fetchmany(self, size):
+            chunk, self.rows = self.rows[:size], self.rows[size:]
+            return chunk
+
+    class Connection(FakeConnection):
+        def cursor(self, name=None):
+            return ServerSideCursor(self, name)
+
+    monkeypatch.setattr(sql, '_pool', ConnectionPool(Connection, minconn=0))
+    monkeypatch.setattr(sql, '_pool_pid', sql.os.getpid())
+
+    chunks = list(sql.iter_matches_from_postgres('atp_data', '2024-01-01', '2024-12-31', chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1], "Wrong chunk sizes"
+    assert list(chunks[0].columns) == sql.MATCH_COLUMNS
+    assert cursors[-1].name, "The cursor should be a named (server-side) cursor"
+    query, _ = cursors[-1].conn.queries[-1]
+    assert query.startswith(f"SELECT {', '.join(sql.MATCH_COLUMNS)} FROM atp_data"), "Columns should be projected"
+    assert query.endswith("ORDER BY date, tournament, round, winner, loser"), "Matches should come in chronological, stable order"
+
+def test_load_matches_from_postgres_is_ordered(monkeypatch: pytest.MonkeyPatch, connections: list):
+    """
+    The whole loads come in the same stable order as the chunked ones, the Elo ratings depending on it
+    """
+    class Cursor(FakeCursor):
+        def __init__(self, conn):
+            super().__init__(conn)
+            self.description = [(c,) for c in sql.MATCH_COLUMNS]
+
+    class Connection(FakeConnection):
+        def cursor(self, name=None):
+            return Cursor(self)
+
+    def connect(**kwargs):
+        conn = Connection()
+        connections.append(conn)
+        return conn
+    monkeypatch.setattr(psycopg2, 'connect', connect)
+    monkeypatch.setattr(sql, '_pool', None)
+
+    sql.load_matches_from_postgres('atp_data', '2024-01-01', '2024-12-31', use_cache=False)
+
+    query, vars = connections[-1].queries[-1]
+    assert query.endswith(f"ORDER BY {', '.join(sql.MATCH_KEY)}") and vars == ['2024-01-01', '2024-12-31']
+
+def test_tournament_index(monkeypatch: pytest.MonkeyPatch):
+    """
+    Tournaments are queried once, then served from the cache until invalidated
+    """
+    calls = []
+    tournaments = [
+        {'name': 'Roland Garros', 'series': 'Grand Slam', 'court': 'Outdoor', 'surface': 'Clay'},
+        {'name': 'Wimbledon', 'series': 'Grand Slam', 'court': 'Outdoor', 'surface': 'Grass'},
+        {'name': 'Lyon', 'series': 'ATP250', 'court': 'Outdoor', 'surface': 'Clay'},
+    ]
+    monkeypatch.setattr(sql, 'list_tournaments', lambda circuit: calls.append(circuit) or tournaments)
+    sql.invalidate_tournaments_cache()
+
+    assert sql.get_tournament_index('atp', cached_only=True) is None, "Nothing should be cached yet"
+    index = sql.get_tournament_index('atp')
+    assert sql.get_tournament_index('atp') is index and calls == ['atp'], "The database should be queried once"
+
+    assert [t['name'] for t in index.filter(surface='Clay')] == ['Roland Garros', 'Lyon']
+    assert [t['name'] for t in index.filter(surface='Clay', series='Grand Slam')] == ['Roland Garros']
+    assert index.get_etag() != index.get_etag(surface='Clay'), "Filtered lists should have their own ETag"
+
+    sql.invalidate_tournaments_cache('atp')
+    sql.get_tournament_index('atp')
+    assert calls == ['atp', 'atp'], "The database should be queried again after invalidation"
@@ -0,0 +1,50 @@
+import pandas as pd
+
+import src.model as model
+from src.ingest import TABLE_COLUMNS
+from benchmarks.synthetic import generate_matches
+from benchmarks.bench_suite import _stub_postgres, compare
+
+def test_generate_matches_is_seeded():
+    """
+    The same seed gives the same matches, in chronological order with the columns of the tables
+    """
+    matches = generate_matches(3000, players=200, seed=1)
+
+    pd.testing.assert_frame_equal(matches, generate_matches(3000, players=200, seed=1))
+    assert not matches.equals(generate_matches(3000, players=200, seed=2))
+    assert list(matches.columns) == list(TABLE_COLUMNS)
+    assert matches['date'].is_monotonic_increasing
+    assert (matches['winner'] != matches['loser']).all()
+    assert (matches.loc[matches['series'] == 'Grand Slam', 'w_sets'] == 3).all(), "Grand Slams are best of 5"
+    assert (matches[['w1', 'l1', 'w2', 'l2']].notna()).all().all(), "At least two sets are played"
+
+def test_better_ranked_players_win_more():
+    """
+    The ranks carry the signal the models learn
+    """
+    matches = generate_matches(20000, seed=0)
+    ranked = matches.dropna(subset=['l_rank'])
+
+    assert (ranked['w_rank'] < ranked['l_rank']).mean() > 0.6
+
+def test_load_pairwise_data_on_stubbed_postgres():
+    """
+    The benchmarks load the generated matches as from the database, in both loading modes
+    """
+    matches = generate_matches(2000, players=100, seed=0, from_date='2020-01-01', to_date='2020-12-31')
+
+    with _stub_postgres(matches):
+        whole = model.load_pairwise_data('atp', '2020-07-01', '2020-12-31', chunk_size=0)
+        chunked = model.load_pairwise_data('atp', '2020-07-01', '2020-12-31', chunk_size=300)
+
+    assert len(whole) == 2 * (matches['date'] >= pd.Timestamp('2020-07-01')).sum()
+    pd.testing.assert_frame_equal(whole, chunked)
+    assert whole['diffElo'].abs().gt(0).any(), "The matches before the first date warm the ratings up"
+
+def test_compare_with_baseline():
+    ratios = compare(
+        {"fit": {"seconds": 3.0}, "predict": {"throughput_per_second": 500.0}, "new": {"seconds": 1.0}},
+        {"fit": {"seconds": 2.0}, "predict": {"throughput_per_second": 1000.0}})
+
+    assert ratios == {"fit": 1.5, "predict": 2.0}, "Above 1 when slower, new benchmarks skipped"